@@ -0,0 +1,254 @@
+"""A simulated fleet of BACnet devices for benchmarking the module without a Lutron system.
+
+The fleet looks like a Lutron gateway: one BACnet/IP router (which is also
+a BBMD) on loopback, with every virtual device on a routed network behind
+it. Loopback has no usable broadcast, so clients register with the router
+as foreign devices to discover the fleet, e.g.
+`BAC0.start(ip="127.0.0.1/8:47808", bbmdAddress="127.0.0.1:47809", bbmdTTL=900)`.
+
+Latency and loss are applied to every packet on the routed network, so a
+confirmed request sees the latency twice (request and response).
+
+Run it on its own to benchmark or poke at it with other tools:
+
+    python bench/fleet.py --devices 20 --latency 0.01 --loss 0.01
+"""
+
+import argparse
+import asyncio
+import random
+from typing import Dict, List, Optional
+
+from bacpypes3.app import Application
+from bacpypes3.appservice import ApplicationServiceAccessPoint
+from bacpypes3.comm import bind
+from bacpypes3.ipv4.link import BBMDLinkLayer
+from bacpypes3.local.analog import AnalogValueObjectCmd
+from bacpypes3.local.binary import BinaryValueObjectCmd
+from bacpypes3.local.device import DeviceObject
+from bacpypes3.local.multistate import MultiStateValueObject
+from bacpypes3.netservice import NetworkServiceAccessPoint, NetworkServiceElement
+from bacpypes3.pdu import IPv4Address, LocalStation, PDU
+from bacpypes3.vlan import Network, VirtualNetwork, VirtualNode
+
+DEFAULT_ROUTER_ADDRESS = "127.0.0.1/8:47809"
+DEFAULT_NETWORK = 1
+DEFAULT_IP_NETWORK = 100
+DEVICE_INSTANCE_BASE = 1000
+LUTRON_VENDOR_ID = 176
+
+# Object names cycle through these so discovery produces switches as well as sensors
+ANALOG_NAMES = [
+    "Lighting Level",
+    "Daylighting Level",
+    "Occupied Level",
+    "Unoccupied Level",
+    "Power",
+]
+BINARY_NAMES = ["Lighting State", "Daylighting Enabled", "Occupancy Sensor"]
+MULTI_STATE_NAMES = ["Occupancy State", "Scene"]
+MULTI_STATE_TEXT = ["Unknown", "Occupied", "Unoccupied"]
+
+
+class SimulatedNetwork(VirtualNetwork):
+    """A virtual network that delays, drops and counts the packets crossing it."""
+
+    def __init__(self, name: str, latency: float, jitter: float, loss: float):
+        super().__init__(name)
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.router_address: Optional[LocalStation] = None
+        self.stats = {"requests": 0, "responses": 0, "dropped": 0}
+
+    async def process_pdu(self, pdu: PDU) -> None:
+        if pdu.pduSource == self.router_address:
+            self.stats["requests"] += 1
+        else:
+            self.stats["responses"] += 1
+        if self.loss and random.random() < self.loss:
+            self.stats["dropped"] += 1
+            return
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        await Network.process_pdu(self, pdu)
+
+
+class VirtualDevice(Application):
+    """A device application bound to a node on a virtual network."""
+
+    def __init__(self, device_object: DeviceObject, mac: int, network_name: str):
+        Application.__init__(self)
+        self.asap = ApplicationServiceAccessPoint(device_object, self.device_info_cache)
+        self.nsap = NetworkServiceAccessPoint()
+        self.nse = NetworkServiceElement()
+        bind(self.nse, self.nsap)
+        bind(self, self.asap, self.nsap)
+
+        address = LocalStation(bytes([mac]))
+        self.node = VirtualNode(address, network_name)
+        self.nsap.bind(self.node, address=address)
+        self.add_object(device_object)
+
+    def close(self) -> None:
+        self.node.lan.remove_node(self.node)
+
+
+class SimulatedFleet:
+    """A router on loopback and `devices` virtual devices on the network behind it."""
+
+    def __init__(
+        self,
+        devices: int,
+        analog_objects: int = 10,
+        binary_objects: int = 4,
+        multi_state_objects: int = 2,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        loss: float = 0.0,
+        router_address: str = DEFAULT_ROUTER_ADDRESS,
+        network: int = DEFAULT_NETWORK,
+    ):
+        if not 0 < devices < 255:
+            raise ValueError("a simulated network holds between 1 and 254 devices")
+        self.device_count = devices
+        self.analog_objects = analog_objects
+        self.binary_objects = binary_objects
+        self.multi_state_objects = multi_state_objects
+        self.router_address = router_address
+        self.network_number = network
+        self.network = SimulatedNetwork(
+            f"bench-{network}-{id(self)}", latency, jitter, loss
+        )
+        self.devices: List[VirtualDevice] = []
+        self._link: Optional[BBMDLinkLayer] = None
+
+    @property
+    def network_name(self) -> str:
+        return self.network.name
+
+    def start(self) -> None:
+        """Bind the router and create the devices; call from inside the event loop."""
+        nsap = NetworkServiceAccessPoint()
+        nse = NetworkServiceElement()
+        bind(nse, nsap)
+
+        local_address = IPv4Address(self.router_address)
+        self._link = BBMDLinkLayer(local_address)
+        nsap.bind(self._link, net=DEFAULT_IP_NETWORK, address=local_address)
+
+        router_station = LocalStation(b"\x00")
+        self.network.router_address = router_station
+        router_node = VirtualNode(router_station, self.network_name)
+        nsap.bind(router_node, net=self.network_number, address=router_station)
+
+        for index in range(self.device_count):
+            self.devices.append(self._make_device(index + 1))
+
+    def _make_device(self, mac: int) -> VirtualDevice:
+        instance = DEVICE_INSTANCE_BASE + mac
+        device_object = DeviceObject(
+            objectIdentifier=("device", instance),
+            objectName=f"Area {mac}",
+            vendorIdentifier=LUTRON_VENDOR_ID,
+            vendorName="Lutron Electronics Co., Inc.",
+            maxApduLengthAccepted=1476,
+            segmentationSupported="segmented-both",
+            databaseRevision=1,
+        )
+        app = VirtualDevice(device_object, mac, self.network_name)
+        for index in range(self.analog_objects):
+            app.add_object(
+                AnalogValueObjectCmd(
+                    objectIdentifier=("analog-value", index + 1),
+                    objectName=ANALOG_NAMES[index % len(ANALOG_NAMES)]
+                    + ("" if index < len(ANALOG_NAMES) else f" {index + 1}"),
+                    presentValue=float(random.randint(0, 100)),
+                    units="percent",
+                    covIncrement=1.0,
+                )
+            )
+        for index in range(self.binary_objects):
+            app.add_object(
+                BinaryValueObjectCmd(
+                    objectIdentifier=("binary-value", index + 1),
+                    objectName=BINARY_NAMES[index % len(BINARY_NAMES)]
+                    + ("" if index < len(BINARY_NAMES) else f" {index + 1}"),
+                    presentValue="inactive",
+                )
+            )
+        for index in range(self.multi_state_objects):
+            app.add_object(
+                MultiStateValueObject(
+                    objectIdentifier=("multi-state-value", index + 1),
+                    objectName=MULTI_STATE_NAMES[index % len(MULTI_STATE_NAMES)]
+                    + ("" if index < len(MULTI_STATE_NAMES) else f" {index + 1}"),
+                    presentValue=1,
+                    numberOfStates=len(MULTI_STATE_TEXT),
+                    stateText=MULTI_STATE_TEXT,
+                )
+            )
+        device_object.objectList = list(app.objectIdentifier)
+        return app
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self.network.stats)
+
+    def reset_stats(self) -> None:
+        for key in self.network.stats:
+            self.network.stats[key] = 0
+
+    def close(self) -> None:
+        for device in self.devices:
+            device.close()
+        self.devices = []
+        if self._link is not None:
+            self._link.close()
+            self._link = None
+
+
+async def main(args: argparse.Namespace) -> None:
+    fleet = SimulatedFleet(
+        args.devices,
+        analog_objects=args.analog,
+        binary_objects=args.binary,
+        multi_state_objects=args.multi_state,
+        latency=args.latency,
+        jitter=args.jitter,
+        loss=args.loss,
+        router_address=args.address,
+        network=args.network,
+    )
+    fleet.start()
+    print(
+        f"{args.devices} devices on network {args.network} behind {args.address}; "
+        "register as a foreign device to discover them"
+    )
+    try:
+        while True:
+            await asyncio.sleep(10)
+            print(fleet.stats())
+    finally:
+        fleet.close()
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=10)
+    parser.add_argument("--analog", type=int, default=10)
+    parser.add_argument("--binary", type=int, default=4)
+    parser.add_argument("--multi-state", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per packet")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random seconds per packet")
+    parser.add_argument("--loss", type=float, default=0.0, help="fraction of packets dropped")
+    parser.add_argument("--address", default=DEFAULT_ROUTER_ADDRESS)
+    parser.add_argument("--network", type=int, default=DEFAULT_NETWORK)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main(parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,150 @@
+"""Microbenchmarks of the CPU spent preparing each read and write, before and after request plans.
+
+The "before" cases repeat the per-call work the module used to do: format a
+request string for BAC0 to split and parse, or build a fresh Address,
+ObjectIdentifier and PropertyIdentifier, and find objects by scanning the
+configured list. The "after" cases do what the controller does on each call
+now: find objects in a compiled DevicePlan and look up the Address,
+ObjectIdentifier and PropertyIdentifier in the shared parse caches. No
+network is involved:
+
+    python bench/micro.py --objects 16
+"""
+
+import argparse
+import os
+import sys
+import timeit
+from time import process_time
+from typing import Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from BAC0.scripts.Lite import Lite  # noqa: E402
+from bacpypes3.basetypes import PropertyIdentifier  # noqa: E402
+from bacpypes3.pdu import Address  # noqa: E402
+from bacpypes3.primitivedata import ObjectIdentifier  # noqa: E402
+
+from plan import (  # noqa: E402
+    DevicePlan,
+    cached_address,
+    cached_object_identifier,
+    cached_property_identifier,
+)
+
+ADDRESS = "1:0x00000035b9f6"
+OBJECT_TYPES = ["analog-value", "binary-value", "multi-state-value"]
+DEFAULT_OBJECTS = 16
+DEFAULT_REPEAT = 5
+
+
+class _Logless:
+    """Enough of a BAC0 client for its request builder, which only logs."""
+
+    def log(self, *args, **kwargs) -> None:
+        pass
+
+
+def make_objects(count: int) -> List[Dict[str, str]]:
+    return [
+        {
+            "address": str(index + 1),
+            "name": f"Object {index + 1}",
+            "type": OBJECT_TYPES[index % len(OBJECT_TYPES)],
+        }
+        for index in range(count)
+    ]
+
+
+def find_by_scan(objects: List[Dict[str, str]], name: str) -> Dict[str, str]:
+    return [obj for obj in objects if obj.get("name") == name].pop()
+
+
+def cases(object_count: int) -> List[Tuple[str, Callable[[], object], Callable[[], object]]]:
+    objects = make_objects(object_count)
+    plan = DevicePlan(ADDRESS, objects)
+    last = objects[-1]
+    key = (last["type"], last["address"])
+    client = _Logless()
+
+    def read_before():
+        request = f"{ADDRESS} {key[0]} {key[1]} presentValue"
+        return Lite.build_rp_request(client, request.split())
+
+    def read_after():
+        # As BacnetController.read_property, which takes the object type and instance
+        return (
+            cached_address(ADDRESS),
+            cached_object_identifier((str(key[0]), str(key[1]))),
+            cached_property_identifier("presentValue"),
+        )
+
+    def write_before():
+        return (Address(ADDRESS), ObjectIdentifier(key), PropertyIdentifier("presentValue"))
+
+    def write_after():
+        return (
+            cached_address(ADDRESS),
+            cached_object_identifier(key),
+            cached_property_identifier("presentValue"),
+        )
+
+    def lookup_before():
+        return find_by_scan(objects, last["name"])
+
+    def lookup_after():
+        return plan.find({"name": last["name"]})
+
+    def rpm_before():
+        return [
+            item
+            for obj in objects
+            for item in (
+                ObjectIdentifier((obj["type"], obj["address"])),
+                [PropertyIdentifier("presentValue")],
+            )
+        ]
+
+    def rpm_after():
+        return [
+            item
+            for obj in plan.objects
+            for item in (
+                cached_object_identifier(obj.key),
+                [cached_property_identifier("presentValue")],
+            )
+        ]
+
+    return [
+        ("read request", read_before, read_after),
+        ("write request", write_before, write_after),
+        (f"find object (of {object_count})", lookup_before, lookup_after),
+        (f"RPM parameters ({object_count} objects)", rpm_before, rpm_after),
+    ]
+
+
+def per_call(function: Callable[[], object], repeat: int) -> float:
+    """Best-of-`repeat` CPU seconds per call."""
+    timer = timeit.Timer(function, timer=process_time)
+    number, _elapsed = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--objects", type=int, default=DEFAULT_OBJECTS)
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    args = parser.parse_args(argv)
+
+    print(f"{'case':<32} {'before (us)':>12} {'after (us)':>12} {'speedup':>8}")
+    for name, before, after in cases(args.objects):
+        before_time = per_call(before, args.repeat)
+        after_time = per_call(after, args.repeat)
+        print(
+            f"{name:<32} {before_time * 1e6:>12.2f} {after_time * 1e6:>12.2f} "
+            f"{before_time / after_time:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""Plays a recorded BACnet trace back as a fake network, to measure the module against real-world traffic offline.
+
+Record a trace on site with the discovery service's `trace_file` attribute
+or `start_recording` command. The replay binds a socket for each peer in the
+trace (or the address it is mapped to) and answers every request the client
+sends with the responses recorded for the same request, after the recorded
+delay times `--scale`. Repeats of a request get the recorded answers in
+order, and the last one again once they run out; requests that were never
+recorded go unanswered, like a device that doesn't respond.
+
+Responses are matched to requests by invoke ID. Everything else the client
+received, like I-Am replies and change-of-value notifications, is replayed
+after the last client packet that preceded it in the recording. Clients
+register with the replay as a foreign device, the same as with fleet.py, so
+a site recorded through a BBMD or router at 10.0.20.1 replays on loopback
+with:
+
+    python bench/replay.py site-trace.json.gz --map 10.0.20.1=127.0.0.1:47809 --scale 0.5
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+from collections import deque
+from typing import Deque, Dict, List, Mapping, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from recording import (  # noqa: E402
+    BROADCAST_PEER,
+    CONFIRMED_REQUEST,
+    RECEIVED,
+    SEGMENT_ACK,
+    SENT,
+    Packet,
+    apdu_type,
+    invoke_id_offset,
+    is_broadcast,
+    is_response,
+    npdu_stations,
+    read_trace,
+    request_key,
+    with_invoke_id,
+)
+
+DEFAULT_BACNET_PORT = 47808
+BVLL_REGISTER_FOREIGN_DEVICE = 0x05
+BVLL_RESULT_OK = bytes([0x81, 0x00, 0x00, 0x06, 0x00, 0x00])
+
+# A recorded response: seconds after its request, the peer it came from and its bytes
+Response = Tuple[float, str, bytes]
+
+
+def parse_address(address: str) -> Tuple[str, int]:
+    host, _sep, port = address.partition(":")
+    return host, int(port) if port else DEFAULT_BACNET_PORT
+
+
+def pair_exchanges(packets: List[Packet]) -> Dict[Tuple[str, bytes], Deque[List[Response]]]:
+    """Each request the client sent, by peer and request key, with the responses recorded for each time it was sent."""
+    exchanges: Dict[Tuple[str, bytes], Deque[List[Response]]] = {}
+    by_invoke_id: Dict[Tuple[str, bytes, int], Tuple[float, List[Response]]] = {}
+    last_other: Optional[Tuple[float, List[Response]]] = None
+    for at, direction, peer, data in packets:
+        position = invoke_id_offset(data)
+        if direction == SENT:
+            responses: List[Response] = []
+            exchanges.setdefault((peer, request_key(data)), deque()).append(responses)
+            if position is not None and apdu_type(data) in (CONFIRMED_REQUEST, SEGMENT_ACK):
+                destination, _source = npdu_stations(data)
+                by_invoke_id[(peer, destination, data[position])] = (at, responses)
+            else:
+                last_other = (at, responses)
+        elif direction == RECEIVED:
+            if position is not None and is_response(data):
+                _destination, source = npdu_stations(data)
+                request = by_invoke_id.get((peer, source, data[position]))
+            else:
+                request = last_other
+            if request is not None:
+                sent_at, responses = request
+                responses.append((at - sent_at, peer, data))
+    return exchanges
+
+
+class _PeerProtocol(asyncio.DatagramProtocol):
+    def __init__(self, replay: "TraceReplay", peer: str):
+        self.replay = replay
+        self.peer = peer
+        self.transport: Optional[asyncio.DatagramTransport] = None
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        self.replay.received(self, data, addr)
+
+
+class TraceReplay:
+    """A recorded trace answering a live client from the sockets of the peers it recorded."""
+
+    def __init__(
+        self,
+        packets: List[Packet],
+        scale: float = 1.0,
+        peers: Optional[Mapping[str, str]] = None,
+    ):
+        self.scale = scale
+        self.exchanges = pair_exchanges(packets)
+        recorded = {peer for _at, _direction, peer, _data in packets if peer != BROADCAST_PEER}
+        self.peers = {peer: dict(peers or {}).get(peer, peer) for peer in recorded}
+        for peer, address in dict(peers or {}).items():
+            self.peers.setdefault(peer, address)
+        self.stats = {"requests": 0, "unmatched": 0, "responses": 0}
+        self._protocols: Dict[str, _PeerProtocol] = {}
+
+    @classmethod
+    def from_file(
+        cls, path: str, scale: float = 1.0, peers: Optional[Mapping[str, str]] = None
+    ) -> "TraceReplay":
+        _header, packets = read_trace(path)
+        return cls(packets, scale, peers)
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        for peer, address in self.peers.items():
+            try:
+                _transport, protocol = await loop.create_datagram_endpoint(
+                    lambda peer=peer: _PeerProtocol(self, peer),
+                    local_addr=parse_address(address),
+                )
+            except OSError as err:
+                print(f"Replaying {peer}'s packets from other peers: unable to bind {address} ({err})")
+                continue
+            self._protocols[peer] = protocol
+
+    def received(self, protocol: _PeerProtocol, data: bytes, addr) -> None:
+        if len(data) > 1 and data[1] == BVLL_REGISTER_FOREIGN_DEVICE:
+            protocol.transport.sendto(BVLL_RESULT_OK, addr)
+            return
+        self.stats["requests"] += 1
+        peer = BROADCAST_PEER if is_broadcast(data) else protocol.peer
+        recorded = self.exchanges.get((peer, request_key(data)))
+        if not recorded:
+            self.stats["unmatched"] += 1
+            return
+        responses = recorded.popleft() if len(recorded) > 1 else recorded[0]
+        position = invoke_id_offset(data)
+        invoke_id = data[position] if position is not None else None
+        loop = asyncio.get_running_loop()
+        for delay, from_peer, response in responses:
+            if is_response(response):
+                response = with_invoke_id(response, invoke_id)
+            sender = self._protocols.get(from_peer, protocol)
+            loop.call_later(delay * self.scale, self._send, sender, response, addr)
+
+    def _send(self, protocol: _PeerProtocol, data: bytes, addr) -> None:
+        if protocol.transport is not None and not protocol.transport.is_closing():
+            protocol.transport.sendto(data, addr)
+            self.stats["responses"] += 1
+
+    def reset_stats(self) -> None:
+        for key in self.stats:
+            self.stats[key] = 0
+
+    def close(self) -> None:
+        for protocol in self._protocols.values():
+            if protocol.transport is not None:
+                protocol.transport.close()
+        self._protocols = {}
+
+
+async def main(args: argparse.Namespace) -> None:
+    peers = dict(mapping.split("=", 1) for mapping in args.map)
+    replay = TraceReplay.from_file(args.trace, args.scale, peers)
+    await replay.start()
+    print(
+        f"Replaying {sum(len(responses) for responses in replay.exchanges.values())} requests "
+        f"from {', '.join(sorted(replay.peers.values()))}; register as a foreign device to use them"
+    )
+    try:
+        while True:
+            await asyncio.sleep(10)
+            print(replay.stats)
+    finally:
+        replay.close()
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("trace")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies every recorded delay")
+    parser.add_argument(
+        "--map",
+        action="append",
+        default=[],
+        metavar="RECORDED=LOCAL",
+        help="answer for a recorded peer from another address",
+    )
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main(parse_args()))
+    except KeyboardInterrupt:
+        pass
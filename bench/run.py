@@ -0,0 +1,276 @@
+"""Benchmark discovery, readings and writes against a simulated fleet.
+
+Each device count runs in its own process so the controller singleton and
+its sockets start fresh:
+
+    python bench/run.py --devices 1,10,50 --output bench.json
+
+Pass `--baseline` with the output of an earlier run to fail (exit status 1)
+when any timing regresses by more than `--tolerance`, or any packet count
+grows. Timings depend on the machine, so CI compares against the committed
+bench/baseline.json with `--counts-only`.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from time import perf_counter
+from typing import Dict, List, Optional, Sequence
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from fleet import DEFAULT_ROUTER_ADDRESS, SimulatedFleet  # noqa: E402
+
+DEFAULT_CLIENT_ADDRESS = "127.0.0.1/8:47808"
+DEFAULT_DEVICE_COUNTS = "1,10,50"
+DEFAULT_SAMPLES = 200
+DEFAULT_TOLERANCE = 0.25
+# How long the client waits after registering with the router before discovery
+REGISTRATION_DELAY = 1.0
+
+# Metrics compared against a baseline, and whether they are timings or counts
+TIMING_METRICS = [
+    "startup_seconds",
+    "first_reading_seconds",
+    "discovery_seconds",
+    "warm_discovery_seconds",
+    "readings_p50_ms",
+    "readings_p99_ms",
+    "set_position_p50_ms",
+    "set_position_p99_ms",
+]
+COUNT_METRICS = [
+    "discovery_packets",
+    "warm_discovery_packets",
+    "readings_packets",
+    "set_position_packets",
+]
+
+
+def percentile(samples: Sequence[float], fraction: float) -> float:
+    """The nearest-rank percentile of `samples`."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+def start_client(client_address: str, router_address: str) -> None:
+    """Make the controller's BAC0 client register with the fleet's router as a foreign device."""
+    import BAC0
+
+    BAC0.log_level("silence")
+    router_ip = router_address.split("/")[0] + ":" + router_address.rsplit(":", 1)[1]
+    # The build bundles BAC0's device.json next to the module; use it in place when running from source
+    bundled_json = os.path.join(os.path.dirname(BAC0.__file__), "core", "app", "device.json")
+    start = BAC0.start
+
+    def start_on_loopback(**kwargs):
+        if not os.path.exists(kwargs.get("json_file") or ""):
+            kwargs["json_file"] = bundled_json
+        return start(ip=client_address, bbmdAddress=router_ip, bbmdTTL=900, **kwargs)
+
+    BAC0.start = start_on_loopback
+
+
+async def run_step(args: argparse.Namespace) -> Dict:
+    from viam.proto.app.robot import ComponentConfig
+    from viam.utils import dict_to_struct
+
+    from controller import BacnetController
+    from discovery import DiscoverDevices
+    from sensor import BacnetSensor
+    from switch import BacnetSwitch
+
+    fleet = SimulatedFleet(
+        args.step,
+        analog_objects=args.analog,
+        binary_objects=args.binary,
+        multi_state_objects=args.multi_state,
+        latency=args.latency,
+        jitter=args.jitter,
+        loss=args.loss,
+        router_address=args.router,
+    )
+    fleet.start()
+    start_client(args.client, args.router)
+    result: Dict = {"devices": args.step}
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # Module startup: creating a resource, then the stack coming up behind it
+        started = perf_counter()
+        discovery = DiscoverDevices.new(
+            ComponentConfig(
+                name="discovery",
+                attributes=dict_to_struct({
+                    "discovery_cache_file": os.path.join(cache_dir, "cache.json"),
+                }),
+            ),
+            {},
+        )
+        await discovery.bacnet.ready()
+        result["startup_seconds"] = perf_counter() - started
+        await asyncio.sleep(REGISTRATION_DELAY)
+
+        fleet.reset_stats()
+        started = perf_counter()
+        configs = await discovery.discover_resources(extra={"full_rescan": True})
+        result["discovery_seconds"] = perf_counter() - started
+        result["discovery_packets"] = sum(fleet.stats().values())
+        result["components"] = len(configs)
+
+        fleet.reset_stats()
+        started = perf_counter()
+        await discovery.discover_resources()
+        result["warm_discovery_seconds"] = perf_counter() - started
+        result["warm_discovery_packets"] = sum(fleet.stats().values())
+        await discovery.close()
+
+    # Time to first reading from a cold stack, as when the module starts with components configured
+    await BacnetController.shutdown()
+    started = perf_counter()
+    sensors = [
+        BacnetSensor.new(config, {})
+        for config in configs
+        if config.model.endswith(":lutron-sensor")
+    ]
+    switches = [
+        BacnetSwitch.new(config, {})
+        for config in configs
+        if config.model.endswith(":lutron-switch")
+    ]
+    if sensors:
+        await sensors[0].get_readings()
+        result["first_reading_seconds"] = perf_counter() - started
+
+    readings: List[float] = []
+    fleet.reset_stats()
+    for index in range(args.samples if sensors else 0):
+        started = perf_counter()
+        await sensors[index % len(sensors)].get_readings(extra={"fresh": True})
+        readings.append(perf_counter() - started)
+    result["readings_packets"] = sum(fleet.stats().values())
+    result["readings_p50_ms"] = percentile(readings, 0.5) * 1000
+    result["readings_p99_ms"] = percentile(readings, 0.99) * 1000
+
+    writes: List[float] = []
+    fleet.reset_stats()
+    for index in range(args.samples if switches else 0):
+        started = perf_counter()
+        await switches[index % len(switches)].set_position(index // len(switches) % 2)
+        writes.append(perf_counter() - started)
+    result["set_position_packets"] = sum(fleet.stats().values())
+    result["set_position_p50_ms"] = percentile(writes, 0.5) * 1000
+    result["set_position_p99_ms"] = percentile(writes, 0.99) * 1000
+
+    for resource in [*sensors, *switches]:
+        await resource.close()
+    await BacnetController.shutdown()
+    fleet.close()
+    return result
+
+
+def run_counts(args: argparse.Namespace) -> List[Dict]:
+    results = []
+    for count in [int(count) for count in args.devices.split(",")]:
+        command = [sys.executable, os.path.abspath(__file__), "--step", str(count)]
+        for option in ("analog", "binary", "multi_state", "latency", "jitter", "loss", "samples", "client", "router"):
+            command += [f"--{option.replace('_', '-')}", str(getattr(args, option))]
+        completed = subprocess.run(command, capture_output=True, text=True)
+        lines = completed.stdout.strip().splitlines()
+        if completed.returncode != 0 or not lines:
+            sys.stderr.write(completed.stderr)
+            raise SystemExit(f"benchmark with {count} devices failed")
+        results.append(json.loads(lines[-1]))
+    return results
+
+
+def regressions(
+    results: List[Dict], baseline: List[Dict], tolerance: float, counts_only: bool = False
+) -> List[str]:
+    previous = {entry["devices"]: entry for entry in baseline}
+    found = []
+    for entry in results:
+        before = previous.get(entry["devices"])
+        if before is None:
+            continue
+        for metric in [] if counts_only else TIMING_METRICS:
+            if metric in before and metric in entry and entry[metric] > before[metric] * (1 + tolerance):
+                found.append(
+                    f"{entry['devices']} devices: {metric} {entry[metric]:.3f} > {before[metric]:.3f}"
+                )
+        for metric in COUNT_METRICS:
+            if metric in before and metric in entry and entry[metric] > before[metric]:
+                found.append(
+                    f"{entry['devices']} devices: {metric} {entry[metric]} > {before[metric]}"
+                )
+    return found
+
+
+def print_table(results: List[Dict]) -> None:
+    columns = ["devices", "components", "discovery_packets"] + TIMING_METRICS
+    print(" ".join(f"{column:>22}" for column in columns))
+    for entry in results:
+        print(
+            " ".join(
+                f"{entry.get(column, 0):>22.3f}"
+                if isinstance(entry.get(column), float)
+                else f"{entry.get(column, '-'):>22}"
+                for column in columns
+            )
+        )
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", default=DEFAULT_DEVICE_COUNTS, help="comma separated device counts")
+    parser.add_argument("--analog", type=int, default=10)
+    parser.add_argument("--binary", type=int, default=4)
+    parser.add_argument("--multi-state", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds per packet")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random seconds per packet")
+    parser.add_argument("--loss", type=float, default=0.0, help="fraction of packets dropped")
+    parser.add_argument("--samples", type=int, default=DEFAULT_SAMPLES)
+    parser.add_argument("--client", default=DEFAULT_CLIENT_ADDRESS)
+    parser.add_argument("--router", default=DEFAULT_ROUTER_ADDRESS)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against the results in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument(
+        "--counts-only",
+        action="store_true",
+        help="only compare packet counts, which don't depend on the machine",
+    )
+    parser.add_argument("--step", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main() -> None:
+    args = parse_args()
+    if args.step is not None:
+        print(json.dumps(asyncio.run(run_step(args))))
+        return
+
+    results = run_counts(args)
+    print_table(results)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            found = regressions(
+                results, json.load(baseline_file), args.tolerance, args.counts_only
+            )
+        for regression in found:
+            print(f"regression: {regression}")
+        if found:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,6 @@
+import asyncio
+import hashlib
+import json
 import os
 from typing import Any, ClassVar, List, Mapping, Optional, Sequence, Tuple
 
@@ -14,6 +17,10 @@ from viam.utils import ValueTypes, struct_to_dict
 
 
 LUTRON_MODEL_PREFIX = "hipsterbrown:lutron-bacnet:lutron-"
+# How many app API list calls may run at once while resolving the machine part
+RESOLVE_CONCURRENCY = 8
+# The parts of a component config that the button generates and compares
+COMPARED_FIELDS = ("api", "model", "attributes", "service_configs")
 
 
 class DiscoveryButton(Button, EasyResource):
@@ -24,6 +31,9 @@ class DiscoveryButton(Button, EasyResource):
     discovery: Discovery
     capture_frequency_hz: float
     _last_config: Optional[List[dict]]
+    _last_diff: Optional[dict]
+    _viam_client: Optional[ViamClient] = None
+    _machine_part: Optional[Tuple[str, str]] = None
 
     @classmethod
     def new(
@@ -50,6 +60,7 @@ class DiscoveryButton(Button, EasyResource):
         attrs = struct_to_dict(config.attributes)
         self.capture_frequency_hz = float(attrs.get("capture_frequency_hz", 0))
         self._last_config = None
+        self._last_diff = None
 
         discovery_service_name = str(attrs.get("discovery_service", ""))
         discovery_resource_name = ResourceName(
@@ -60,6 +71,18 @@ class DiscoveryButton(Button, EasyResource):
         )
         self.discovery = dependencies[discovery_resource_name]  # type: ignore
 
+    async def _get_viam_client(self) -> ViamClient:
+        """The app client, connected on first use and kept open until `close()`."""
+        if self._viam_client is None:
+            self._viam_client = await ViamClient.create_from_env_vars()
+        return self._viam_client
+
+    async def _get_machine_part(self, viam_client: ViamClient) -> Tuple[str, str]:
+        """The current machine's part ID and name, resolved once per resource lifetime."""
+        if self._machine_part is None:
+            self._machine_part = await self._resolve_machine_part(viam_client)
+        return self._machine_part
+
     async def _resolve_machine_part(self, viam_client: ViamClient) -> Tuple[str, str]:
         """Resolve the current machine's part ID and name using env vars."""
         org_id = os.environ.get("VIAM_PRIMARY_ORG_ID")
@@ -71,14 +94,37 @@ class DiscoveryButton(Button, EasyResource):
             )
 
         app = viam_client.app_client
+        semaphore = asyncio.Semaphore(RESOLVE_CONCURRENCY)
+
+        async def list_robots(location_id: str):
+            async with semaphore:
+                return await app.list_robots(location_id)
+
+        async def find_part(robot_id: str) -> Optional[Tuple[str, str]]:
+            async with semaphore:
+                parts = await app.get_robot_parts(robot_id)
+            for part in parts:
+                if part.fqdn == machine_fqdn:
+                    return part.id, part.name
+            return None
+
         locations = await app.list_locations(org_id)
-        for location in locations:
-            robots = await app.list_robots(location.id)
-            for robot in robots:
-                parts = await app.get_robot_parts(robot.id)
-                for part in parts:
-                    if part.fqdn == machine_fqdn:
-                        return part.id, part.name
+        robot_lists = await asyncio.gather(*[
+            list_robots(location.id) for location in locations
+        ])
+        lookups = [
+            asyncio.create_task(find_part(robot.id))
+            for robots in robot_lists
+            for robot in robots
+        ]
+        try:
+            for lookup in asyncio.as_completed(lookups):
+                found = await lookup
+                if found is not None:
+                    return found
+        finally:
+            for lookup in lookups:
+                lookup.cancel()
 
         raise RuntimeError(
             f"Could not find a machine part matching FQDN '{machine_fqdn}'"
@@ -99,37 +145,107 @@ class DiscoveryButton(Button, EasyResource):
         new_components = [self._component_config_to_dict(c) for c in discovered]
         self._last_config = new_components
 
-        viam_client = await ViamClient.create_from_env_vars()
+        viam_client = await self._get_viam_client()
+        app = viam_client.app_client
+        part_id, part_name = await self._get_machine_part(viam_client)
+        self.logger.info(f"Resolved machine part: {part_name} ({part_id})")
         try:
-            part_id, part_name = await self._resolve_machine_part(viam_client)
-            self.logger.info(f"Resolved machine part: {part_name} ({part_id})")
-
-            app = viam_client.app_client
             part = await app.get_robot_part(part_id)
-            current_config: dict = dict(part.robot_config or {})
+        except Exception as err:
+            # The cached part may have been deleted or moved; look it up again
+            self.logger.warning(f"Unable to get machine part {part_id}: {err}")
+            self._machine_part = None
+            part_id, part_name = await self._get_machine_part(viam_client)
+            part = await app.get_robot_part(part_id)
+        current_config: dict = dict(part.robot_config or {})
 
-            existing_components: List[dict] = list(
-                current_config.get("components", [])
+        existing_components: List[dict] = list(current_config.get("components", []))
+        merged_components, diff = self._diff_components(
+            existing_components, new_components
+        )
+        self._last_diff = diff
+        if not (diff["added"] or diff["removed"] or diff["changed"] or diff["duplicates"]):
+            self.logger.info(
+                f"Machine config unchanged: {diff['unchanged']} discovered components already applied"
             )
-            preserved = [
-                c for c in existing_components
-                if not str(c.get("model", "")).startswith(LUTRON_MODEL_PREFIX)
-            ]
-            merged_components = preserved + new_components
+            return
 
-            merged_config = dict(current_config)
-            merged_config["components"] = merged_components
+        merged_config = dict(current_config)
+        merged_config["components"] = merged_components
 
-            await app.update_robot_part(
-                robot_part_id=part_id,
-                name=part_name,
-                robot_config=merged_config,
-            )
-            self.logger.info(
-                f"Machine config updated: {len(new_components)} discovered components applied"
-            )
-        finally:
-            viam_client.close()
+        await app.update_robot_part(
+            robot_part_id=part_id,
+            name=part_name,
+            robot_config=merged_config,
+        )
+        diff["applied"] = True
+        self.logger.info(
+            f"Machine config updated: {len(diff['added'])} added, "
+            f"{len(diff['removed'])} removed, {len(diff['changed'])} changed, "
+            f"{len(diff['duplicates'])} duplicates dropped"
+        )
+
+    @staticmethod
+    def _component_hash(component: Mapping[str, Any]) -> str:
+        """A hash of a component's generated fields that ignores key order and int/float spelling."""
+        compared = {field: component.get(field) for field in COMPARED_FIELDS}
+        encoded = json.dumps(_normalize(compared), sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(encoded.encode()).hexdigest()
+
+    def _diff_components(
+        self, existing_components: List[dict], new_components: List[dict]
+    ) -> Tuple[List[dict], dict]:
+        """Merge discovered components into the existing list, keeping unchanged entries as they are.
+
+        Components from other models are always kept. Lutron components are
+        matched by name: unchanged ones keep their existing entry and position,
+        changed ones are replaced in place, missing ones are dropped and new
+        ones are appended in discovery order. Later copies of a name that is
+        in the existing list more than once are dropped and reported as
+        `duplicates`, not `removed`.
+        """
+        discovered = {component["name"]: component for component in new_components}
+        added: List[str] = []
+        removed: List[str] = []
+        changed: List[str] = []
+        duplicates: List[str] = []
+        unchanged = 0
+
+        merged: List[dict] = []
+        seen = set()
+        for component in existing_components:
+            if not str(component.get("model", "")).startswith(LUTRON_MODEL_PREFIX):
+                merged.append(component)
+                continue
+            name = component.get("name")
+            if name in seen:
+                duplicates.append(name)
+                continue
+            seen.add(name)
+            replacement = discovered.get(name)
+            if replacement is None:
+                removed.append(name)
+                continue
+            if self._component_hash(component) == self._component_hash(replacement):
+                merged.append(component)
+                unchanged += 1
+            else:
+                merged.append(replacement)
+                changed.append(name)
+        for name, component in discovered.items():
+            if name not in seen:
+                merged.append(component)
+                added.append(name)
+
+        diff = {
+            "added": sorted(added),
+            "removed": sorted(removed),
+            "changed": sorted(changed),
+            "duplicates": sorted(duplicates),
+            "unchanged": unchanged,
+            "applied": False,
+        }
+        return merged, diff
 
     def _component_config_to_dict(self, config: ComponentConfig) -> dict:
         entry: dict = {
@@ -167,9 +283,26 @@ class DiscoveryButton(Button, EasyResource):
         for name, _args in command.items():
             if name == "get_last_config":
                 result[name] = self._last_config or []
+            elif name == "get_last_diff":
+                result[name] = self._last_diff or {}
             else:
                 self.logger.warning(f"Unknown command '{name}'")
         return result
 
     async def close(self):
-        pass
+        if self._viam_client is not None:
+            self._viam_client.close()
+            self._viam_client = None
+
+
+def _normalize(value: Any) -> Any:
+    """Configs from the app come back from protobuf Structs, where every number is a float."""
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        return int(value) if float(value).is_integer() else float(value)
+    if isinstance(value, Mapping):
+        return {str(key): _normalize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(item) for item in value]
+    return value
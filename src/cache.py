@@ -0,0 +1,65 @@
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Hashable, Optional, Tuple
+
+DEFAULT_MAX_ENTRIES = 10000
+
+_INVALIDATED = object()
+
+
+class ValueCache:
+    """A bounded, least-recently-used table of property values and when they were read.
+
+    The cache itself has no notion of expiry: each reader passes the maximum
+    age it will accept, so resources with different freshness needs can share
+    one table. Invalidating a key also rejects any read that was already in
+    flight when the invalidation happened, so a write is never shadowed by the
+    value that preceded it.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, max_age: Optional[float]) -> Optional[Any]:
+        """The cached value if it was read within the last `max_age` seconds."""
+        if not max_age:
+            return None
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, read_at = entry
+        if value is _INVALIDATED or monotonic() - read_at > max_age:
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def last(self, key: Hashable) -> Optional[Tuple[Any, float]]:
+        """The most recent value and when it was read, however old, unless it was invalidated since."""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] is _INVALIDATED:
+            return None
+        return entry
+
+    def put(self, key: Hashable, value: Any, read_at: Optional[float] = None) -> None:
+        """Store a value read at `read_at` (defaults to now), unless the key was invalidated after that."""
+        read_at = monotonic() if read_at is None else read_at
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] > read_at:
+            return
+        self._entries[key] = (value, read_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        self._entries[key] = (_INVALIDATED, monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
@@ -1,55 +1,1018 @@
+import asyncio
+from contextlib import asynccontextmanager
 from logging import Logger, getLogger
 from os import path
+from time import monotonic
 from threading import Lock
-from typing import Self
-import weakref
+from typing import Any, Dict, List, Mapping, Optional, Self, Sequence, Set, Tuple
 import BAC0
+from BAC0.core.io.IOExceptions import NoResponseFromController, ReadPropertyException
 from BAC0.scripts.Lite import Lite
+from bacpypes3.apdu import (
+    AbortPDU,
+    ErrorRejectAbortNack,
+    RejectPDU,
+    WritePropertyMultipleError,
+    WritePropertyMultipleRequest,
+)
+from bacpypes3.app import DeviceInfo
+from bacpypes3.basetypes import (
+    ErrorType,
+    PropertyValue,
+    Segmentation,
+    WriteAccessSpecification,
+)
+from bacpypes3.constructeddata import Any as AnyValue
+from bacpypes3.pdu import Address
+
+from cache import ValueCache
+from cov import CovSubscriptions, ObjectKey
+from health import CircuitBreakers, DeviceUnavailable
+from metrics import ControllerMetrics, MetricsServer
+from plan import (
+    cached_address,
+    cached_object_identifier,
+    cached_property_identifier,
+)
+from poller import DevicePollers
+from recording import TraceRecorder, tap
+from scheduler import TrafficClass, TransactionScheduler
+
+# Used to size ReadPropertyMultiple batches so each response fits in one APDU
+# (or a few segments): the approximate encoded size of each property's value,
+# of each object's entry around its values, and of the ACK header.
+RPM_PROPERTY_BYTES = {
+    "presentValue": 16,
+    "objectType": 8,
+    "units": 8,
+    "objectName": 48,
+    "stateText": 96,
+}
+RPM_DEFAULT_PROPERTY_BYTES = 16
+RPM_OBJECT_OVERHEAD = 8
+RPM_RESPONSE_OVERHEAD = 8
+RPM_MAX_SEGMENTS = 4
+DEFAULT_MAX_APDU_LENGTH = 480
+
+# Reasons a device gives when it doesn't implement ReadPropertyMultiple at all
+RPM_UNSUPPORTED_REASONS = {"unrecognized-service"}
+# Reasons a device gives when the request or response was too large for it
+RPM_TOO_LARGE_REASONS = {
+    "segmentation-not-supported",
+    "buffer-overflow",
+    "apdu-too-long",
+}
+NO_RESPONSE_REASONS = {"no-response", "tsm-timeout", "server-timeout", "timeout"}
+
+# Approximate encoded size of one presentValue write in a WritePropertyMultiple
+# request, and how many single writes may be outstanding when falling back
+WPM_BYTES_PER_WRITE = 24
+WRITE_CONCURRENCY = 8
+
+# The binding resources use unless they name another, which BAC0 binds to the
+# machine's default interface as it always has
+DEFAULT_BINDING = "default"
+DEFAULT_BBMD_TTL = 900
+# How long requests on a named binding wait for a discovery service to define
+# it, the first time; once that runs out, requests fail straight away
+BINDING_CONFIG_TIMEOUT = 30.0
+
+# (object, value, priority) for a single presentValue write
+Write = Tuple[ObjectKey, Any, int]
+# (device address, object, value, priority) for a presentValue write on any device
+DeviceWrite = Tuple[str, ObjectKey, Any, Any]
+# (object, property names) for reading several properties of one object
+PropertyRequest = Tuple[ObjectKey, Sequence[str]]
+
+
+def error_reason(err: ErrorRejectAbortNack) -> str:
+    """The error code, or reject/abort reason, of a failed confirmed request."""
+    error_type = getattr(err, "errorType", None)
+    if error_type is not None:
+        return str(error_type.errorCode)
+    try:
+        return str(err.reason)
+    except (AttributeError, TypeError):
+        return str(type(err).__name__)
+
+
+def error_kind(err: BaseException) -> str:
+    """Whether a failed request timed out, was rejected, was aborted or failed some other way."""
+    if isinstance(err, (asyncio.TimeoutError, NoResponseFromController)):
+        return "timeout"
+    if isinstance(err, ErrorRejectAbortNack):
+        if error_reason(err) in NO_RESPONSE_REASONS:
+            return "timeout"
+        if isinstance(err, RejectPDU):
+            return "reject"
+        if isinstance(err, AbortPDU):
+            return "abort"
+    return "error"
+
+
+def binding_kwargs(settings: Mapping[str, Any]) -> Dict[str, Any]:
+    """BAC0.start arguments for a binding's `interface`, `port`, `bbmd_address` and `bbmd_ttl` settings."""
+    kwargs: Dict[str, Any] = {}
+    interface = settings.get("interface")
+    port = settings.get("port")
+    if interface:
+        kwargs["ip"] = f"{interface}:{int(port)}" if port else str(interface)
+    elif port:
+        kwargs["port"] = int(port)
+    if settings.get("bbmd_address"):
+        kwargs["bbmdAddress"] = str(settings["bbmd_address"])
+        kwargs["bbmdTTL"] = int(settings.get("bbmd_ttl", DEFAULT_BBMD_TTL))
+    return kwargs
+
+
+def coerce_value(vendor_info, object_identifier, property_identifier, value: Any) -> Any:
+    """`value` as the type a device's vendor info gives the property, raising ValueError if it can't be converted."""
+    object_class = vendor_info.get_object_class(object_identifier[0])
+    property_type = object_class.get_property_type(property_identifier) if object_class else None
+    if property_type is None:
+        raise ValueError(f"{object_identifier[0]} has no {property_identifier}")
+    if isinstance(value, property_type):
+        return value
+    # Numbers arrive from DoCommand as floats, which enumerated and unsigned types reject
+    if isinstance(value, float) and value.is_integer() and issubclass(property_type, int):
+        value = int(value)
+    try:
+        return property_type(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid value {value!r} for {property_type.__name__}") from None
+
+
+def validate_binding(attrs: Mapping[str, Any]) -> None:
+    """Raise ValueError if a resource's `binding` and `binding_settings` attributes don't fit together."""
+    settings = attrs.get("binding_settings")
+    if settings is None:
+        return
+    if not isinstance(settings, Mapping):
+        raise ValueError("binding_settings must be an object")
+    if str(attrs.get("binding", DEFAULT_BINDING)) == DEFAULT_BINDING:
+        raise ValueError("binding_settings needs a binding other than 'default'")
+
+
+def binding_controller(attrs: Mapping[str, Any]) -> "BacnetController":
+    """The controller for a resource's `binding`, defined by its `binding_settings` if it has them."""
+    controller = BacnetController(str(attrs.get("binding", DEFAULT_BINDING)))
+    settings = attrs.get("binding_settings")
+    if settings is not None:
+        controller.configure(settings)
+    return controller
 
 
 class BacnetController:
-    _instance = None
+    """One BACnet/IP stack, shared by every resource using the same binding.
+
+    Each named binding (interface, port and optional foreign-device
+    registration with a BBMD) gets its own controller, and with it its own
+    socket, transaction pool, caches and metrics, so traffic on separate
+    networks runs in parallel. The "default" binding needs no settings; other
+    bindings are defined by a discovery service's `bindings` attribute or a
+    resource's `binding_settings`, and requests on them wait for that.
+
+    Creating a controller is cheap: the stack starts in the background the
+    first time something calls `start` or needs the network, so resources
+    never block in `reconfigure`. Controllers live until the module calls
+    `shutdown`; resources closing or reconfiguring never stop them.
+    """
+
+    _instances: Dict[str, "BacnetController"] = {}
     _lock = Lock()
-    _ref_count = 0
-    _refs = set()
-    client: Lite
+    binding: str
+    settings: Optional[Dict[str, Any]]
+    client: Optional[Lite]
     logger: Logger
+    cov: CovSubscriptions
+    pollers: DevicePollers
+    values: ValueCache
+    scheduler: TransactionScheduler
+    read_stats: Dict[str, int]
+    startup_seconds: Optional[float]
+    _rpm_unsupported: Set[str]
+    _wpm_unsupported: Set[str]
+    _in_flight: Dict[Tuple[str, str, str, str], asyncio.Future]
+    _fetches: Set[asyncio.Task]
+    _start_task: Optional[asyncio.Task]
+    recorder: Optional[TraceRecorder]
 
-    def __new__(cls) -> Self:
+    def __new__(cls, binding: str = DEFAULT_BINDING) -> Self:
         with cls._lock:
-            if cls._instance is None:
-                cls._instance = super(BacnetController, cls).__new__(cls)
-                cls._instance._initialized = False
-        return cls._instance
+            instance = cls._instances.get(binding)
+            if instance is None:
+                instance = cls._instances[binding] = super(BacnetController, cls).__new__(cls)
+                instance._initialized = False
+        return instance
 
-    def __init__(self, logger: Logger = getLogger("BacnetController")) -> None:
+    def __init__(self, binding: str = DEFAULT_BINDING, logger: Optional[Logger] = None) -> None:
         with self._lock:
             if not self._initialized:
                 self._initialized = True
-                device_json_file = path.abspath(
-                    path.join(path.dirname(__file__), "device.json")
-                )
-                self.client = BAC0.start(json_file=device_json_file)
+                self.binding = binding
+                self.settings = {} if binding == DEFAULT_BINDING else None
+                self._configured = asyncio.Event()
+                self._undefined = False
+                if self.settings is not None:
+                    self._configured.set()
+                if logger is None:
+                    logger = getLogger(
+                        "BacnetController"
+                        if binding == DEFAULT_BINDING
+                        else f"BacnetController.{binding}"
+                    )
+                self.client = None
+                self.startup_seconds = None
+                self._start_task = None
+                self.recorder = None
                 self.logger = logger
-                self.logger.info("New controller created!")
+                self._rpm_unsupported = set()
+                self._wpm_unsupported = set()
+                self._in_flight = {}
+                self._fetches = set()
+                self.values = ValueCache()
+                self.scheduler = TransactionScheduler()
+                self.read_stats = {"sent": 0, "coalesced": 0, "cached": 0, "late": 0}
+                self.cov = CovSubscriptions(self.app, self.logger)
+                self.pollers = DevicePollers(
+                    lambda address, keys: self.read_multiple(
+                        address, keys, traffic_class=TrafficClass.POLL
+                    ),
+                    self.logger,
+                )
+                self.health = CircuitBreakers()
+                self.metrics = ControllerMetrics(error_kind)
+                self.metrics_server = MetricsServer(self.prometheus, self.logger)
+                self.logger.info(f"New controller created for binding '{binding}'!")
+
+    def configure(self, settings: Mapping[str, Any]) -> None:
+        """Set the binding's interface settings, which take effect when its stack starts."""
+        settings = dict(settings)
+        if settings == self.settings:
+            return
+        if self.client is not None:
+            self.logger.warning(
+                f"Binding '{self.binding}' is already running; restart the module to apply its new settings"
+            )
+            return
+        self.settings = settings
+        self._undefined = False
+        self._configured.set()
 
-            type(self)._ref_count += 1
-            ref = weakref.ref(self, self._cleanup)
-            type(self)._refs.add(ref)
+    def start(self) -> asyncio.Task:
+        """Start the BACnet stack in the background if it isn't running yet. Must be called from the running event loop."""
+        if self._start_task is None:
+            self._start_task = asyncio.create_task(self._start())
+            self._start_task.add_done_callback(self._started)
+        return self._start_task
+
+    def _started(self, task: asyncio.Task) -> None:
+        # Retrieve the error here, since resources start the stack without waiting on it
+        if not task.cancelled() and task.exception() is not None:
+            self.logger.error(
+                f"Unable to start BACnet binding '{self.binding}': {task.exception()}"
+            )
+
+    async def _start(self) -> None:
+        # Let whoever asked for the stack finish what it was doing first
+        await asyncio.sleep(0)
+        device_json_file = path.abspath(path.join(path.dirname(__file__), "device.json"))
+        try:
+            if not self._configured.is_set():
+                undefined = RuntimeError(
+                    f"BACnet binding '{self.binding}' is not defined; set its binding_settings "
+                    "or define it in a discovery service's bindings"
+                )
+                if self._undefined:
+                    raise undefined
+                try:
+                    await asyncio.wait_for(self._configured.wait(), BINDING_CONFIG_TIMEOUT)
+                except asyncio.TimeoutError:
+                    self._undefined = True
+                    raise undefined from None
+            started = monotonic()
+            # BAC0 has to start on the event loop's thread: bacpypes3 binds
+            # its sockets from tasks on the running loop
+            client = BAC0.start(json_file=device_json_file, **binding_kwargs(self.settings))
+        except BaseException:
+            # Let the next caller try again, e.g. once the port is free
+            self._start_task = None
+            raise
+        self.metrics.tap(client.this_application.app)
+        if self.recorder is not None:
+            tap(client.this_application.app, self._trace_packet)
+        self.client = client
+        self.startup_seconds = monotonic() - started
+        self.logger.info(f"BACnet stack started in {self.startup_seconds:.3f}s")
+
+    async def ready(self) -> Lite:
+        """The BAC0 client, waiting for the stack to start if it hasn't yet."""
+        if self.client is None:
+            await asyncio.shield(self.start())
+        return self.client
+
+    async def app(self):
+        """The bacpypes3 application, waiting for the stack to start if it hasn't yet."""
+        return (await self.ready()).this_application.app
+
+    def record(self, path: str) -> None:
+        """Record every packet this binding sends and receives to a trace file, replacing any recording in progress."""
+        self.stop_recording()
+        self.recorder = TraceRecorder(path, self.binding)
+        if self.client is not None:
+            tap(self.client.this_application.app, self._trace_packet)
+        self.logger.info(f"Recording BACnet traffic to {path}")
+
+    def stop_recording(self) -> Optional[Dict[str, Any]]:
+        """Finish the recording in progress, returning its status, or None if nothing was being recorded."""
+        if self.recorder is None:
+            return None
+        self.recorder.close()
+        status = self.recorder.status()
+        self.recorder = None
+        return status
+
+    def _trace_packet(self, direction: str, peer: str, data: bytes) -> None:
+        if self.recorder is not None:
+            self.recorder.packet(direction, peer, data)
+
+    @classmethod
+    def bindings(cls) -> List[str]:
+        return list(cls._instances)
 
     @classmethod
-    def _cleanup(cls, ref):
+    async def shutdown(cls) -> None:
+        """Stop every binding's BACnet stack and forget the controllers; the module calls this once, on exit."""
         with cls._lock:
-            if ref in cls._refs:
-                cls._refs.remove(ref)
-                cls._ref_count -= 1
-
-                if cls._ref_count == 0 and cls._instance:
-                    cls._instance.client.disconnect()
-                    cls._instance = None
-
-    def __del__(self):
-        with type(self)._lock:
-            type(self)._ref_count -= 1
-            if type(self)._ref_count <= 0:
-                self.client.disconnect()
+            controllers = list(cls._instances.values())
+            cls._instances = {}
+        for controller in controllers:
+            await controller._shutdown()
+
+    async def _shutdown(self) -> None:
+        self.cov.close()
+        self.pollers.close()
+        self.metrics_server.close()
+        self.stop_recording()
+        for task in list(self._fetches):
+            task.cancel()
+        if self._start_task is not None and not self._start_task.done():
+            self._start_task.cancel()
+        if self.client is not None:
+            # disconnect() only schedules this; wait for the socket to be freed
+            await self.client._disconnect()
+            self.client = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "reads": dict(self.read_stats),
+            "scheduler": self.scheduler.stats(),
+            "pollers": self.pollers.stats(),
+            "metrics": self.metrics.snapshot(),
+            "devices": self.health.snapshot(),
+            "binding": self.binding,
+            "startup_seconds": self.startup_seconds,
+            "recording": self.recorder.status() if self.recorder else None,
+        }
+
+    def reset_stats(self) -> None:
+        for key in self.read_stats:
+            self.read_stats[key] = 0
+        self.metrics.reset()
+
+    def prometheus(self) -> str:
+        return self.metrics.prometheus({
+            "scheduler": self.scheduler.stats(),
+            "reads": self.read_stats,
+        })
+
+    async def get_device_info(self, device_address: Address) -> Optional[DeviceInfo]:
+        """Look up the cached I-Am details for a device, asking the device directly if it hasn't announced itself yet."""
+        app = await self.app()
+        device_info = await app.device_info_cache.get_device_info(device_address)
+        if device_info is None:
+            async with self.metrics.track(str(device_address), "whoIs"):
+                i_ams = await app.who_is(address=device_address)
+            if i_ams:
+                await app.device_info_cache.set_device_info(i_ams[0])
+                device_info = await app.device_info_cache.get_device_info(
+                    device_address
+                )
+        return device_info
+
+    async def rpm_batches(
+        self, device_address: Address, requests: Sequence[PropertyRequest]
+    ) -> List[Sequence[PropertyRequest]]:
+        """Split property requests into groups whose ReadPropertyMultiple responses fit in what this device can send."""
+        max_apdu = await self._max_apdu(
+            device_address,
+            (Segmentation.segmentedBoth, Segmentation.segmentedTransmit),
+        )
+        budget = max_apdu - RPM_RESPONSE_OVERHEAD
+        batches: List[Sequence[PropertyRequest]] = []
+        start, used = 0, 0
+        for index, (_key, props) in enumerate(requests):
+            size = RPM_OBJECT_OVERHEAD + sum(
+                RPM_PROPERTY_BYTES.get(prop, RPM_DEFAULT_PROPERTY_BYTES)
+                for prop in props
+            )
+            if index > start and used + size > budget:
+                batches.append(requests[start:index])
+                start, used = index, 0
+            used += size
+        batches.append(requests[start:])
+        return batches
+
+    async def wpm_batch_size(self, device_address: Address) -> int:
+        """The number of presentValue writes that fit in a single WritePropertyMultiple request to this device."""
+        max_apdu = await self._max_apdu(
+            device_address,
+            (Segmentation.segmentedBoth, Segmentation.segmentedReceive),
+        )
+        return max(1, max_apdu // WPM_BYTES_PER_WRITE)
+
+    async def _max_apdu(self, device_address: Address, segmented_modes) -> int:
+        device_info = await self.get_device_info(device_address)
+        max_apdu = DEFAULT_MAX_APDU_LENGTH
+        if device_info is not None:
+            max_apdu = device_info.max_apdu_length_accepted or max_apdu
+            if device_info.segmentation_supported in segmented_modes:
+                max_apdu *= RPM_MAX_SEGMENTS
+        return max_apdu
+
+    @asynccontextmanager
+    async def _transaction(
+        self, address: str, operation: str, traffic_class: TrafficClass
+    ):
+        """Wrap one confirmed request to a device.
+
+        The request waits for a scheduler slot, is timed out after the
+        device's adaptive timeout and feeds the device's circuit breaker.
+        Raises DeviceUnavailable without sending anything while the device's
+        circuit is open.
+        """
+        if not self.health.allow(address):
+            raise DeviceUnavailable(address)
+        probe = self.health.probing(address)
+        answered = False
+        try:
+            async with self.scheduler.slot(address, traffic_class):
+                started = monotonic()
+                try:
+                    async with self.metrics.track(address, operation):
+                        async with asyncio.timeout(self.health.timeout(address)):
+                            yield
+                except (Exception, ErrorRejectAbortNack) as err:
+                    if error_kind(err) == "timeout":
+                        self.health.failed(address)
+                    else:
+                        self.health.succeeded(address, monotonic() - started)
+                    answered = True
+                    raise
+                self.health.succeeded(address, monotonic() - started)
+                answered = True
+        finally:
+            if probe and not answered:
+                self.health.abandoned(address)
+
+    async def read_property(
+        self,
+        address: str,
+        obj_type: str,
+        obj_instance: str,
+        prop: str = "presentValue",
+        traffic_class: TrafficClass = TrafficClass.INTERACTIVE,
+    ) -> Any:
+        """Read one property of one object straight through the bacpypes3 application.
+
+        Raises NoResponseFromController if the device doesn't answer and
+        ReadPropertyException if it answers with an error, reject or abort.
+        """
+        app = await self.app()
+        try:
+            async with self._transaction(address, "readProperty", traffic_class):
+                response = await app.read_property(
+                    cached_address(address),
+                    cached_object_identifier((str(obj_type), str(obj_instance))),
+                    cached_property_identifier(prop),
+                )
+                if isinstance(response, ErrorRejectAbortNack):
+                    raise response
+                return response
+        except ErrorRejectAbortNack as err:
+            reason = error_reason(err)
+            if reason in NO_RESPONSE_REASONS:
+                raise NoResponseFromController(f"No response from {address}") from err
+            raise ReadPropertyException(
+                f"Unable to read {prop} of {obj_type} {obj_instance} on {address}: {reason}"
+            ) from err
+
+    async def read_multiple(
+        self,
+        address: str,
+        objects: Sequence[ObjectKey],
+        prop: str = "presentValue",
+        max_age: Optional[Mapping[str, float]] = None,
+        traffic_class: TrafficClass = TrafficClass.INTERACTIVE,
+        deadline: Optional[float] = None,
+    ) -> Dict[ObjectKey, Any]:
+        """Read one property from many objects on a device.
+
+        Present values of objects with a live COV subscription come straight
+        from the notification table, and values read within `max_age` seconds
+        (keyed by object type, or "*" for any type) come from the value cache.
+        Unless `max_age` is None, so do present values a device poller read
+        within the last couple of poll intervals. The rest are grouped into
+        ReadPropertyMultiple requests sized to the device's max APDU, falling
+        back to one read per object for devices that reject ReadPropertyMultiple.
+        Objects already being read by another caller join that read instead of
+        sending their own. Objects that could not be read are left out of the
+        result.
+
+        With a `deadline`, only values read within that many seconds are
+        returned. Reads still outstanding at the deadline carry on in the
+        background and update the value cache when they finish.
+        """
+        values: Dict[ObjectKey, Any] = {}
+        if prop == "presentValue":
+            for key in objects:
+                value = self.cov.get(address, key)
+                if value is not None:
+                    values[key] = value
+            objects = [key for key in objects if key not in values]
+        if max_age is not None:
+            for key in objects:
+                age = max_age.get(key[0], max_age.get("*"))
+                polled = self.pollers.max_age(address, key) if prop == "presentValue" else None
+                if polled is not None:
+                    age = max(age or 0.0, polled)
+                value = self.values.get((address, key, prop), age)
+                if value is not None:
+                    values[key] = value
+                    self.read_stats["cached"] += 1
+            objects = [key for key in objects if key not in values]
+        if not objects:
+            return values
+
+        # Objects someone else is already reading share that transaction
+        loop = asyncio.get_running_loop()
+        pending: Dict[ObjectKey, asyncio.Future] = {}
+        to_fetch = []
+        for key in objects:
+            flight_key = (address, key[0], key[1], prop)
+            future = self._in_flight.get(flight_key)
+            if future is None:
+                future = loop.create_future()
+                self._in_flight[flight_key] = future
+                to_fetch.append(key)
+                self.read_stats["sent"] += 1
+            else:
+                self.read_stats["coalesced"] += 1
+            pending[key] = future
+
+        if to_fetch:
+            # The fetch runs as its own task so it outlives a caller that gives up at its deadline
+            task = asyncio.create_task(
+                self._fetch_pending(address, to_fetch, pending, prop, traffic_class)
+            )
+            self._fetches.add(task)
+            task.add_done_callback(self._fetches.discard)
+
+        await asyncio.wait(pending.values(), timeout=deadline)
+        for key, future in pending.items():
+            if not future.done():
+                self.read_stats["late"] += 1
+                continue
+            value = future.result()
+            if value is not None:
+                values[key] = value
+        return values
+
+    async def _fetch_pending(
+        self,
+        address: str,
+        objects: Sequence[ObjectKey],
+        pending: Mapping[ObjectKey, asyncio.Future],
+        prop: str,
+        traffic_class: TrafficClass,
+    ) -> None:
+        """Read `objects`, caching each value and resolving its in-flight future."""
+        fetched: Dict[ObjectKey, Any] = {}
+        read_at = monotonic()
+        try:
+            fetched = await self._fetch(address, objects, prop, traffic_class)
+        except Exception as fetchErr:
+            self.logger.error(f"Unable to read {prop} from {address}")
+            self.logger.error(fetchErr)
+        finally:
+            for key in objects:
+                flight_key = (address, key[0], key[1], prop)
+                future = pending[key]
+                if self._in_flight.get(flight_key) is future:
+                    del self._in_flight[flight_key]
+                value = fetched.get(key)
+                if value is not None:
+                    self.values.put((address, key, prop), value, read_at)
+                if not future.done():
+                    future.set_result(value)
+
+    def last_value(
+        self, address: str, key: ObjectKey, prop: str = "presentValue"
+    ) -> Optional[Tuple[Any, float]]:
+        """The last value read for a property and its age in seconds, however old, or None if there isn't one."""
+        entry = self.values.last((address, key, prop))
+        if entry is None:
+            return None
+        value, read_at = entry
+        return value, monotonic() - read_at
+
+    async def write_property(
+        self,
+        address: str,
+        key: ObjectKey,
+        value: Any,
+        prop: str = "presentValue",
+        priority: int = 16,
+    ) -> None:
+        """Write one property of one object, dropping any cached or in-flight read of it.
+
+        Raises ValueError without sending anything if the value can't be
+        converted to the property's type.
+        """
+        bacnet_app = await self.app()
+        device_address = cached_address(address)
+        object_identifier = cached_object_identifier(key)
+        property_identifier = cached_property_identifier(prop)
+        vendor_info = await bacnet_app.get_vendor_info(device_address=device_address)
+        value = coerce_value(vendor_info, object_identifier, property_identifier, value)
+        try:
+            async with self._transaction(address, "writeProperty", TrafficClass.WRITE):
+                response = await bacnet_app.write_property(
+                    address=device_address,
+                    objid=object_identifier,
+                    prop=property_identifier,
+                    value=value,
+                    priority=priority,
+                )
+                if isinstance(response, ErrorRejectAbortNack):
+                    raise response
+        finally:
+            self.invalidate(address, key, prop)
+
+    async def write_multiple(self, address: str, writes: Sequence[Write]) -> List[Optional[str]]:
+        """Write the presentValue of many objects on a device, returning None for each write that succeeded and why each other one failed.
+
+        Writes are sent as WritePropertyMultiple requests sized to the device's
+        max APDU. Devices that reject WritePropertyMultiple get concurrent
+        single writes instead, a few at a time. A value that can't be
+        converted to its object's type fails only its own write.
+        """
+        if not writes:
+            return []
+        if not self.health.available(address):
+            return [str(DeviceUnavailable(address))] * len(writes)
+        if address in self._wpm_unsupported or len(writes) == 1:
+            return await self._write_each(address, writes)
+
+        device_address = cached_address(address)
+        batch_size = await self.wpm_batch_size(device_address)
+        results: List[Optional[str]] = []
+        for batch_results in await asyncio.gather(*[
+            self._write_batch(address, device_address, writes[i : i + batch_size])
+            for i in range(0, len(writes), batch_size)
+        ]):
+            results.extend(batch_results)
+        return results
+
+    async def write_many(self, writes: Sequence[DeviceWrite]) -> List[Dict[str, Any]]:
+        """Write objects on many devices at once, each device's writes together through `write_multiple`.
+
+        Returns `{"success": True}` for each write that succeeded and
+        `{"success": False, "error": reason}` for each other one. A write
+        with no value or an invalid priority, or a device that fails
+        unexpectedly, fails only its own writes.
+        """
+        results: List[Dict[str, Any]] = [{"success": False} for _write in writes]
+        by_device: Dict[str, List[Tuple[int, Write]]] = {}
+        for index, (address, key, value, priority) in enumerate(writes):
+            if value is None:
+                results[index]["error"] = "no value"
+                continue
+            try:
+                valid = 1 <= int(priority) <= 16
+            except (TypeError, ValueError):
+                valid = False
+            if not valid:
+                results[index]["error"] = f"invalid priority {priority!r}"
+                continue
+            priority = int(priority)
+            by_device.setdefault(address, []).append((index, (key, value, priority)))
+
+        async def write_device(address: str, device_writes: List[Tuple[int, Write]]):
+            try:
+                errors = await self.write_multiple(
+                    address, [write for _index, write in device_writes]
+                )
+            except Exception as writeErr:
+                self.logger.error(f"Unable to write to {address}: {writeErr}")
+                errors = [str(writeErr)] * len(device_writes)
+            for (index, _write), error in zip(device_writes, errors):
+                results[index]["success"] = error is None
+                if error is not None:
+                    results[index]["error"] = error
+
+        await asyncio.gather(*[
+            write_device(address, device_writes)
+            for address, device_writes in by_device.items()
+        ])
+        return results
+
+    async def _write_batch(
+        self, address: str, device_address: Address, batch: Sequence[Write]
+    ) -> List[Optional[str]]:
+        app = await self.app()
+        vendor_info = await app.get_vendor_info(device_address=device_address)
+        property_identifier = cached_property_identifier("presentValue")
+
+        errors: List[Optional[str]] = [None] * len(batch)
+        specs = []
+        # The index in `batch` of each write in `specs`
+        sent: List[int] = []
+        for index, (key, value, priority) in enumerate(batch):
+            try:
+                object_identifier = cached_object_identifier(key)
+                value = coerce_value(vendor_info, object_identifier, property_identifier, value)
+            except ValueError as valueErr:
+                errors[index] = str(valueErr)
+                continue
+            specs.append(
+                WriteAccessSpecification(
+                    objectIdentifier=object_identifier,
+                    listOfProperties=[
+                        PropertyValue(
+                            propertyIdentifier=property_identifier,
+                            value=AnyValue(value),
+                            priority=priority,
+                        )
+                    ],
+                )
+            )
+            sent.append(index)
+        if not specs:
+            return errors
+
+        def fail(indexes: Sequence[int], reason: str) -> List[Optional[str]]:
+            for index in indexes:
+                errors[index] = reason
+            return errors
+
+        async def write_each(indexes: Sequence[int]) -> List[Optional[str]]:
+            remaining = await self._write_each(address, [batch[index] for index in indexes])
+            for index, error in zip(indexes, remaining):
+                errors[index] = error
+            return errors
+
+        try:
+            async with self._transaction(
+                address, "writePropertyMultiple", TrafficClass.WRITE
+            ):
+                await app.request(
+                    WritePropertyMultipleRequest(
+                        listOfWriteAccessSpecs=specs, destination=device_address
+                    )
+                )
+            return errors
+        except WritePropertyMultipleError as err:
+            # The device applies writes in order and stops at the first failure
+            failed = err.firstFailedWriteAttempt.objectIdentifier
+            position = next(
+                (i for i, spec in enumerate(specs) if spec.objectIdentifier == failed),
+                0,
+            )
+            reason = error_reason(err)
+            self.logger.warning(
+                f"WritePropertyMultiple to {address} failed at {failed} ({reason})"
+            )
+            fail([sent[position]], reason)
+            if position + 1 < len(sent):
+                self.metrics.retry(address, "writePropertyMultiple")
+            return await write_each(sent[position + 1 :])
+        except DeviceUnavailable as unavailable:
+            return fail(sent, str(unavailable))
+        except asyncio.TimeoutError:
+            self.logger.error(f"No response from {address} to WritePropertyMultiple")
+            return fail(sent, "no response")
+        except ErrorRejectAbortNack as err:
+            reason = error_reason(err)
+            if reason in NO_RESPONSE_REASONS:
+                self.logger.error(f"No response from {address} to WritePropertyMultiple")
+                return fail(sent, "no response")
+            if reason in RPM_UNSUPPORTED_REASONS:
+                self.logger.warning(
+                    f"{address} does not support WritePropertyMultiple, using single writes"
+                )
+                self._wpm_unsupported.add(address)
+            else:
+                self.logger.warning(
+                    f"WritePropertyMultiple to {address} failed ({reason}), using single writes"
+                )
+            self.metrics.retry(address, "writePropertyMultiple")
+            return await write_each(sent)
+        finally:
+            for key, _value, _priority in batch:
+                self.invalidate(address, key)
+
+    async def _write_each(self, address: str, writes: Sequence[Write]) -> List[Optional[str]]:
+        semaphore = asyncio.Semaphore(WRITE_CONCURRENCY)
+
+        async def write_one(key: ObjectKey, value: Any, priority: int) -> Optional[str]:
+            async with semaphore:
+                try:
+                    await self.write_property(address, key, value, priority=priority)
+                    return None
+                except DeviceUnavailable as unavailable:
+                    self.logger.debug(unavailable)
+                    return str(unavailable)
+                except ValueError as valueErr:
+                    return str(valueErr)
+                except (Exception, ErrorRejectAbortNack) as writeErr:
+                    self.logger.error(f"Unable to write {key[0]} {key[1]} on {address}")
+                    self.logger.error(writeErr)
+                    if error_kind(writeErr) == "timeout":
+                        return "no response"
+                    if isinstance(writeErr, ErrorRejectAbortNack):
+                        return error_reason(writeErr)
+                    return str(writeErr) or type(writeErr).__name__
+
+        return list(await asyncio.gather(*[write_one(*write) for write in writes]))
+
+    def invalidate(self, address: str, key: ObjectKey, prop: str = "presentValue") -> None:
+        self.values.invalidate((address, key, prop))
+        if prop == "presentValue":
+            self.cov.invalidate(address, key)
+        # Later readers must not join a read that started before the write
+        self._in_flight.pop((address, key[0], key[1], prop), None)
+
+    async def _fetch(
+        self,
+        address: str,
+        objects: Sequence[ObjectKey],
+        prop: str,
+        traffic_class: TrafficClass,
+    ) -> Dict[ObjectKey, Any]:
+        if not objects:
+            return {}
+        results = await self.read_properties(
+            address, [(key, [prop]) for key in objects], traffic_class
+        )
+        return {
+            key: properties[prop]
+            for key, properties in results.items()
+            if prop in properties
+        }
+
+    def supports_rpm(self, address: str) -> bool:
+        """False once a device has rejected ReadPropertyMultiple."""
+        return address not in self._rpm_unsupported
+
+    async def read_properties(
+        self,
+        address: str,
+        requests: Sequence[PropertyRequest],
+        traffic_class: TrafficClass = TrafficClass.INTERACTIVE,
+    ) -> Dict[ObjectKey, Dict[str, Any]]:
+        """Read several properties from each of many objects on a device.
+
+        Requests are grouped into ReadPropertyMultiple requests sized to the
+        device's max APDU, falling back to one read per property for devices
+        that reject ReadPropertyMultiple. This bypasses the value cache, COV
+        table and read coalescing. Properties that could not be read are left
+        out of the result.
+        """
+        if not requests or not self.health.available(address):
+            return {}
+        single = len(requests) == 1 and len(requests[0][1]) == 1
+        if address in self._rpm_unsupported or single:
+            return await self._read_each(address, requests, traffic_class)
+
+        device_address = cached_address(address)
+        values: Dict[ObjectKey, Dict[str, Any]] = {}
+        for batch_values in await asyncio.gather(*[
+            self._read_batch(address, device_address, batch, traffic_class)
+            for batch in await self.rpm_batches(device_address, requests)
+        ]):
+            values.update(batch_values)
+        return values
+
+    async def read_value(
+        self,
+        address: str,
+        key: ObjectKey,
+        prop: str = "presentValue",
+        max_age: Optional[Mapping[str, float]] = None,
+        traffic_class: TrafficClass = TrafficClass.INTERACTIVE,
+    ) -> Optional[Any]:
+        """Read one property of one object, or None if it could not be read."""
+        values = await self.read_multiple(address, [key], prop, max_age, traffic_class)
+        return values.get(key)
+
+    async def _read_batch(
+        self,
+        address: str,
+        device_address: Address,
+        batch: Sequence[PropertyRequest],
+        traffic_class: TrafficClass,
+    ) -> Dict[ObjectKey, Dict[str, Any]]:
+        requested = {cached_object_identifier(key): key for key, _props in batch}
+        property_names = {
+            cached_property_identifier(prop): prop for _key, props in batch for prop in props
+        }
+        app = await self.app()
+        try:
+            async with self._transaction(
+                address, "readPropertyMultiple", traffic_class
+            ):
+                # bacpypes3 takes the object ids and property lists as one flat list
+                response = await app.read_property_multiple(
+                    device_address,
+                    [
+                        item
+                        for key, props in batch
+                        for item in (
+                            cached_object_identifier(key),
+                            [cached_property_identifier(prop) for prop in props],
+                        )
+                    ],
+                )
+                if isinstance(response, ErrorRejectAbortNack):
+                    raise response
+        except DeviceUnavailable:
+            return {}
+        except asyncio.TimeoutError:
+            self.logger.error(f"No response from {address} to ReadPropertyMultiple")
+            return {}
+        except ErrorRejectAbortNack as err:
+            reason = error_reason(err)
+            if reason in NO_RESPONSE_REASONS:
+                self.logger.error(f"No response from {address} to ReadPropertyMultiple")
+                return {}
+            self.metrics.retry(address, "readPropertyMultiple")
+            if reason in RPM_TOO_LARGE_REASONS and len(batch) > 1:
+                middle = len(batch) // 2
+                first, second = await asyncio.gather(
+                    self._read_batch(
+                        address, device_address, batch[:middle], traffic_class
+                    ),
+                    self._read_batch(
+                        address, device_address, batch[middle:], traffic_class
+                    ),
+                )
+                return first | second
+            if reason in RPM_UNSUPPORTED_REASONS:
+                self.logger.warning(
+                    f"{address} does not support ReadPropertyMultiple, using single reads"
+                )
+                self._rpm_unsupported.add(address)
+            else:
+                self.logger.warning(
+                    f"ReadPropertyMultiple to {address} failed ({reason}), using single reads"
+                )
+            return await self._read_each(address, batch, traffic_class)
+
+        values: Dict[ObjectKey, Dict[str, Any]] = {}
+        for object_id, prop_id, _array_index, value in response or []:
+            key = requested.get(object_id)
+            prop = property_names.get(prop_id)
+            if key is None or prop is None:
+                continue
+            if value is None or isinstance(value, ErrorType):
+                continue
+            values.setdefault(key, {})[prop] = value
+        return values
+
+    async def _read_each(
+        self,
+        address: str,
+        requests: Sequence[PropertyRequest],
+        traffic_class: TrafficClass,
+    ) -> Dict[ObjectKey, Dict[str, Any]]:
+        async def read_one(key: ObjectKey, prop: str):
+            try:
+                value = await self.read_property(address, *key, prop, traffic_class)
+                return key, prop, value
+            except DeviceUnavailable as unavailable:
+                self.logger.debug(unavailable)
+                return key, prop, None
+            except Exception as readErr:
+                self.logger.error(f"Unable to read {prop} of {key[0]} {key[1]}")
+                self.logger.error(readErr)
+                return key, prop, None
+
+        results = await asyncio.gather(*[
+            read_one(key, prop) for key, props in requests for prop in props
+        ])
+        values: Dict[ObjectKey, Dict[str, Any]] = {}
+        for key, prop, value in results:
+            if value is not None:
+                values.setdefault(key, {})[prop] = value
+        return values
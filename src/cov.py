@@ -0,0 +1,147 @@
+import asyncio
+from logging import Logger
+from typing import Any, Dict, Optional, Set, Tuple
+
+from bacpypes3.apdu import ErrorRejectAbortNack
+from bacpypes3.basetypes import PropertyIdentifier
+from bacpypes3.pdu import Address
+from bacpypes3.primitivedata import ObjectIdentifier
+
+# Objects are keyed by their (type, instance) strings as they appear in the
+# component config, e.g. ("analog-value", "2").
+ObjectKey = Tuple[str, str]
+SubscriptionKey = Tuple[str, ObjectKey]
+
+# Subscriptions are renewed by bacpypes a couple of seconds before they expire.
+# A device that reboots forgets its subscriptions, so the lifetime also bounds
+# how long a value can go without updates before it is re-established.
+COV_LIFETIME = 300
+# How often a quiet subscription checks that its last renewal went through
+COV_CHECK_INTERVAL = 10
+COV_RETRY_MIN = 5
+COV_RETRY_MAX = 300
+
+# Reasons a device gives when it will never accept a subscription for an object
+COV_REFUSED_REASONS = {
+    "unrecognized-service",
+    "optional-functionality-not-supported",
+    "cov-subscription-failed",
+    "not-cov-property",
+    "unknown-object",
+    "service-request-denied",
+}
+
+PRESENT_VALUE = PropertyIdentifier("presentValue")
+
+
+class CovSubscriptions:
+    """SubscribeCOV bookkeeping for the objects resources have opted in to.
+
+    Each watched object gets a task that holds a subscription open and writes
+    every notified presentValue into a shared value table. Objects only have a
+    value in the table while their subscription is healthy, so readers fall
+    back to polling when a device refuses COV or drops off the network.
+    """
+
+    values: Dict[SubscriptionKey, Any]
+    refused: Set[SubscriptionKey]
+
+    def __init__(self, app_getter, logger: Logger, lifetime: int = COV_LIFETIME):
+        """`app_getter` is a coroutine function returning the bacpypes3 application once the stack is up."""
+        self._get_app = app_getter
+        self.logger = logger
+        self.lifetime = lifetime
+        self.values = {}
+        self.refused = set()
+        self._watchers: Dict[SubscriptionKey, int] = {}
+        self._tasks: Dict[SubscriptionKey, asyncio.Task] = {}
+
+    def watch(self, address: str, keys) -> None:
+        """Start (or share) a subscription for each object. Must be called from the running event loop."""
+        for key in keys:
+            sub_key = (address, key)
+            self._watchers[sub_key] = self._watchers.get(sub_key, 0) + 1
+            if sub_key not in self._tasks and sub_key not in self.refused:
+                self._tasks[sub_key] = asyncio.create_task(self._subscribe(sub_key))
+
+    def unwatch(self, address: str, keys) -> None:
+        """Release interest in each object, cancelling subscriptions nobody watches anymore."""
+        for key in keys:
+            sub_key = (address, key)
+            remaining = self._watchers.get(sub_key, 0) - 1
+            if remaining > 0:
+                self._watchers[sub_key] = remaining
+                continue
+            self._watchers.pop(sub_key, None)
+            self.values.pop(sub_key, None)
+            task = self._tasks.pop(sub_key, None)
+            if task is not None:
+                task.cancel()
+
+    def get(self, address: str, key: ObjectKey) -> Optional[Any]:
+        return self.values.get((address, key))
+
+    def invalidate(self, address: str, key: ObjectKey) -> None:
+        """Forget an object's notified value, e.g. after writing it, until the next notification."""
+        self.values.pop((address, key), None)
+
+    def close(self) -> None:
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+        self._watchers.clear()
+        self.values.clear()
+
+    async def _subscribe(self, sub_key: SubscriptionKey) -> None:
+        address, key = sub_key
+        device_address = Address(address)
+        object_identifier = ObjectIdentifier(key)
+        retry_delay = COV_RETRY_MIN
+
+        while True:
+            try:
+                app = await self._get_app()
+                async with app.change_of_value(
+                    device_address, object_identifier, lifetime=self.lifetime
+                ) as subscription:
+                    self.logger.debug(f"Subscribed to COV for {key[0]} {key[1]} on {address}")
+                    retry_delay = COV_RETRY_MIN
+                    while True:
+                        try:
+                            prop, value = await asyncio.wait_for(
+                                subscription.get_value(), COV_CHECK_INTERVAL
+                            )
+                            if prop == PRESENT_VALUE:
+                                self.values[sub_key] = value
+                        except asyncio.TimeoutError:
+                            pass
+
+                        # A failed renewal usually means the device went away.
+                        # Raising abandons the context so it can be re-established.
+                        refresh = subscription.refresh_subscription_task
+                        if refresh is not None and refresh.done() and refresh.exception():
+                            raise refresh.exception()
+            except asyncio.CancelledError:
+                raise
+            except ErrorRejectAbortNack as err:
+                reason = str(err.reason)
+                if reason in COV_REFUSED_REASONS:
+                    self.logger.info(
+                        f"{address} refused COV for {key[0]} {key[1]} ({reason}), polling instead"
+                    )
+                    self.refused.add(sub_key)
+                    self.values.pop(sub_key, None)
+                    self._tasks.pop(sub_key, None)
+                    return
+                self.logger.warning(
+                    f"COV subscription for {key[0]} {key[1]} on {address} lost ({reason})"
+                )
+            except Exception as err:
+                self.logger.warning(
+                    f"COV subscription for {key[0]} {key[1]} on {address} failed: {err}"
+                )
+
+            # Serve this object by polling until the subscription is back
+            self.values.pop(sub_key, None)
+            await asyncio.sleep(retry_delay)
+            retry_delay = min(retry_delay * 2, COV_RETRY_MAX)
@@ -1,5 +1,6 @@
 import asyncio
-from typing import ClassVar, List, Mapping, Optional, Sequence, Tuple
+from time import monotonic, time
+from typing import Any, Callable, ClassVar, Dict, List, Mapping, Optional, Sequence, Tuple
 
 from typing_extensions import Self
 from viam.components.sensor import Sensor
@@ -12,7 +13,17 @@ from viam.resource.types import Model, ModelFamily
 from viam.services.discovery import Discovery
 from viam.utils import ValueTypes, dict_to_struct, struct_to_dict
 
-from controller import BacnetController
+from controller import DEFAULT_BINDING, BacnetController
+from discovery_cache import DEFAULT_CACHE_TTL, DiscoveryCache, default_cache_path
+from gateway import BacnetGateway, compact_objects
+from scheduler import (
+    DEFAULT_MAX_OUTSTANDING,
+    DEFAULT_MAX_PER_DEVICE,
+    DEFAULT_MAX_PER_NETWORK,
+    TrafficClass,
+    network_of,
+)
+from sweep import WhoIsSweep
 
 SWITCHABLE_OBJECT_NAMES = [
     "Lighting Level",
@@ -23,6 +34,74 @@ SWITCHABLE_OBJECT_NAMES = [
     "Unoccupied Level",
 ]
 
+# Properties read for each object during discovery, by object type
+DEFAULT_DISCOVERY_PROPERTIES = ["objectName", "objectType"]
+DISCOVERY_PROPERTIES = {
+    "analog-value": ["objectName", "objectType", "units"],
+    "analog-input": ["objectName", "objectType", "units"],
+    "analog-output": ["objectName", "objectType", "units"],
+    "multi-state-value": ["objectName", "objectType", "stateText"],
+    "multi-state-input": ["objectName", "objectType", "stateText"],
+    "multi-state-output": ["objectName", "objectType", "stateText"],
+}
+
+DEFAULT_DEVICE_TIMEOUT = 60
+DEFAULT_RESULTS_LIMIT = 100
+
+# Output modes: a sensor per device plus a switch per switchable object, or a gateway per network
+COMPONENTS_OUTPUT = "components"
+GATEWAY_OUTPUT = "gateway"
+
+
+def component_config_to_dict(config: ComponentConfig) -> Dict:
+    return {
+        "name": config.name,
+        "api": config.api,
+        "model": config.model,
+        "attributes": struct_to_dict(config.attributes),
+    }
+
+
+class DiscoveryJob:
+    """A discovery running in the background, collecting component configs as each device finishes."""
+
+    def __init__(self, job_id: int, full_rescan: bool):
+        self.job_id = job_id
+        self.full_rescan = full_rescan
+        self.state = "running"
+        self.error: Optional[str] = None
+        self.started_at = time()
+        self.finished_at: Optional[float] = None
+        self.devices_found: Optional[int] = None
+        self.devices_done = 0
+        self.failed_devices: List[str] = []
+        self.results: List[Dict] = []
+        self.task: Optional[asyncio.Task] = None
+
+    def add_device(self, configs: List[ComponentConfig]) -> None:
+        self.add_results(configs)
+        self.devices_done += 1
+
+    def add_results(self, configs: List[ComponentConfig]) -> None:
+        self.results.extend(component_config_to_dict(config) for config in configs)
+
+    def add_failed(self, device_name: str) -> None:
+        self.failed_devices.append(device_name)
+        self.devices_done += 1
+
+    def status(self) -> Dict:
+        return {
+            "job_id": self.job_id,
+            "state": self.state,
+            "error": self.error,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "devices_found": self.devices_found,
+            "devices_done": self.devices_done,
+            "failed_devices": list(self.failed_devices),
+            "results": len(self.results),
+        }
+
 
 class DiscoverDevices(Discovery, EasyResource):
     MODEL: ClassVar[Model] = Model(
@@ -30,6 +109,8 @@ class DiscoverDevices(Discovery, EasyResource):
     )
 
     bacnet: BacnetController
+    discovery_cache: DiscoveryCache
+    job: Optional[DiscoveryJob] = None
 
     @classmethod
     def new(
@@ -62,6 +143,7 @@ class DiscoverDevices(Discovery, EasyResource):
         Returns:
             Sequence[str]: A list of implicit dependencies
         """
+        WhoIsSweep.from_attributes(struct_to_dict(config.attributes))
         return [], []
 
     def reconfigure(
@@ -75,9 +157,45 @@ class DiscoverDevices(Discovery, EasyResource):
         """
         attrs = struct_to_dict(config.attributes)
         self.max_query_concurrency = int(attrs.get("max_query_concurrency", 20))
+        self.device_timeout = float(attrs.get("device_timeout", DEFAULT_DEVICE_TIMEOUT))
         self.semaphore = asyncio.Semaphore(self.max_query_concurrency)
-        self.bacnet = BacnetController()
+        self.binding = str(attrs.get("binding", DEFAULT_BINDING))
+        self.sweep = WhoIsSweep.from_attributes(attrs)
+        self.output_mode = str(attrs.get("output_mode", COMPONENTS_OUTPUT))
+        max_components = attrs.get("max_components")
+        self.max_components = int(max_components) if max_components else None
+        default_cache_file = default_cache_path(
+            None if self.binding == DEFAULT_BINDING else self.binding
+        )
+        self.discovery_cache = DiscoveryCache(
+            str(attrs.get("discovery_cache_file", default_cache_file)),
+            float(attrs.get("discovery_cache_ttl", DEFAULT_CACHE_TTL)),
+        )
+        for name, settings in dict(attrs.get("bindings", {})).items():
+            BacnetController(str(name)).configure(dict(settings))
+        self.bacnet = BacnetController(self.binding)
+        self.bacnet.start()
 
+        # Settings left out go back to their defaults, not whatever was configured before
+        scheduler = self.bacnet.scheduler
+        scheduler.max_outstanding = int(
+            attrs.get("max_outstanding_transactions", DEFAULT_MAX_OUTSTANDING)
+        )
+        scheduler.max_per_device = int(
+            attrs.get("max_transactions_per_device", DEFAULT_MAX_PER_DEVICE)
+        )
+        scheduler.max_per_network = int(
+            attrs.get("max_transactions_per_network", DEFAULT_MAX_PER_NETWORK)
+        )
+        trace_file = attrs.get("trace_file")
+        if trace_file and (
+            self.bacnet.recorder is None or self.bacnet.recorder.path != str(trace_file)
+        ):
+            self.bacnet.record(str(trace_file))
+        elif not trace_file:
+            self.bacnet.stop_recording()
+        metrics_port = attrs.get("metrics_port")
+        self.bacnet.metrics_server.serve(int(metrics_port) if metrics_port else None)
         return
 
     async def discover_resources(
@@ -92,66 +210,226 @@ class DiscoverDevices(Discovery, EasyResource):
             return []
 
         configs: List[ComponentConfig] = []
+        full_rescan = bool((extra or {}).get("full_rescan", False))
 
         try:
-            await self.bacnet.client._discover()
-            devices = await self.bacnet.client._devices(_return_list=True)
-            self.logger.debug(
-                f"Discovered the following devices (count: {len(self.bacnet.client.discoveredDevices or {})})"
-            )
-            self.logger.debug(devices)
+            await self.discover(full_rescan, configs.extend)
+        except Exception as err:
+            self.logger.error(f"Error trying to discover devices: {err}")
 
-            queriedDevices = await asyncio.gather(*[
-                self.queryDeviceObjects(device) for device in devices
+        return configs
+
+    async def discover(
+        self,
+        full_rescan: bool,
+        on_device: Callable[[List[ComponentConfig]], None],
+        on_found: Optional[Callable[[int], None]] = None,
+        on_failed: Optional[Callable[[str], None]] = None,
+        on_results: Optional[Callable[[List[ComponentConfig]], None]] = None,
+    ) -> None:
+        """Find every device and query its objects, handing each device's component configs to `on_device` as soon as it is done.
+
+        Devices are found with the configured Who-Is sweep, then named with
+        one read each, all at once up to `max_query_concurrency`.
+        Each device gets `device_timeout` seconds; devices that don't finish in
+        time are reported to `on_failed` and left out rather than holding up
+        the rest. In gateway output mode `on_device` gets no configs; the
+        gateways go to `on_results` (default: `on_device`) once every device
+        is done. No more than `max_components` configs are handed out in all.
+        """
+        client = await self.bacnet.ready()
+        networks = []
+        if self.sweep.broadcasts and not self.sweep.networks:
+            networks = await self.known_networks(client)
+        found = await self.sweep.run(await self.bacnet.app(), networks, self.logger)
+        devices = [
+            device
+            for device in await asyncio.gather(*[
+                self.identifyDevice(devId, i_am, network)
+                for devId, (i_am, network) in found.items()
             ])
+            if device is not None
+        ]
+        self.logger.debug(f"Discovered the following devices (count: {len(devices)})")
+        self.logger.debug(devices)
+        if on_found is not None:
+            on_found(len(devices))
+
+        gateway = self.output_mode == GATEWAY_OUTPUT
+        queried_devices: List[Dict] = []
+        remaining = self.max_components
+        left_out = 0
 
-            self.logger.debug(f"Finished discovery of {len(queriedDevices)} devices")
-            for device in queriedDevices:
-                device_name = f"{device.get('device', 'Unknown').replace(' ', '-')}"
-                device_objects = device.get("objects", [])
-                config = ComponentConfig(
-                    name=device_name,
-                    api=str(Sensor.API),
-                    model="hipsterbrown:lutron-bacnet:lutron-sensor",
+        def capped(configs: List[ComponentConfig]) -> List[ComponentConfig]:
+            nonlocal remaining, left_out
+            if remaining is None:
+                return configs
+            kept = configs[:remaining]
+            remaining -= len(kept)
+            left_out += len(configs) - len(kept)
+            return kept
+
+        async def query(device):
+            deviceName = device[0]
+            try:
+                queried = await asyncio.wait_for(
+                    self.queryDevice(device, full_rescan), self.device_timeout
+                )
+            except asyncio.TimeoutError:
+                self.logger.warning(
+                    f"Gave up on {deviceName} after {self.device_timeout} seconds"
+                )
+                if on_failed is not None:
+                    on_failed(str(deviceName))
+                return
+            if gateway:
+                queried_devices.append(queried)
+                on_device([])
+            else:
+                on_device(capped(self.deviceConfigs(queried)))
+
+        await asyncio.gather(*[query(device) for device in devices])
+        if gateway:
+            (on_results or on_device)(capped(self.gatewayConfigs(queried_devices)))
+        if left_out:
+            self.logger.warning(
+                f"Left out {left_out} components over max_components ({self.max_components})"
+            )
+        try:
+            self.discovery_cache.save()
+        except OSError as err:
+            self.logger.warning(f"Unable to save discovery cache: {err}")
+        self.logger.debug(f"Finished discovery of {len(devices)} devices")
+
+    async def known_networks(self, client) -> List[int]:
+        """The network numbers to sweep: our own, if a router told us, and every network a router can reach."""
+        networks = set(client.this_application._learnedNetworks)
+        this_network = await client.what_is_network_number()
+        if this_network:
+            networks.add(int(this_network))
+        routers = await client.whois_router_to_network()
+        if not routers:
+            routers = await client.whois_router_to_network(global_broadcast=True)
+        for _adapter, i_am_router in routers:
+            networks.update(int(network) for network in i_am_router.iartnNetworkList)
+        client.this_application._learnedNetworks.update(networks)
+        self.logger.debug(f"Sweeping networks {sorted(networks)}")
+        return sorted(networks)
+
+    async def identifyDevice(self, devId: int, i_am, network: Optional[int]):
+        """Read the name and vendor of a device that answered the sweep, or None if it doesn't answer."""
+        device_address = i_am.pduSource
+        key = ("device", str(devId))
+        async with self.semaphore:
+            details = await self.bacnet.read_properties(
+                str(device_address),
+                [(key, ["objectName", "vendorName"])],
+                TrafficClass.DISCOVERY,
+            )
+        properties = details.get(key, {})
+        if "objectName" not in properties:
+            self.logger.warning(f"No response from device {devId} at {device_address}")
+            return None
+        return (
+            str(properties["objectName"]),
+            str(properties.get("vendorName", "unknown")),
+            devId,
+            device_address,
+            {network},
+        )
+
+    def _binding_attributes(self) -> Dict[str, Any]:
+        """The `binding` and `binding_settings` attributes for generated components, left out for the default binding."""
+        if self.binding == DEFAULT_BINDING:
+            return {}
+        attributes: Dict[str, Any] = {"binding": self.binding}
+        if self.bacnet.settings is not None:
+            attributes["binding_settings"] = dict(self.bacnet.settings)
+        return attributes
+
+    def deviceConfigs(self, device) -> List[ComponentConfig]:
+        device_name = f"{device.get('device', 'Unknown').replace(' ', '-')}"
+        device_objects = device.get("objects", [])
+        configs = [
+            ComponentConfig(
+                name=device_name,
+                api=str(Sensor.API),
+                model="hipsterbrown:lutron-bacnet:lutron-sensor",
+                attributes=dict_to_struct({
+                    "address": device.get("address", "-"),
+                    "vendor": device.get("vendor", "-"),
+                    "objects": device_objects,
+                    **self._binding_attributes(),
+                }),
+            )
+        ]
+
+        for obj in list(
+            filter(
+                lambda o: (o.get("name") in SWITCHABLE_OBJECT_NAMES),
+                device_objects,
+            )
+        ):
+            obj_name = obj.get("name", "-")
+            configs.append(
+                ComponentConfig(
+                    name=f"{obj_name.replace(' ', '-')}-{device_name}",
+                    api=str(Switch.API),
+                    model="hipsterbrown:lutron-bacnet:lutron-switch",
                     attributes=dict_to_struct({
                         "address": device.get("address", "-"),
-                        "vendor": device.get("vendor", "-"),
-                        "objects": device_objects,
+                        "propAddress": obj.get("address", "-"),
+                        "propType": obj.get("type", "-"),
+                        "propName": obj_name,
+                        **self._binding_attributes(),
                     }),
                 )
-                configs.append(config)
-
-                for obj in list(
-                    filter(
-                        lambda o: (o.get("name") in SWITCHABLE_OBJECT_NAMES),
-                        device_objects,
-                    )
-                ):
-                    obj_name = obj.get("name", "-")
-                    configs.append(
-                        ComponentConfig(
-                            name=f"{obj_name.replace(' ', '-')}-{device_name}",
-                            api=str(Switch.API),
-                            model="hipsterbrown:lutron-bacnet:lutron-switch",
-                            attributes=dict_to_struct({
-                                "address": device.get("address", "-"),
-                                "propAddress": obj.get("address", "-"),
-                                "propType": obj.get("type", "-"),
-                                "propName": obj_name,
-                            }),
-                        )
-                    )
-        except Exception as err:
-            self.logger.error(f"Error trying to discover devices: {err}")
-
+            )
         return configs
 
+    def gatewayConfigs(self, devices: List[Dict]) -> List[ComponentConfig]:
+        """One gateway config per BACnet network, holding every device on it as a compact table."""
+        networks: Dict[str, Dict[str, Dict]] = {}
+        for device in devices:
+            address = str(device.get("address", "-"))
+            network = network_of(address)
+            table = networks.setdefault(network, {})
+            name = str(device.get("device", "Unknown")).replace(" ", "-")
+            if name in table:
+                name = f"{name}-{address}"
+            table[name] = {
+                "name": name,
+                "address": address,
+                "vendor": device.get("vendor", "-"),
+                "objects": compact_objects(device.get("objects", [])),
+            }
+
+        suffix = "" if self.binding == DEFAULT_BINDING else f"-{self.binding}"
+        return [
+            ComponentConfig(
+                name=f"lutron-gateway-{network}{suffix}",
+                api=str(Sensor.API),
+                model=str(BacnetGateway.MODEL),
+                attributes=dict_to_struct({
+                    "network": network,
+                    "devices": list(table.values()),
+                    **self._binding_attributes(),
+                }),
+            )
+            for network, table in sorted(networks.items())
+        ]
+
     async def queryObjectDetails(self, deviceAddress, deviceObject):
         obj_type, obj_address = deviceObject
-        baseQuery = f"{deviceAddress} {obj_type} {obj_address}"
         try:
             async with self.semaphore:
-                objectName = await self.bacnet.client.read(f"{baseQuery} objectName")
+                objectName = await self.bacnet.read_property(
+                    str(deviceAddress),
+                    obj_type,
+                    obj_address,
+                    "objectName",
+                    TrafficClass.DISCOVERY,
+                )
                 return {
                     "name": str(objectName),
                     "address": str(obj_address),
@@ -167,19 +445,121 @@ class DiscoverDevices(Discovery, EasyResource):
                 "address": str(obj_address),
             }
 
-    async def queryDeviceObjects(self, device):
-        deviceName, vendorName, devId, device_address, _network_number = device
+    async def queryObjectsDetails(self, deviceAddress, deviceObjects):
+        """Read the details of all of a device's objects in as few ReadPropertyMultiple requests as possible.
+
+        Objects the batched read couldn't name, including every object of a
+        device that doesn't support ReadPropertyMultiple, are queried one at a
+        time instead.
+        """
+        address = str(deviceAddress)
+        keys = [
+            (str(obj_type), str(obj_address)) for obj_type, obj_address in deviceObjects
+        ]
+        details = {}
+        if self.bacnet.supports_rpm(address):
+            async with self.semaphore:
+                details = await self.bacnet.read_properties(
+                    address,
+                    [
+                        (key, DISCOVERY_PROPERTIES.get(key[0], DEFAULT_DISCOVERY_PROPERTIES))
+                        for key in keys
+                    ],
+                    TrafficClass.DISCOVERY,
+                )
+
         objects = []
+        fallback = []
+        for index, (key, deviceObject) in enumerate(zip(keys, deviceObjects)):
+            properties = details.get(key, {})
+            if "objectName" not in properties:
+                fallback.append((index, deviceObject))
+                objects.append({})
+                continue
+            obj = {
+                "name": str(properties["objectName"]),
+                "address": key[1],
+                "type": str(properties.get("objectType", key[0])),
+            }
+            if "units" in properties:
+                obj["units"] = str(properties["units"])
+            if "stateText" in properties:
+                obj["stateText"] = [str(text) for text in properties["stateText"]]
+            objects.append(obj)
+
+        fallbackObjects = await asyncio.gather(*[
+            self.queryObjectDetails(deviceAddress, deviceObject)
+            for _index, deviceObject in fallback
+        ])
+        for (index, _deviceObject), obj in zip(fallback, fallbackObjects):
+            objects[index] = obj
+        return objects
+
+    async def queryDevice(self, device, full_rescan: bool = False):
+        """Query a device's objects, reusing the cached result if the device hasn't changed since it was cached."""
+        deviceName, _vendorName, devId, device_address, _network_number = device
+        cached = None if full_rescan else self.discovery_cache.get(devId)
+        if cached is not None and cached["device"].get("address") != str(device_address):
+            cached = None
+
+        revision = await self.readDeviceProperty(device, "databaseRevision")
+        if cached is not None and revision is not None:
+            if revision == cached.get("revision"):
+                self.logger.debug(f"{deviceName} unchanged since last discovery")
+                return cached["device"]
+            cached = None
+
+        objectList = await self.readDeviceProperty(device, "objectList")
+        objectListEntry = (
+            [[str(obj_type), int(obj_address)] for obj_type, obj_address in objectList]
+            if objectList is not None
+            else None
+        )
+        if cached is not None and objectListEntry in (None, cached.get("objectList")):
+            self.logger.debug(f"{deviceName} object list unchanged since last discovery")
+            return cached["device"]
+
+        result = await self.queryDeviceObjects(device, objectList)
+        if objectListEntry is not None:
+            self.discovery_cache.put(
+                devId,
+                result,
+                int(revision) if revision is not None else None,
+                objectListEntry,
+            )
+        return result
+
+    async def readDeviceProperty(self, device, prop: str):
+        _deviceName, _vendorName, devId, device_address, _network_number = device
         try:
-            objectList = await self.bacnet.client.read(
-                f"{device_address} device {devId} objectList"
+            return await self.bacnet.read_property(
+                str(device_address), "device", devId, prop, TrafficClass.DISCOVERY
             )
+        except Exception as readErr:
+            self.logger.debug(f"Unable to read {prop} of device {devId}: {readErr}")
+            return None
+
+    async def queryDeviceObjects(self, device, objectList=None):
+        deviceName, vendorName, devId, device_address, _network_number = device
+        objects = []
+        try:
+            if objectList is None:
+                objectList = await self.bacnet.read_property(
+                    str(device_address),
+                    "device",
+                    devId,
+                    "objectList",
+                    TrafficClass.DISCOVERY,
+                )
             if objectList is not None:
-                objects = await asyncio.gather(*[
-                    self.queryObjectDetails(device_address, deviceObject)
-                    for deviceObject in objectList
-                    if str(deviceObject[0]) != "device"
-                ])
+                objects = await self.queryObjectsDetails(
+                    device_address,
+                    [
+                        deviceObject
+                        for deviceObject in objectList
+                        if str(deviceObject[0]) != "device"
+                    ],
+                )
         except Exception as err:
             self.logger.error(f"Error reading {deviceName}: {err}")
         return {
@@ -196,8 +576,166 @@ class DiscoverDevices(Discovery, EasyResource):
         timeout: Optional[float] = None,
         **kwargs,
     ) -> Mapping[str, ValueTypes]:
-        raise NotImplementedError()
+        result = {key: False for key in command.keys()}
+        for name, args in command.items():
+            args = dict(args) if isinstance(args, Mapping) else {}
+            if name == "start_discovery":
+                result[name] = self.start_discovery(bool(args.get("full_rescan", False)))
+            elif name == "discovery_status":
+                result[name] = self.job.status() if self.job else None
+            elif name == "discovery_results":
+                result[name] = self.discovery_results(
+                    int(args.get("offset", 0)),
+                    int(args.get("limit", DEFAULT_RESULTS_LIMIT)),
+                )
+            elif name == "write_area":
+                targets = args.get("targets")
+                names = args.get("names")
+                result[name] = await self.write_area(
+                    [dict(target) for target in targets] if targets is not None else None,
+                    [str(obj_name) for obj_name in names] if names is not None else None,
+                    args.get("value"),
+                    int(args.get("priority", 16)),
+                )
+            elif name == "start_recording":
+                self.bacnet.record(str(args["path"]))
+                result[name] = self.bacnet.recorder.status()
+            elif name == "stop_recording":
+                result[name] = self.bacnet.stop_recording()
+            elif name == "get_stats":
+                result[name] = self.bacnet.stats()
+            elif name == "reset_stats":
+                self.bacnet.reset_stats()
+                result[name] = True
+            else:
+                self.logger.warning(f"Unknown command '{name}'")
+        return result
+
+    async def write_area(
+        self,
+        targets: Optional[List[Dict]],
+        names: Optional[List[str]],
+        value: Any,
+        priority: int = 16,
+    ) -> Dict:
+        """Write a value to many objects across many devices at once, e.g. to turn off a floor.
+
+        Each target is a device `address` with the `objects` to write, given by
+        `type` and `address` or by `name`, each optionally with its own
+        `value` and `priority`. Targets without `objects` write every object
+        named in `names`; without `targets`, that is every device in the
+        discovery cache. Names are looked up in the discovery cache. Each
+        device gets its writes together in WritePropertyMultiple requests,
+        all devices at once within the controller's per-network and
+        module-wide transaction caps.
+        """
+        started = monotonic()
+        known = {
+            entry["device"].get("address"): entry["device"].get("objects", [])
+            for entry in self.discovery_cache.entries.values()
+            if "device" in entry
+        }
+        if targets is None:
+            targets = [{"address": address} for address in known]
+
+        results: List[Dict] = []
+        writes = []
+        for target in targets:
+            device = str(target.get("address"))
+            objects = target.get("objects")
+            if objects is None:
+                if names is None:
+                    results.append({"device": device, "success": False, "error": "no objects"})
+                    continue
+                objects = [obj for obj in known.get(device, []) if obj.get("name") in names]
+            for obj in objects:
+                obj = dict(obj)
+                if "type" not in obj or "address" not in obj:
+                    matches = [
+                        known_obj
+                        for known_obj in known.get(device, [])
+                        if known_obj.get("name") == obj.get("name")
+                    ]
+                    if not matches:
+                        results.append(
+                            {"device": device, **obj, "success": False, "error": "unknown object"}
+                        )
+                        continue
+                    obj = matches[0] | obj
+                results.append({
+                    "device": device,
+                    "name": obj.get("name"),
+                    "type": str(obj["type"]),
+                    "address": str(obj["address"]),
+                })
+                writes.append((
+                    len(results) - 1,
+                    (
+                        device,
+                        (str(obj["type"]), str(obj["address"])),
+                        obj.get("value", value),
+                        obj.get("priority", priority),
+                    ),
+                ))
+
+        outcomes = await self.bacnet.write_many([write for _index, write in writes])
+        for (index, _write), outcome in zip(writes, outcomes):
+            results[index] |= outcome
+        succeeded = sum(1 for entry in results if entry["success"])
+        return {
+            "results": results,
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "seconds": monotonic() - started,
+        }
+
+    def start_discovery(self, full_rescan: bool = False) -> Dict:
+        """Start a background discovery, or report on the one already running."""
+        if self.job is not None and self.job.state == "running":
+            return self.job.status()
+
+        job = DiscoveryJob((self.job.job_id + 1) if self.job else 1, full_rescan)
+        self.job = job
+        job.task = asyncio.create_task(self._run_job(job))
+        return job.status()
+
+    async def _run_job(self, job: DiscoveryJob) -> None:
+        def on_found(count: int):
+            job.devices_found = count
+
+        try:
+            await self.discover(
+                job.full_rescan, job.add_device, on_found, job.add_failed, job.add_results
+            )
+            job.state = "done"
+        except asyncio.CancelledError:
+            job.state = "cancelled"
+            raise
+        except Exception as err:
+            self.logger.error(f"Error trying to discover devices: {err}")
+            job.state = "failed"
+            job.error = str(err)
+        finally:
+            job.finished_at = time()
+
+    def discovery_results(self, offset: int, limit: int) -> Dict:
+        """A page of the component configs found so far by the latest discovery job."""
+        if self.job is None:
+            return {"state": None, "total": 0, "results": [], "next_offset": None}
+        results = self.job.results[offset : offset + limit]
+        next_offset = offset + len(results)
+        return {
+            "state": self.job.state,
+            "total": len(self.job.results),
+            "results": results,
+            "next_offset": next_offset
+            if next_offset < len(self.job.results) or self.job.state == "running"
+            else None,
+        }
 
     async def close(self):
+        if self.job is not None and self.job.task is not None:
+            self.job.task.cancel()
         if self.bacnet:
+            self.bacnet.metrics_server.close()
             del self.bacnet
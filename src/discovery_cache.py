@@ -0,0 +1,73 @@
+import json
+import os
+from tempfile import gettempdir
+from time import time
+from typing import Dict, List, Optional
+
+DEFAULT_CACHE_TTL = 24 * 60 * 60
+CACHE_FILE_NAME = "lutron-bacnet-discovery.json"
+
+
+def default_cache_path(binding: Optional[str] = None) -> str:
+    """A discovery cache file in the module's data directory, if Viam provided one, with one file per named binding."""
+    file_name = CACHE_FILE_NAME
+    if binding:
+        stem, extension = os.path.splitext(CACHE_FILE_NAME)
+        file_name = f"{stem}-{binding}{extension}"
+    return os.path.join(
+        os.environ.get("VIAM_MODULE_DATA", gettempdir()), file_name
+    )
+
+
+class DiscoveryCache:
+    """Discovered devices persisted to a JSON file, keyed by device instance.
+
+    Each entry keeps the device's databaseRevision and objectList at the time it
+    was queried so later discoveries can tell whether anything changed without
+    reading every object again.
+    """
+
+    def __init__(self, file_path: str, ttl: float = DEFAULT_CACHE_TTL):
+        self.file_path = file_path
+        self.ttl = ttl
+        self.entries: Dict[str, Dict] = {}
+        self.load()
+
+    def load(self) -> None:
+        try:
+            with open(self.file_path) as cache_file:
+                self.entries = dict(json.load(cache_file).get("devices", {}))
+        except FileNotFoundError:
+            self.entries = {}
+        except (OSError, ValueError, AttributeError):
+            self.entries = {}
+
+    def save(self) -> None:
+        temp_path = f"{self.file_path}.tmp"
+        with open(temp_path, "w") as cache_file:
+            json.dump({"devices": self.entries}, cache_file)
+        os.replace(temp_path, self.file_path)
+
+    def get(self, device_instance: int) -> Optional[Dict]:
+        """The cached entry for a device, unless it is missing or older than the TTL."""
+        entry = self.entries.get(str(device_instance))
+        if entry is None or time() - entry.get("updated", 0) > self.ttl:
+            return None
+        return entry
+
+    def put(
+        self,
+        device_instance: int,
+        device: Dict,
+        revision: Optional[int],
+        object_list: Optional[List[List]],
+    ) -> None:
+        self.entries[str(device_instance)] = {
+            "updated": time(),
+            "revision": revision,
+            "objectList": object_list,
+            "device": device,
+        }
+
+    def clear(self) -> None:
+        self.entries = {}
@@ -0,0 +1,242 @@
+import asyncio
+from typing import Any, ClassVar, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from typing_extensions import Self
+from viam.components.sensor import Sensor
+from viam.proto.app.robot import ComponentConfig
+from viam.proto.common import ResourceName
+from viam.resource.base import ResourceBase
+from viam.resource.easy_resource import EasyResource
+from viam.resource.types import Model, ModelFamily
+from viam.utils import SensorReading, ValueTypes, from_dm_from_extra, struct_to_dict
+from controller import BacnetController, binding_controller, validate_binding
+from plan import DevicePlan
+from scheduler import TrafficClass
+from utils import parse_max_age
+
+
+def compact_objects(objects: Sequence[Dict]) -> List[List[str]]:
+    """A device's discovered objects as `[type, address, name]` rows."""
+    return [
+        [str(obj.get("type")), str(obj.get("address")), str(obj.get("name", ""))]
+        for obj in objects
+    ]
+
+
+def expand_objects(rows: Sequence[Sequence]) -> List[Dict[str, str]]:
+    """The object configs of `[type, address, name]` rows, as a sensor's `objects` attribute."""
+    return [
+        {"type": str(row[0]), "address": str(row[1]), "name": str(row[2])}
+        for row in rows
+    ]
+
+
+class BacnetGateway(Sensor, EasyResource):
+    """Every device on one BACnet network as a single resource.
+
+    Large sites produce thousands of sensor and switch components, one per
+    device and switchable object, which bloats the machine config and slows
+    every reconfigure. A gateway instead holds a compact table of its
+    devices and their objects, returns readings keyed by device name and
+    reads and writes any device's objects through DoCommand.
+    """
+
+    MODEL: ClassVar[Model] = Model(
+        ModelFamily("hipsterbrown", "lutron-bacnet"), "lutron-gateway"
+    )
+
+    bacnet: BacnetController
+
+    @classmethod
+    def new(
+        cls, config: ComponentConfig, dependencies: Mapping[ResourceName, ResourceBase]
+    ) -> Self:
+        """This method creates a new instance of this Generic service.
+        The default implementation sets the name from the `config` parameter and then calls `reconfigure`.
+
+        Args:
+            config (ComponentConfig): The configuration for this resource
+            dependencies (Mapping[ResourceName, ResourceBase]): The dependencies (both implicit and explicit)
+
+        Returns:
+            Self: The resource
+        """
+        self = super().new(config, dependencies)
+        self.reconfigure(config, dependencies)
+        return self
+
+    @classmethod
+    def validate_config(
+        cls, config: ComponentConfig
+    ) -> Tuple[Sequence[str], Sequence[str]]:
+        """This method allows you to validate the configuration object received from the machine,
+        as well as to return any implicit dependencies based on that `config`.
+
+        Args:
+            config (ComponentConfig): The configuration for this resource
+
+        Returns:
+            Sequence[str]: A list of implicit dependencies
+        """
+        validate_binding(struct_to_dict(config.attributes))
+        return [], []
+
+    def reconfigure(
+        self, config: ComponentConfig, dependencies: Mapping[ResourceName, ResourceBase]
+    ):
+        """This method allows you to dynamically update your service when it receives a new `config` object.
+
+        Args:
+            config (ComponentConfig): The new configuration
+            dependencies (Mapping[ResourceName, ResourceBase]): Any dependencies (both implicit and explicit)
+        """
+        attrs = struct_to_dict(config.attributes)
+        self._unwatch()
+        self.network = str(attrs.get("network", ""))
+        self.devices: Dict[str, Dict[str, Any]] = {}
+        self.plans: Dict[str, DevicePlan] = {}
+        for device in attrs.get("devices", []):
+            name = str(device.get("name", device.get("address")))
+            address = str(device.get("address", "0:0x00"))
+            self.devices[name] = {"address": address, "vendor": device.get("vendor", "-")}
+            self.plans[name] = DevicePlan(address, expand_objects(device.get("objects", [])))
+        self.cache_max_age = parse_max_age(attrs.get("cache_max_age"))
+        self.poll_interval = float(attrs.get("poll_interval", 0))
+        self.bacnet = binding_controller(attrs)
+        self.binding = self.bacnet.binding
+        self.bacnet.start()
+        if self.poll_interval:
+            for plan in self.plans.values():
+                self.bacnet.pollers.watch(plan.address, plan.keys, self.poll_interval)
+        self.logger.info(f"Serving {len(self.plans)} devices on network {self.network}")
+        return
+
+    def _unwatch(self):
+        if not getattr(self, "bacnet", None):
+            return
+        if getattr(self, "poll_interval", None):
+            for plan in self.plans.values():
+                self.bacnet.pollers.unwatch(plan.address, plan.keys, self.poll_interval)
+
+    def _plan(self, device: Any) -> DevicePlan:
+        plan = self.plans.get(str(device))
+        if plan is None:
+            raise KeyError(f"unknown device '{device}'")
+        return plan
+
+    async def read_device(
+        self,
+        device: str,
+        names: Optional[Sequence[str]] = None,
+        fresh: bool = False,
+        traffic_class: TrafficClass = TrafficClass.INTERACTIVE,
+    ) -> Dict[str, Any]:
+        """The present value of each named object (default: all) of a device, by object name."""
+        plan = self._plan(device)
+        objects = [obj for obj in plan.objects if names is None or obj.name in names]
+        values = await self.bacnet.read_multiple(
+            plan.address,
+            [obj.key for obj in objects],
+            max_age=None if fresh else self.cache_max_age,
+            traffic_class=traffic_class,
+        )
+        readings = {}
+        for obj in objects:
+            value = values.get(obj.key)
+            readings[obj.config["name"]] = "N/A" if value is None else value
+        return readings
+
+    async def get_readings(
+        self,
+        *,
+        extra: Optional[Mapping[str, Any]] = None,
+        timeout: Optional[float] = None,
+        **kwargs,
+    ) -> Mapping[str, SensorReading]:
+        fresh = bool((extra or {}).get("fresh", False))
+        devices = (extra or {}).get("devices")
+        names = [str(name) for name in devices] if devices else list(self.plans)
+        traffic_class = (
+            TrafficClass.POLL
+            if from_dm_from_extra(dict(extra or {}))
+            else TrafficClass.INTERACTIVE
+        )
+        readings = await asyncio.gather(
+            *[self.read_device(name, fresh=fresh, traffic_class=traffic_class) for name in names],
+            return_exceptions=True,
+        )
+        result = {}
+        for name, reading in zip(names, readings):
+            if isinstance(reading, Exception):
+                self.logger.error(f"Unable to read {name}: {reading}")
+                continue
+            result[name] = reading
+        return result
+
+    async def update_many(self, entries: List[Dict]) -> List[Dict]:
+        """Write several objects, on any of the gateway's devices, each device's writes together."""
+        results: List[Dict] = []
+        writes = []
+        for entry in entries:
+            plan = self.plans.get(str(entry.get("device")))
+            if plan is None:
+                results.append(entry | {"success": False, "error": "unknown device"})
+                continue
+            try:
+                obj = plan.find(entry)
+            except IndexError:
+                results.append(entry | {"success": False, "error": "unknown object"})
+                continue
+            except Exception as lookupErr:
+                results.append(entry | {"success": False, "error": str(lookupErr)})
+                continue
+            results.append(entry)
+            writes.append((
+                len(results) - 1,
+                (plan.address, obj.key, entry.get("value"), entry.get("priority", 16)),
+            ))
+
+        outcomes = await self.bacnet.write_many([write for _index, write in writes])
+        for (index, _write), outcome in zip(writes, outcomes):
+            results[index] |= outcome
+        return results
+
+    async def do_command(
+        self,
+        command: Mapping[str, ValueTypes],
+        *,
+        timeout: Optional[float] = None,
+        **kwargs,
+    ) -> Mapping[str, ValueTypes]:
+        result = {key: False for key in command.keys()}
+        for name, args in command.items():
+            args = dict(args) if isinstance(args, Mapping) else args
+            if name == "devices":
+                result[name] = {
+                    device: info | {"objects": len(self.plans[device].objects)}
+                    for device, info in self.devices.items()
+                }
+            elif name == "read":
+                objects = args.get("objects")
+                result[name] = await self.read_device(
+                    str(args.get("device")),
+                    [str(obj) for obj in objects] if objects else None,
+                    bool(args.get("fresh", False)),
+                )
+            elif name == "update":
+                result[name] = (await self.update_many([args]))[0]["success"]
+            elif name == "update_many":
+                result[name] = await self.update_many([dict(entry) for entry in args])
+            elif name == "get_stats":
+                result[name] = self.bacnet.stats()
+            elif name == "reset_stats":
+                self.bacnet.reset_stats()
+                result[name] = True
+            else:
+                self.logger.warning(f"Unknown command '{name}'")
+        return result
+
+    async def close(self):
+        self._unwatch()
+        if self.bacnet:
+            del self.bacnet
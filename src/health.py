@@ -0,0 +1,146 @@
+from time import monotonic
+from typing import Dict, Optional
+
+# Request timeouts are derived from each device's round-trip times the way TCP
+# derives its retransmission timeout: smoothed RTT plus four deviations,
+# kept within these bounds. Devices we have never heard from get the maximum.
+MIN_REQUEST_TIMEOUT = 2.0
+MAX_REQUEST_TIMEOUT = 10.0
+RTT_GAIN = 0.125
+RTT_VARIANCE_GAIN = 0.25
+
+# Consecutive timeouts before a device's circuit opens, and how long to wait
+# before letting a single probe request through to see if it is back
+FAILURE_THRESHOLD = 3
+PROBE_BACKOFF_MIN = 5.0
+PROBE_BACKOFF_MAX = 300.0
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class DeviceUnavailable(Exception):
+    """Raised instead of sending a request to a device whose circuit is open."""
+
+    def __init__(self, address: str):
+        super().__init__(f"{address} is not responding; skipping request")
+        self.address = address
+
+
+class DeviceHealth:
+    """Round-trip times and circuit state for one device."""
+
+    def __init__(self):
+        self.state = CLOSED
+        self.srtt: Optional[float] = None
+        self.rttvar = 0.0
+        self.failures = 0
+        self.backoff = PROBE_BACKOFF_MIN
+        self.retry_at = 0.0
+        self.probing = False
+
+    @property
+    def timeout(self) -> float:
+        if self.srtt is None:
+            return MAX_REQUEST_TIMEOUT
+        return max(
+            MIN_REQUEST_TIMEOUT,
+            min(MAX_REQUEST_TIMEOUT, self.srtt + 4 * self.rttvar),
+        )
+
+    def observe(self, rtt: float) -> None:
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar += RTT_VARIANCE_GAIN * (abs(self.srtt - rtt) - self.rttvar)
+            self.srtt += RTT_GAIN * (rtt - self.srtt)
+
+    def snapshot(self) -> Dict:
+        return {
+            "state": self.state,
+            "rtt": self.srtt,
+            "timeout": self.timeout,
+            "failures": self.failures,
+            "retry_in": max(0.0, self.retry_at - monotonic()) if self.state != CLOSED else 0.0,
+        }
+
+
+class CircuitBreakers:
+    """Per-device circuit breakers that stop requests to devices that stopped answering.
+
+    A device's circuit opens after `failure_threshold` consecutive timeouts.
+    While it is open, requests fail immediately with DeviceUnavailable. Once
+    the backoff has passed, one request is let through as a probe: if it gets
+    any answer the circuit closes, otherwise it opens again for twice as
+    long. Errors, rejects and aborts count as answers; only silence counts
+    against a device.
+    """
+
+    def __init__(self, failure_threshold: int = FAILURE_THRESHOLD):
+        self.failure_threshold = failure_threshold
+        self.devices: Dict[str, DeviceHealth] = {}
+
+    def _device(self, address: str) -> DeviceHealth:
+        health = self.devices.get(address)
+        if health is None:
+            health = self.devices[address] = DeviceHealth()
+        return health
+
+    def timeout(self, address: str) -> float:
+        return self._device(address).timeout
+
+    def available(self, address: str) -> bool:
+        """Whether a request to the device would be let through right now, without claiming the probe."""
+        health = self.devices.get(address)
+        if health is None or health.state == CLOSED:
+            return True
+        return not health.probing and monotonic() >= health.retry_at
+
+    def allow(self, address: str) -> bool:
+        """Whether to send a request to the device; claims the probe if the device is due one."""
+        health = self._device(address)
+        if health.state == CLOSED:
+            return True
+        if health.probing or monotonic() < health.retry_at:
+            return False
+        health.state = HALF_OPEN
+        health.probing = True
+        return True
+
+    def probing(self, address: str) -> bool:
+        """Whether the device's probe is out; right after `allow`, whether that request is the probe."""
+        return self._device(address).probing
+
+    def succeeded(self, address: str, rtt: float) -> None:
+        health = self._device(address)
+        health.observe(rtt)
+        health.state = CLOSED
+        health.failures = 0
+        health.backoff = PROBE_BACKOFF_MIN
+        health.probing = False
+
+    def failed(self, address: str) -> None:
+        health = self._device(address)
+        health.failures += 1
+        if health.state == HALF_OPEN:
+            health.backoff = min(PROBE_BACKOFF_MAX, health.backoff * 2)
+            self._open(health)
+        elif health.state == CLOSED and health.failures >= self.failure_threshold:
+            self._open(health)
+
+    def abandoned(self, address: str) -> None:
+        """The probe was cancelled before it got an answer; let another request probe instead."""
+        health = self._device(address)
+        if health.state == HALF_OPEN and health.probing:
+            health.probing = False
+            health.state = OPEN
+
+    def _open(self, health: DeviceHealth) -> None:
+        health.state = OPEN
+        health.probing = False
+        health.retry_at = monotonic() + health.backoff
+
+    def snapshot(self) -> Dict[str, Dict]:
+        return {address: health.snapshot() for address, health in self.devices.items()}
@@ -2,8 +2,19 @@ import asyncio
 from viam.module.module import Module
 import button as _button
 import discovery as _discovery
+import gateway as _gateway
 import sensor as _sensor
 import switch as _switch
+from controller import BacnetController
+
+
+async def main():
+    try:
+        await Module.run_from_registry()
+    finally:
+        # The module owns the BACnet stack; resources closing never stop it
+        await BacnetController.shutdown()
+
 
 if __name__ == "__main__":
-    asyncio.run(Module.run_from_registry())
+    asyncio.run(main())
@@ -0,0 +1,262 @@
+import asyncio
+from bisect import bisect_left
+from contextlib import asynccontextmanager
+from logging import Logger
+from time import monotonic
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from bacpypes3.apdu import ErrorRejectAbortNack
+
+# Upper bounds, in seconds, of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_PREFIX = "lutron_bacnet"
+
+
+class Histogram:
+    """Counts of observed values in fixed buckets, plus their total and maximum."""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, fraction: float) -> float:
+        """An upper bound on the given quantile: the bucket boundary it falls under."""
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self) -> Dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "buckets": {
+                **{str(bound): count for bound, count in zip(self.buckets, self.counts)},
+                "+Inf": self.counts[-1],
+            },
+        }
+
+
+class ControllerMetrics:
+    """What the controller's BACnet traffic looks like: latency, failures, retries, in-flight requests and bytes.
+
+    Latencies are per device and per operation (e.g. "readPropertyMultiple")
+    and only cover the time on the wire, not time spent waiting for a
+    scheduler slot. `classify` names the kind of failure for an exception,
+    e.g. "timeout", "reject", "abort" or "error".
+    """
+
+    def __init__(self, classify: Callable[[BaseException], str]):
+        self.classify = classify
+        self.reset()
+
+    def reset(self) -> None:
+        self.started_at = monotonic()
+        self.latency: Dict[Tuple[str, str], Histogram] = {}
+        self.failures: Dict[Tuple[str, str, str], int] = {}
+        self.retries: Dict[Tuple[str, str], int] = {}
+        self.in_flight: Dict[str, int] = {}
+        self.bytes = {"sent": 0, "received": 0}
+        self.packets = {"sent": 0, "received": 0}
+
+    @asynccontextmanager
+    async def track(self, address: str, operation: str):
+        """Time one request to `address`, counting it as in flight until it finishes."""
+        self.in_flight[operation] = self.in_flight.get(operation, 0) + 1
+        started = monotonic()
+        try:
+            yield
+        except (Exception, ErrorRejectAbortNack) as err:
+            failure = (address, operation, self.classify(err))
+            self.failures[failure] = self.failures.get(failure, 0) + 1
+            raise
+        finally:
+            self.in_flight[operation] -= 1
+            key = (address, operation)
+            histogram = self.latency.get(key)
+            if histogram is None:
+                histogram = self.latency[key] = Histogram()
+            histogram.observe(monotonic() - started)
+
+    def retry(self, address: str, operation: str, count: int = 1) -> None:
+        """Count requests sent again, split up or sent another way after `operation` failed."""
+        key = (address, operation)
+        self.retries[key] = self.retries.get(key, 0) + count
+
+    def tap(self, app) -> None:
+        """Count the bytes and packets passing through the app's BACnet/IP sockets."""
+        for link_layer in getattr(app, "link_layers", {}).values():
+            server = getattr(link_layer, "server", None)
+            if server is None or getattr(server, "_metrics_tapped", False):
+                continue
+            send, receive = server.indication, server.confirmation
+
+            async def counted_send(pdu, send=send):
+                self.packets["sent"] += 1
+                self.bytes["sent"] += len(pdu.pduData)
+                await send(pdu)
+
+            async def counted_receive(pdu, receive=receive):
+                self.packets["received"] += 1
+                self.bytes["received"] += len(pdu.pduData)
+                await receive(pdu)
+
+            server.indication = counted_send
+            server.confirmation = counted_receive
+            server._metrics_tapped = True
+
+    def snapshot(self) -> Dict:
+        devices: Dict[str, Dict] = {}
+        for (address, operation), histogram in self.latency.items():
+            device = devices.setdefault(address, {})
+            device.setdefault(operation, {})["latency"] = histogram.snapshot()
+        for (address, operation, kind), count in self.failures.items():
+            entry = devices.setdefault(address, {}).setdefault(operation, {})
+            entry.setdefault("failures", {})[kind] = count
+        for (address, operation), count in self.retries.items():
+            devices.setdefault(address, {}).setdefault(operation, {})["retries"] = count
+
+        operations: Dict[str, Histogram] = {}
+        for (_address, operation), histogram in self.latency.items():
+            total = operations.get(operation)
+            if total is None:
+                total = operations[operation] = Histogram(histogram.buckets)
+            total.counts = [a + b for a, b in zip(total.counts, histogram.counts)]
+            total.count += histogram.count
+            total.sum += histogram.sum
+            total.max = max(total.max, histogram.max)
+
+        failures: Dict[str, int] = {}
+        for (_address, _operation, kind), count in self.failures.items():
+            failures[kind] = failures.get(kind, 0) + count
+        return {
+            "seconds": monotonic() - self.started_at,
+            "operations": {
+                operation: histogram.snapshot()
+                for operation, histogram in operations.items()
+            },
+            "failures": failures,
+            "retries": sum(self.retries.values()),
+            "in_flight": dict(self.in_flight),
+            "bytes": dict(self.bytes),
+            "packets": dict(self.packets),
+            "devices": devices,
+        }
+
+    def prometheus(self, extra_gauges: Optional[Dict[str, Dict[str, float]]] = None) -> str:
+        """The metrics in Prometheus' text exposition format."""
+        lines: List[str] = []
+        name = f"{METRICS_PREFIX}_request_duration_seconds"
+        lines.append(f"# TYPE {name} histogram")
+        for (address, operation), histogram in self.latency.items():
+            labels = f'device="{address}",operation="{operation}"'
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+            lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+        name = f"{METRICS_PREFIX}_request_failures_total"
+        lines.append(f"# TYPE {name} counter")
+        for (address, operation, kind), count in self.failures.items():
+            lines.append(
+                f'{name}{{device="{address}",operation="{operation}",kind="{kind}"}} {count}'
+            )
+
+        name = f"{METRICS_PREFIX}_request_retries_total"
+        lines.append(f"# TYPE {name} counter")
+        for (address, operation), count in self.retries.items():
+            lines.append(f'{name}{{device="{address}",operation="{operation}"}} {count}')
+
+        name = f"{METRICS_PREFIX}_requests_in_flight"
+        lines.append(f"# TYPE {name} gauge")
+        for operation, count in self.in_flight.items():
+            lines.append(f'{name}{{operation="{operation}"}} {count}')
+
+        for metric, values in (("bytes", self.bytes), ("packets", self.packets)):
+            name = f"{METRICS_PREFIX}_{metric}_total"
+            lines.append(f"# TYPE {name} counter")
+            for direction, count in values.items():
+                lines.append(f'{name}{{direction="{direction}"}} {count}')
+
+        for metric, values in (extra_gauges or {}).items():
+            name = f"{METRICS_PREFIX}_{metric}"
+            lines.append(f"# TYPE {name} gauge")
+            for label, value in values.items():
+                lines.append(f'{name}{{name="{label}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """A tiny HTTP server answering every request with the output of `render`."""
+
+    def __init__(self, render: Callable[[], str], logger: Logger):
+        self.render = render
+        self.logger = logger
+        self.port: Optional[int] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def serve(self, port: Optional[int], host: str = "127.0.0.1") -> None:
+        """Listen on `port`, or stop listening if it is None. Must be called from the running event loop."""
+        if port == self.port:
+            return
+        self.close()
+        self.port = port
+        if port:
+            self._task = asyncio.create_task(self._start(host, port))
+
+    async def _start(self, host: str, port: int) -> None:
+        try:
+            self._server = await asyncio.start_server(self._handle, host, port)
+            self.logger.info(f"Serving Prometheus metrics on http://{host}:{port}/metrics")
+        except OSError as err:
+            self.logger.error(f"Unable to serve metrics on port {port}: {err}")
+            self.port = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            # Read and ignore the request line and headers
+            while (await reader.readline()).strip():
+                pass
+            body = self.render().encode()
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                b"Content-Type: text/plain; version=0.0.4\r\n"
+                + f"Content-Length: {len(body)}\r\n".encode()
+                + b"Connection: close\r\n\r\n"
+                + body
+            )
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        self.port = None
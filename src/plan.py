@@ -0,0 +1,73 @@
+from functools import lru_cache
+from typing import Any, Dict, Mapping, Sequence, Tuple
+
+from bacpypes3.basetypes import PropertyIdentifier
+from bacpypes3.pdu import Address
+from bacpypes3.primitivedata import ObjectIdentifier
+
+from cov import ObjectKey
+
+# Parsed addresses and identifiers are immutable, so every request to the same
+# device, object or property shares one instance instead of parsing its own
+PARSE_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def cached_address(address: str) -> Address:
+    return Address(address)
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def cached_object_identifier(key: ObjectKey) -> ObjectIdentifier:
+    return ObjectIdentifier(key)
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def cached_property_identifier(prop: str) -> PropertyIdentifier:
+    return PropertyIdentifier(prop)
+
+
+class ObjectPlan:
+    """One configured object, with its key and name pulled out of its config."""
+
+    __slots__ = ("key", "name", "address", "config")
+
+    def __init__(self, config: Mapping[str, Any]):
+        self.key: ObjectKey = (str(config.get("type")), str(config.get("address")))
+        self.name = config.get("name")
+        self.address = config.get("address")
+        self.config = dict(config)
+
+
+class DevicePlan:
+    """A resource's configured objects on one device, compiled once per `reconfigure`.
+
+    Objects can be found by name or by object address without scanning the
+    list. Requests parse the device address and object identifiers through
+    the shared caches above, so repeated reads and writes don't parse them
+    again.
+    """
+
+    __slots__ = ("address", "objects", "keys", "by_name", "by_address")
+
+    def __init__(self, address: str, objects: Sequence[Mapping[str, Any]]):
+        self.address = address
+        self.objects: Tuple[ObjectPlan, ...] = tuple(ObjectPlan(obj) for obj in objects)
+        self.keys: Tuple[ObjectKey, ...] = tuple(obj.key for obj in self.objects)
+        # Later entries win, the same as the list scans this replaces
+        self.by_name: Dict[Any, ObjectPlan] = {obj.name: obj for obj in self.objects}
+        self.by_address: Dict[Any, ObjectPlan] = {
+            obj.address: obj for obj in self.objects
+        }
+
+    def find(self, deviceObject: Mapping[str, Any]) -> ObjectPlan:
+        """The object a command refers to by `address` or `name`; raises IndexError if there is none."""
+        if deviceObject.get("address", None):
+            found = self.by_address.get(deviceObject.get("address"))
+        elif deviceObject.get("name", None):
+            found = self.by_name.get(deviceObject.get("name"))
+        else:
+            raise Exception("Please provide the object name or address to update.")
+        if found is None:
+            raise IndexError("unknown object")
+        return found
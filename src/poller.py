@@ -0,0 +1,104 @@
+import asyncio
+from logging import Logger
+from time import monotonic
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from cov import ObjectKey
+
+DEFAULT_POLL_INTERVAL = 5.0
+# Polled values are served for this many intervals, so one slow or lost poll
+# doesn't send every reader to the device
+POLL_STALE_INTERVALS = 2
+
+
+class DevicePollers:
+    """One polling loop per device, shared by every resource reading objects on it.
+
+    Resources register the objects they read with `watch`. Each device with
+    watched objects gets a task that reads all of them together every
+    interval (the shortest any of its watchers asked for) through `read`,
+    which keeps the value cache warm. Readers then accept cached values of
+    polled objects up to `max_age` old instead of sending their own request,
+    so traffic grows with the number of devices rather than components.
+    """
+
+    def __init__(
+        self,
+        read: Callable[[str, List[ObjectKey]], Awaitable[Any]],
+        logger: Logger,
+    ):
+        self._read = read
+        self.logger = logger
+        self._watchers: Dict[str, Dict[ObjectKey, int]] = {}
+        self._intervals: Dict[str, Dict[float, int]] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def watch(self, address: str, keys, interval: float = DEFAULT_POLL_INTERVAL) -> None:
+        """Poll each object every `interval` seconds or sooner. Must be called from the running event loop."""
+        watchers = self._watchers.setdefault(address, {})
+        for key in keys:
+            watchers[key] = watchers.get(key, 0) + 1
+        intervals = self._intervals.setdefault(address, {})
+        intervals[interval] = intervals.get(interval, 0) + 1
+        if address not in self._tasks:
+            self._tasks[address] = asyncio.create_task(self._poll(address))
+
+    def unwatch(self, address: str, keys, interval: float = DEFAULT_POLL_INTERVAL) -> None:
+        """Release interest in each object, stopping the device's poller once nobody watches it."""
+        watchers = self._watchers.get(address, {})
+        for key in keys:
+            remaining = watchers.get(key, 0) - 1
+            if remaining > 0:
+                watchers[key] = remaining
+            else:
+                watchers.pop(key, None)
+        intervals = self._intervals.get(address, {})
+        remaining = intervals.get(interval, 0) - 1
+        if remaining > 0:
+            intervals[interval] = remaining
+        else:
+            intervals.pop(interval, None)
+        if not watchers or not intervals:
+            self._watchers.pop(address, None)
+            self._intervals.pop(address, None)
+            task = self._tasks.pop(address, None)
+            if task is not None:
+                task.cancel()
+
+    def interval(self, address: str) -> Optional[float]:
+        intervals = self._intervals.get(address)
+        return min(intervals) if intervals else None
+
+    def max_age(self, address: str, key: ObjectKey) -> Optional[float]:
+        """How old a value of a polled object may be and still be served, or None if it isn't polled."""
+        interval = self.interval(address)
+        if interval is None or key not in self._watchers.get(address, {}):
+            return None
+        return interval * POLL_STALE_INTERVALS
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            address: {"objects": len(watchers), "interval": self.interval(address)}
+            for address, watchers in self._watchers.items()
+        }
+
+    def close(self) -> None:
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+        self._watchers.clear()
+        self._intervals.clear()
+
+    async def _poll(self, address: str) -> None:
+        while True:
+            started = monotonic()
+            keys = list(self._watchers.get(address, {}))
+            try:
+                if keys:
+                    await self._read(address, keys)
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                self.logger.warning(f"Polling {address} failed: {err}")
+            interval = self.interval(address) or DEFAULT_POLL_INTERVAL
+            await asyncio.sleep(max(0.0, interval - (monotonic() - started)))
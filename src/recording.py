@@ -0,0 +1,212 @@
+import base64
+import gzip
+import json
+from time import monotonic, time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+TRACE_VERSION = 1
+SENT = "s"
+RECEIVED = "r"
+# Peer of packets broadcast by the client, whatever address they went to
+BROADCAST_PEER = "*"
+
+# BVLL functions and header lengths
+BVLL_TYPE = 0x81
+BVLL_FORWARDED_NPDU = 0x04
+BVLL_DISTRIBUTE_BROADCAST = 0x09
+BVLL_ORIGINAL_UNICAST = 0x0A
+BVLL_ORIGINAL_BROADCAST = 0x0B
+BVLL_HEADER = 4
+BVLL_FORWARDED_HEADER = 10
+
+# APDU types whose second byte is the invoke ID; confirmed requests carry it in the third
+CONFIRMED_REQUEST = 0
+SEGMENT_ACK = 4
+RESPONSE_TYPES = {2, 3, 4, 5, 6, 7}
+
+# A packet in a trace: seconds since recording started, direction, peer and the BVLL bytes
+Packet = Tuple[float, str, str, bytes]
+
+
+def _npdu_offset(data: bytes) -> Optional[int]:
+    """Where the NPDU starts in a BVLL packet, or None for BVLL-only messages."""
+    if len(data) < BVLL_HEADER or data[0] != BVLL_TYPE:
+        return None
+    if data[1] == BVLL_FORWARDED_NPDU:
+        return BVLL_FORWARDED_HEADER
+    if data[1] in (BVLL_DISTRIBUTE_BROADCAST, BVLL_ORIGINAL_UNICAST, BVLL_ORIGINAL_BROADCAST):
+        return BVLL_HEADER
+    return None
+
+
+def npdu_stations(data: bytes) -> Tuple[bytes, bytes]:
+    """The remote destination and source (network and address) in a packet's NPDU; empty for the local network.
+
+    Invoke IDs are only unique per device, so a response behind a router is
+    matched to its request by the request's destination being its source.
+    """
+    offset = _npdu_offset(data)
+    if offset is None or len(data) < offset + 2:
+        return b"", b""
+    control = data[offset + 1]
+    offset += 2
+    destination = source = b""
+    if control & 0x20:
+        end = offset + 3 + data[offset + 2]
+        destination, offset = data[offset:end], end
+    if control & 0x08:
+        end = offset + 3 + data[offset + 2]
+        source = data[offset:end]
+    return destination, source
+
+
+def _apdu_offset(data: bytes) -> Optional[int]:
+    """Where the APDU starts in a BVLL packet, or None if it carries none (e.g. a network layer message)."""
+    offset = _npdu_offset(data)
+    if offset is None or len(data) < offset + 2:
+        return None
+    control = data[offset + 1]
+    if control & 0x80:
+        return None
+    offset += 2
+    if control & 0x20:
+        offset += 3 + data[offset + 2]
+    if control & 0x08:
+        offset += 3 + data[offset + 2]
+    if control & 0x20:
+        offset += 1
+    return offset if offset < len(data) else None
+
+
+def apdu_type(data: bytes) -> Optional[int]:
+    """The type of a packet's APDU, or None if it carries none."""
+    offset = _apdu_offset(data)
+    return None if offset is None else data[offset] >> 4
+
+
+def invoke_id_offset(data: bytes) -> Optional[int]:
+    """Where the invoke ID of a confirmed request, its response or a segment ack is, if the packet has one."""
+    offset = _apdu_offset(data)
+    if offset is None:
+        return None
+    apdu_type = data[offset] >> 4
+    if apdu_type == CONFIRMED_REQUEST:
+        position = offset + 2
+    elif apdu_type in RESPONSE_TYPES:
+        position = offset + 1
+    else:
+        return None
+    return position if position < len(data) else None
+
+
+def is_response(data: bytes) -> bool:
+    """Whether a packet answers a confirmed request (an ack, error, reject, abort or segment ack)."""
+    return apdu_type(data) in RESPONSE_TYPES
+
+
+def is_broadcast(data: bytes) -> bool:
+    return len(data) > 1 and data[0] == BVLL_TYPE and data[1] in (
+        BVLL_DISTRIBUTE_BROADCAST,
+        BVLL_ORIGINAL_BROADCAST,
+    )
+
+
+def with_invoke_id(data: bytes, invoke_id: Optional[int]) -> bytes:
+    """The packet with its invoke ID replaced, if it has one."""
+    position = invoke_id_offset(data)
+    if position is None or invoke_id is None:
+        return data
+    return data[:position] + bytes([invoke_id]) + data[position + 1 :]
+
+
+def request_key(data: bytes) -> bytes:
+    """A packet's NPDU with any invoke ID zeroed, so repeats of the same request compare equal."""
+    offset = _npdu_offset(data)
+    return with_invoke_id(data, 0)[offset if offset is not None else 0 :]
+
+
+def tap(app, on_packet: Callable[[str, str, bytes], None]) -> None:
+    """Pass every packet through the app's BACnet/IP sockets to `on_packet(direction, peer, data)`."""
+    for link_layer in getattr(app, "link_layers", {}).values():
+        server = getattr(link_layer, "server", None)
+        if server is None or getattr(server, "_trace_tapped", False):
+            continue
+        send, receive = server.indication, server.confirmation
+
+        async def traced_send(pdu, send=send):
+            on_packet(SENT, str(pdu.pduDestination), bytes(pdu.pduData))
+            await send(pdu)
+
+        async def traced_receive(pdu, receive=receive):
+            on_packet(RECEIVED, str(pdu.pduSource), bytes(pdu.pduData))
+            await receive(pdu)
+
+        server.indication = traced_send
+        server.confirmation = traced_receive
+        server._trace_tapped = True
+
+
+class TraceRecorder:
+    """Writes every BACnet/IP packet a controller sends and receives to a gzipped JSON lines trace.
+
+    The first line describes the trace; each following line is one packet as
+    `[seconds since the recording started, "s" or "r", peer, base64 bytes]`.
+    Broadcasts are recorded with the peer "*" so a replay can answer them
+    whatever broadcast address the replaying client uses.
+    """
+
+    def __init__(self, path: str, binding: Optional[str] = None):
+        self.path = path
+        self.packets = 0
+        self.started_at = monotonic()
+        self._file = gzip.open(path, "wt")
+        self._file.write(
+            json.dumps({"version": TRACE_VERSION, "started": time(), "binding": binding}) + "\n"
+        )
+
+    @property
+    def recording(self) -> bool:
+        return self._file is not None
+
+    def packet(self, direction: str, peer: str, data: bytes) -> None:
+        if self._file is None:
+            return
+        if direction == SENT and is_broadcast(data):
+            peer = BROADCAST_PEER
+        self._file.write(
+            json.dumps([
+                round(monotonic() - self.started_at, 6),
+                direction,
+                peer,
+                base64.b64encode(data).decode("ascii"),
+            ], separators=(",", ":"))
+            + "\n"
+        )
+        self.packets += 1
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "recording": self.recording,
+            "packets": self.packets,
+            "seconds": monotonic() - self.started_at,
+        }
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def read_trace(path: str) -> Tuple[Dict[str, Any], List[Packet]]:
+    """The header and packets of a trace written by TraceRecorder."""
+    with gzip.open(path, "rt") as trace_file:
+        lines: Iterator[str] = iter(trace_file)
+        header = json.loads(next(lines))
+        if header.get("version") != TRACE_VERSION:
+            raise ValueError(f"unsupported trace version {header.get('version')}")
+        packets = [
+            (float(at), str(direction), str(peer), base64.b64decode(data))
+            for at, direction, peer, data in (json.loads(line) for line in lines if line.strip())
+        ]
+    return header, packets
@@ -0,0 +1,66 @@
+from time import monotonic
+from typing import Any, Dict, Mapping, Optional, Set
+
+from cov import ObjectKey
+
+DEFAULT_HEARTBEAT_INTERVAL = 3600.0
+
+
+class ChangeReporter:
+    """Decides which of a sensor's values are worth reporting again.
+
+    A value is reported when it differs from the last one reported for its
+    object: for objects with a deadband, by at least that much, so slow
+    drift still gets reported once it adds up. Every `heartbeat` seconds all
+    values are reported, so captured data shows a sensor is alive even
+    when nothing changes.
+    """
+
+    def __init__(
+        self,
+        deadbands: Optional[Mapping[ObjectKey, float]] = None,
+        heartbeat: float = DEFAULT_HEARTBEAT_INTERVAL,
+    ):
+        self.deadbands = dict(deadbands or {})
+        self.heartbeat = heartbeat
+        self._reported: Dict[ObjectKey, Any] = {}
+        self._last_full: Optional[float] = None
+
+    def changed(self, key: ObjectKey, value: Any) -> bool:
+        if key not in self._reported:
+            return True
+        previous = self._reported[key]
+        deadband = self.deadbands.get(key)
+        if deadband is not None:
+            try:
+                return abs(float(value) - float(previous)) >= deadband
+            except (TypeError, ValueError):
+                pass
+        return value != previous
+
+    def report(
+        self,
+        values: Mapping[ObjectKey, Any],
+        now: Optional[float] = None,
+        remember: bool = True,
+    ) -> Set[ObjectKey]:
+        """The objects whose values should be reported now, remembered as reported unless not `remember`."""
+        now = monotonic() if now is None else now
+        full = self._last_full is None or (
+            self.heartbeat > 0 and now - self._last_full >= self.heartbeat
+        )
+        if full:
+            keys = set(values)
+        else:
+            keys = {key for key, value in values.items() if self.changed(key, value)}
+        if remember:
+            if full:
+                self._last_full = now
+            for key in keys:
+                self._reported[key] = values[key]
+        return keys
+
+    def reset(self) -> None:
+        """Report everything on the next call."""
+        self._reported.clear()
+        self._last_full = None
@@ -0,0 +1,140 @@
+import asyncio
+import math
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import groupby
+from logging import Logger
+from time import monotonic, time
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+from cov import ObjectKey
+
+DEFAULT_HISTORY_SIZE = 3600
+
+
+class SampleRing:
+    """A fixed number of (timestamp, value) samples of one object, oldest overwritten first.
+
+    Timestamps and values are kept in two preallocated arrays of doubles, so a
+    full ring of an hour of one-second samples is under 60KB per object.
+    Values that aren't numbers are recorded as NaN.
+    """
+
+    __slots__ = ("capacity", "times", "values", "start", "count")
+
+    def __init__(self, capacity: int = DEFAULT_HISTORY_SIZE):
+        self.capacity = max(1, int(capacity))
+        self.times = array("d", bytes(8 * self.capacity))
+        self.values = array("d", bytes(8 * self.capacity))
+        self.start = 0
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def append(self, at: float, value: Any) -> None:
+        index = (self.start + self.count) % self.capacity
+        self.times[index] = at
+        try:
+            self.values[index] = float(value)
+        except (TypeError, ValueError):
+            self.values[index] = math.nan
+        if self.count < self.capacity:
+            self.count += 1
+        else:
+            self.start = (self.start + 1) % self.capacity
+
+    def _ordered(self, samples: array) -> array:
+        end = self.start + self.count
+        if end <= self.capacity:
+            return samples[self.start : end]
+        return samples[self.start :] + samples[: end - self.capacity]
+
+    def window(self, start: float, end: float) -> Tuple[array, array]:
+        """The timestamps and values of the samples taken between `start` and `end`, oldest first."""
+        times = self._ordered(self.times)
+        low = bisect_left(times, start)
+        high = bisect_right(times, end)
+        return times[low:high], self._ordered(self.values)[low:high]
+
+
+def downsample(
+    times: Sequence[float], values: Sequence[float], step: float, mean: bool = True
+) -> Tuple[List[float], List[float]]:
+    """Collapse samples into one per `step` seconds: the mean of each bucket, or its last value if not `mean`.
+
+    Each bucket is timestamped with its last sample.
+    """
+    bucket_times: List[float] = []
+    bucket_values: List[float] = []
+    for _bucket, bucket in groupby(zip(times, values), key=lambda sample: int(sample[0] // step)):
+        samples = list(bucket)
+        numbers = [value for _at, value in samples if not math.isnan(value)]
+        bucket_times.append(samples[-1][0])
+        bucket_values.append(
+            sum(numbers) / len(numbers) if mean and numbers else samples[-1][1]
+        )
+    return bucket_times, bucket_values
+
+
+class Sampler:
+    """Reads a set of objects every `interval` seconds on its own schedule and keeps a SampleRing of each.
+
+    The latest value of each object, as read, is kept alongside its ring so
+    it can be served without another request. Reads that fail or miss an
+    object simply leave a gap in that object's history.
+    """
+
+    def __init__(
+        self,
+        read: Callable[[List[ObjectKey]], Awaitable[Mapping[ObjectKey, Any]]],
+        keys: Sequence[ObjectKey],
+        interval: float,
+        logger: Logger,
+        capacity: int = DEFAULT_HISTORY_SIZE,
+    ):
+        self._read = read
+        self.keys = list(keys)
+        self.interval = interval
+        self.logger = logger
+        self.rings: Dict[ObjectKey, SampleRing] = {key: SampleRing(capacity) for key in self.keys}
+        self.latest: Dict[ObjectKey, Tuple[Any, float]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """Start sampling. Must be called from the running event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def record(self, values: Mapping[ObjectKey, Any], at: Optional[float] = None) -> None:
+        at = time() if at is None else at
+        for key, value in values.items():
+            ring = self.rings.get(key)
+            if ring is None or value is None:
+                continue
+            ring.append(at, value)
+            self.latest[key] = (value, at)
+
+    def last(self, key: ObjectKey) -> Optional[Tuple[Any, float]]:
+        """The latest value sampled of an object and how many seconds ago, or None if it was never sampled."""
+        latest = self.latest.get(key)
+        if latest is None:
+            return None
+        value, at = latest
+        return value, max(0.0, time() - at)
+
+    async def _run(self) -> None:
+        while True:
+            started = monotonic()
+            try:
+                self.record(await self._read(self.keys))
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                self.logger.warning(f"Sampling failed: {err}")
+            await asyncio.sleep(max(0.0, self.interval - (monotonic() - started)))
@@ -0,0 +1,150 @@
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import Deque, Dict, Tuple
+
+
+class TrafficClass(IntEnum):
+    """Classes of BACnet traffic, most urgent first."""
+
+    WRITE = 0
+    INTERACTIVE = 1
+    POLL = 2
+    DISCOVERY = 3
+
+
+# The share of the global and per-network transaction caps each class may
+# occupy. Keeping the background classes below the full caps leaves room for
+# a write to go out immediately even while discovery or capture polling is
+# saturating the bus.
+TRAFFIC_SHARE = {
+    TrafficClass.WRITE: 1.0,
+    TrafficClass.INTERACTIVE: 1.0,
+    TrafficClass.POLL: 0.75,
+    TrafficClass.DISCOVERY: 0.5,
+}
+
+DEFAULT_MAX_OUTSTANDING = 32
+DEFAULT_MAX_PER_DEVICE = 2
+DEFAULT_MAX_PER_NETWORK = 8
+
+
+def network_of(address: str) -> str:
+    """The BACnet network number of a device address, or "local" for devices on the directly connected network."""
+    if ":" in address:
+        network, _station = address.split(":", 1)
+        if network.isdigit():
+            return network
+    return "local"
+
+
+class TransactionScheduler:
+    """Admission control for confirmed BACnet requests.
+
+    Every request waits for a slot that respects a global cap on outstanding
+    transactions, a cap per device and a cap per network (i.e. per router).
+    Waiting requests are granted in traffic class order; a request blocked by
+    its device or network cap doesn't hold up requests for other devices.
+    Writes may exceed a device's or network's cap by one so they never queue
+    behind reads of the same device or network.
+    """
+
+    def __init__(
+        self,
+        max_outstanding: int = DEFAULT_MAX_OUTSTANDING,
+        max_per_device: int = DEFAULT_MAX_PER_DEVICE,
+        max_per_network: int = DEFAULT_MAX_PER_NETWORK,
+    ):
+        self.max_outstanding = max_outstanding
+        self.max_per_device = max_per_device
+        self.max_per_network = max_per_network
+        self.outstanding = 0
+        self._per_device: Dict[str, int] = {}
+        self._per_network: Dict[str, int] = {}
+        self._waiting: Dict[TrafficClass, Deque[Tuple[str, asyncio.Future]]] = {
+            traffic_class: deque() for traffic_class in TrafficClass
+        }
+
+    def stats(self) -> Dict[str, int]:
+        stats = {"outstanding": self.outstanding}
+        for traffic_class in TrafficClass:
+            stats[f"waiting_{traffic_class.name.lower()}"] = len(
+                self._waiting[traffic_class]
+            )
+        return stats
+
+    @asynccontextmanager
+    async def slot(
+        self, address: str, traffic_class: TrafficClass = TrafficClass.INTERACTIVE
+    ):
+        """Hold one outstanding-transaction slot for a request to `address`."""
+        await self._acquire(address, traffic_class)
+        try:
+            yield
+        finally:
+            self._release(address)
+
+    def _can_run(self, address: str, traffic_class: TrafficClass) -> bool:
+        device_cap = self.max_per_device
+        network_cap = self.max_per_network
+        if traffic_class == TrafficClass.WRITE:
+            device_cap += 1
+            network_cap += 1
+        else:
+            network_cap = max(1, int(network_cap * TRAFFIC_SHARE[traffic_class]))
+        return (
+            self.outstanding < self.max_outstanding * TRAFFIC_SHARE[traffic_class]
+            and self._per_device.get(address, 0) < device_cap
+            and self._per_network.get(network_of(address), 0) < network_cap
+        )
+
+    def _take(self, address: str) -> None:
+        network = network_of(address)
+        self.outstanding += 1
+        self._per_device[address] = self._per_device.get(address, 0) + 1
+        self._per_network[network] = self._per_network.get(network, 0) + 1
+
+    async def _acquire(self, address: str, traffic_class: TrafficClass) -> None:
+        future = asyncio.get_running_loop().create_future()
+        waiter = (address, future)
+        queue = self._waiting[traffic_class]
+        queue.append(waiter)
+        self._dispatch()
+        if future.done():
+            return
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just as we were cancelled; hand the slot back
+                self._release(address)
+            elif waiter in queue:
+                queue.remove(waiter)
+            raise
+
+    def _release(self, address: str) -> None:
+        network = network_of(address)
+        self.outstanding -= 1
+        self._per_device[address] -= 1
+        if not self._per_device[address]:
+            del self._per_device[address]
+        self._per_network[network] -= 1
+        if not self._per_network[network]:
+            del self._per_network[network]
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        for traffic_class in TrafficClass:
+            queue = self._waiting[traffic_class]
+            cap = self.max_outstanding * TRAFFIC_SHARE[traffic_class]
+            for waiter in list(queue):
+                if self.outstanding >= cap:
+                    break
+                address, future = waiter
+                if future.done():
+                    queue.remove(waiter)
+                elif self._can_run(address, traffic_class):
+                    queue.remove(waiter)
+                    self._take(address)
+                    future.set_result(None)
@@ -1,19 +1,27 @@
-import asyncio
-from typing import ClassVar, Dict, Mapping, Optional, Sequence, Any, Tuple
+import math
+from time import time
+from typing import ClassVar, Dict, List, Mapping, Optional, Sequence, Any, Tuple
 
 from typing_extensions import Self
 from viam.components.sensor import Sensor
+from viam.errors import NoCaptureToStoreError
 from viam.proto.app.robot import ComponentConfig
 from viam.proto.common import ResourceName
 from viam.resource.base import ResourceBase
 from viam.resource.easy_resource import EasyResource
 from viam.resource.types import Model, ModelFamily
-from viam.utils import SensorReading, ValueTypes, struct_to_dict
-from bacpypes3.basetypes import PropertyIdentifier
-from bacpypes3.pdu import Address
-from bacpypes3.primitivedata import ObjectIdentifier
+from viam.utils import SensorReading, ValueTypes, from_dm_from_extra, struct_to_dict
+from controller import BacnetController, binding_controller, validate_binding
+from plan import DevicePlan, ObjectPlan
+from reporting import DEFAULT_HEARTBEAT_INTERVAL, ChangeReporter
+from sampler import DEFAULT_HISTORY_SIZE, Sampler, downsample
+from scheduler import TrafficClass
+from utils import parse_by_type, parse_max_age
 
-from controller import BacnetController
+# Time kept back from a get_readings timeout to send the readings back before the caller gives up
+DEADLINE_MARGIN = 0.05
+# Sampled values older than this many sample intervals are reported as stale
+SAMPLE_STALE_INTERVALS = 2
 
 
 class BacnetSensor(Sensor, EasyResource):
@@ -22,6 +30,8 @@ class BacnetSensor(Sensor, EasyResource):
     )
 
     bacnet: BacnetController
+    sampler: Optional[Sampler] = None
+    reporter: Optional[ChangeReporter] = None
 
     @classmethod
     def new(
@@ -54,6 +64,7 @@ class BacnetSensor(Sensor, EasyResource):
         Returns:
             Sequence[str]: A list of implicit dependencies
         """
+        validate_binding(struct_to_dict(config.attributes))
         return [], []
 
     def reconfigure(
@@ -66,6 +77,7 @@ class BacnetSensor(Sensor, EasyResource):
             dependencies (Mapping[ResourceName, ResourceBase]): Any dependencies (both implicit and explicit)
         """
         attrs = struct_to_dict(config.attributes)
+        self._unwatch()
         self.address = str(attrs.get("address", "0:0x00"))
 
         self.networkId, self.deviceID = self.address.split(":")
@@ -74,9 +86,62 @@ class BacnetSensor(Sensor, EasyResource):
             f"Current address: {self.address}; current device ID: {self.deviceID}"
         )
         self.objectList = list(attrs.get("objects", []))
-        self.bacnet = BacnetController()
+        self.plan = DevicePlan(self.address, self.objectList)
+        self.use_cov = bool(attrs.get("cov", False))
+        self.cache_max_age = parse_max_age(attrs.get("cache_max_age"))
+        self.poll_interval = float(attrs.get("poll_interval", 0))
+        self.sample_interval = float(attrs.get("sample_interval", 0))
+        self.history_size = int(attrs.get("history_size", DEFAULT_HISTORY_SIZE))
+        self.reporter = None
+        if attrs.get("report_changes", False):
+            self.reporter = ChangeReporter(
+                self._deadbands(parse_by_type(attrs.get("deadband"))),
+                float(attrs.get("heartbeat_interval", DEFAULT_HEARTBEAT_INTERVAL)),
+            )
+        self.bacnet = binding_controller(attrs)
+        self.binding = self.bacnet.binding
+        self.bacnet.start()
+        if self.use_cov:
+            self.bacnet.cov.watch(self.address, self._object_keys())
+        if self.poll_interval:
+            self.bacnet.pollers.watch(
+                self.address, self._object_keys(), self.poll_interval
+            )
+        if self.sample_interval:
+            self.sampler = Sampler(
+                self._sample,
+                self._object_keys(),
+                self.sample_interval,
+                self.logger,
+                self.history_size,
+            )
+            self.sampler.start()
         return
 
+    def _deadbands(self, by_type: Mapping[str, float]) -> Dict[Tuple[str, str], float]:
+        """The deadband of each analog object: its own `deadband`, else the one for its type."""
+        deadbands = {}
+        for obj in self.plan.objects:
+            if not obj.key[0].startswith("analog"):
+                continue
+            deadband = obj.config.get("deadband", by_type.get(obj.key[0], by_type.get("*")))
+            if deadband is not None:
+                deadbands[obj.key] = float(deadband)
+        return deadbands
+
+    def _unwatch(self):
+        if self.sampler is not None:
+            self.sampler.close()
+            self.sampler = None
+        if not getattr(self, "bacnet", None):
+            return
+        if getattr(self, "use_cov", False):
+            self.bacnet.cov.unwatch(self.address, self._object_keys())
+        if getattr(self, "poll_interval", None):
+            self.bacnet.pollers.unwatch(
+                self.address, self._object_keys(), self.poll_interval
+            )
+
     async def get_readings(
         self,
         *,
@@ -84,58 +149,176 @@ class BacnetSensor(Sensor, EasyResource):
         timeout: Optional[float] = None,
         **kwargs,
     ) -> Mapping[str, SensorReading]:
-        readings = await asyncio.gather(*[
-            self.get_present_value_for_object(deviceObject)
-            for deviceObject in self.objectList
-        ])
-        return {reading["name"]: reading for reading in readings}
-
-    async def get_present_value_for_object(self, deviceObject: Dict):
         if self.bacnet is None:
-            return deviceObject | {"presentValue": "N/A"}
+            return {
+                deviceObject["name"]: deviceObject | {"presentValue": "N/A"}
+                for deviceObject in self.objectList
+            }
 
-        try:
-            value = await self.bacnet.client.read(
-                f"{self.address} {deviceObject.get('type')} {deviceObject.get('address')} presentValue"
-            )
-            return deviceObject | {"presentValue": value}
-        except Exception as readErr:
-            self.logger.error(
-                f"Unable to get present value for {deviceObject.get('name')}"
-            )
-            self.logger.error(readErr)
-            return deviceObject | {"presentValue": "N/A"}
+        readings = await self._readings(extra, timeout)
+        captured = from_dm_from_extra(dict(extra or {}))
+        if self.reporter is not None and (captured or (extra or {}).get("changes_only")):
+            # Only capture moves the reporter on, so interactive callers don't hide changes from it
+            readings = self._changed_readings(readings, remember=captured)
+            if not readings and captured:
+                raise NoCaptureToStoreError()
+        return readings
+
+    async def _readings(
+        self, extra: Optional[Mapping[str, Any]], timeout: Optional[float]
+    ) -> Dict[str, Any]:
+        fresh = bool((extra or {}).get("fresh", False))
+        if self.sampler is not None and not fresh:
+            sampled = self._sampled_readings()
+            if sampled is not None:
+                return sampled
+
+        deadline = (extra or {}).get("deadline")
+        if deadline is None and timeout is not None:
+            deadline = max(0.0, timeout - DEADLINE_MARGIN)
+        values = await self.bacnet.read_multiple(
+            self.address,
+            self._object_keys(),
+            max_age=None if fresh else self.cache_max_age,
+            traffic_class=(
+                TrafficClass.POLL
+                if from_dm_from_extra(dict(extra or {}))
+                else TrafficClass.INTERACTIVE
+            ),
+            deadline=None if deadline is None else float(deadline),
+        )
+        readings = {}
+        for obj in self.plan.objects:
+            value = values.get(obj.key)
+            if value is None and deadline is not None:
+                # Fall back to the last value read, e.g. by a read that missed an earlier deadline
+                last = self.bacnet.last_value(self.address, obj.key)
+                if last is not None:
+                    value, age = last
+                    readings[obj.config["name"]] = obj.config | {
+                        "presentValue": value,
+                        "stale": True,
+                        "age": age,
+                    }
+                    continue
+            if value is None:
+                self.logger.error(f"Unable to get present value for {obj.name}")
+                value = "N/A"
+            readings[obj.config["name"]] = obj.config | {"presentValue": value}
+        return readings
+
+    def _changed_readings(self, readings: Dict[str, Any], remember: bool) -> Dict[str, Any]:
+        """Only the readings the reporter says changed enough since they were last captured."""
+        values = {}
+        for obj in self.plan.objects:
+            reading = readings.get(obj.config["name"])
+            if reading is not None and reading["presentValue"] != "N/A":
+                values[obj.key] = reading["presentValue"]
+        report = self.reporter.report(values, remember=remember)
+        return {
+            obj.config["name"]: readings[obj.config["name"]]
+            for obj in self.plan.objects
+            if obj.key in report
+        }
+
+    async def _sample(self, keys: List[Tuple[str, str]]) -> Mapping[Tuple[str, str], Any]:
+        return await self.bacnet.read_multiple(
+            self.address,
+            keys,
+            max_age=self.cache_max_age,
+            traffic_class=TrafficClass.POLL,
+        )
+
+    def _sampled_readings(self) -> Optional[Dict[str, Any]]:
+        """Readings from the latest sample of every object, or None until each one has been sampled."""
+        readings = {}
+        for obj in self.plan.objects:
+            last = self.sampler.last(obj.key)
+            if last is None:
+                return None
+            value, age = last
+            reading = obj.config | {"presentValue": value}
+            if age > self.sample_interval * SAMPLE_STALE_INTERVALS:
+                reading |= {"stale": True, "age": age}
+            readings[obj.config["name"]] = reading
+        return readings
+
+    def get_history(
+        self,
+        names: Optional[List[str]] = None,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        step: Optional[float] = None,
+    ) -> Optional[Dict[str, Dict[str, List]]]:
+        """The sampled values of each named object (default: all) between `start` and `end`, in Unix seconds.
+
+        With a `step`, samples are collapsed to one every `step` seconds: the
+        mean for analog objects, the last value for the rest. None if the
+        sensor isn't sampling.
+        """
+        if self.sampler is None:
+            return None
+        end = time() if end is None else end
+        start = 0.0 if start is None else start
+        history = {}
+        for obj in self.plan.objects:
+            if names is not None and obj.name not in names:
+                continue
+            times, values = self.sampler.rings[obj.key].window(start, end)
+            if step:
+                times, values = downsample(
+                    times, values, step, mean=obj.key[0].startswith("analog")
+                )
+            history[obj.config["name"]] = {
+                "timestamps": list(times),
+                "values": [None if math.isnan(value) else value for value in values],
+            }
+        return history
+
+    def _object_keys(self) -> List[Tuple[str, str]]:
+        return list(self.plan.keys)
+
+    def _find_object(self, deviceObject: Dict) -> ObjectPlan:
+        return self.plan.find(deviceObject)
 
     async def update(self, deviceObject: Dict) -> bool:
-        if deviceObject.get("address", None):
-            obj = [
-                obj
-                for obj in self.objectList
-                if obj.get("address") == deviceObject.get("address")
-            ].pop()
-        elif deviceObject.get("name", None):
-            obj = [
-                obj
-                for obj in self.objectList
-                if obj.get("name") == deviceObject.get("name")
-            ].pop()
-        else:
-            raise Exception("Please provide the object name or address to update.")
-
-        object_identifier = ObjectIdentifier((obj.get("type"), obj.get("address")))
-        property_identifier = PropertyIdentifier("presentValue")
-        device_address = Address(self.address)
-        bacnet_app = self.bacnet.client.this_application.app
-
-        await bacnet_app.write_property(
-            address=device_address,
-            objid=object_identifier,
-            prop=property_identifier,
-            value=deviceObject.get("value"),
-            priority=16,
+        obj = self._find_object(deviceObject)
+        await self.bacnet.write_property(
+            self.address,
+            obj.key,
+            deviceObject.get("value"),
+            priority=int(deviceObject.get("priority", 16)),
         )
         return True
 
+    async def update_many(self, deviceObjects: List[Dict]) -> List[Dict]:
+        results: List[Dict] = []
+        writes = []
+        for deviceObject in deviceObjects:
+            try:
+                obj = self._find_object(deviceObject)
+            except IndexError:
+                results.append(deviceObject | {"success": False, "error": "unknown object"})
+                continue
+            except Exception as lookupErr:
+                results.append(deviceObject | {"success": False, "error": str(lookupErr)})
+                continue
+            results.append(deviceObject)
+            writes.append((
+                len(results) - 1,
+                (
+                    self.address,
+                    obj.key,
+                    deviceObject.get("value"),
+                    deviceObject.get("priority", 16),
+                ),
+            ))
+
+        outcomes = await self.bacnet.write_many([write for _index, write in writes])
+        for (index, _write), outcome in zip(writes, outcomes):
+            results[index] |= outcome
+        return results
+
     async def do_command(
         self,
         command: Mapping[str, ValueTypes],
@@ -148,10 +331,31 @@ class BacnetSensor(Sensor, EasyResource):
             if name == "update":
                 response = await self.update(dict(args))
                 result[name] = response
+            elif name == "update_many":
+                result[name] = await self.update_many([dict(entry) for entry in args])
+            elif name == "get_history":
+                args = dict(args) if isinstance(args, Mapping) else {}
+                window = args.get("window")
+                end = float(args["end"]) if args.get("end") is not None else time()
+                start = args.get("start")
+                if start is None and window is not None:
+                    start = end - float(window)
+                result[name] = self.get_history(
+                    [str(obj) for obj in args["objects"]] if args.get("objects") else None,
+                    None if start is None else float(start),
+                    end,
+                    float(args["step"]) if args.get("step") else None,
+                )
+            elif name == "get_stats":
+                result[name] = self.bacnet.stats()
+            elif name == "reset_stats":
+                self.bacnet.reset_stats()
+                result[name] = True
             else:
                 self.logger.warning(f"Unknown command '{name}'")
         return result
 
     async def close(self):
+        self._unwatch()
         if self.bacnet:
             del self.bacnet
@@ -0,0 +1,179 @@
+import asyncio
+from logging import Logger
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from bacpypes3.apdu import IAmRequest
+from bacpypes3.pdu import Address, LocalBroadcast
+
+MAX_DEVICE_INSTANCE = 4194303
+# Who-Is requests sent per second, and how long each one collects I-Am replies
+DEFAULT_WHOIS_RATE = 10.0
+DEFAULT_WHOIS_TIMEOUT = 3.0
+# Extra attempts for ranges and targets nothing answered
+DEFAULT_WHOIS_RETRIES = 1
+
+# (destination, network, low limit, high limit); None limits ask every device
+WhoIs = Tuple[Address, Optional[int], Optional[int], Optional[int]]
+# The I-Am of a device and the network it was found on, if known
+Found = Tuple[IAmRequest, Optional[int]]
+
+
+def parse_ranges(value: Any) -> List[Tuple[int, int]]:
+    """
+    Normalize an `instance_ranges` attribute into (low, high) device instance pairs.
+
+    Args:
+        value: A list of `[low, high]` pairs or `"low-high"` strings, where a
+            single number is a range of one
+
+    Returns:
+        The ranges in order, with overlapping and adjacent ranges merged
+
+    Raises:
+        ValueError: If a range is reversed or outside 0 - 4194303
+    """
+    ranges = []
+    for entry in value or []:
+        if isinstance(entry, str):
+            low, _sep, high = entry.partition("-")
+            low, high = int(low), int(high or low)
+        elif isinstance(entry, (int, float)):
+            low, high = int(entry), int(entry)
+        else:
+            low, high = entry
+            low, high = int(low), int(high)
+        if low > high:
+            raise ValueError(
+                f"instance range {entry!r} is reversed; give the low instance first"
+            )
+        if low < 0 or high > MAX_DEVICE_INSTANCE:
+            raise ValueError(
+                f"instance range {entry!r} is outside the device instances 0 - {MAX_DEVICE_INSTANCE}"
+            )
+        ranges.append((low, high))
+
+    merged: List[Tuple[int, int]] = []
+    for low, high in sorted(ranges):
+        if merged and low <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], high))
+        else:
+            merged.append((low, high))
+    return merged
+
+
+def chunk_ranges(
+    ranges: Sequence[Tuple[int, int]], chunk_size: Optional[int]
+) -> List[Tuple[int, int]]:
+    """Split each range into pieces of at most `chunk_size` instances."""
+    if not chunk_size:
+        return list(ranges)
+    chunks = []
+    for low, high in ranges:
+        for start in range(low, high + 1, chunk_size):
+            chunks.append((start, min(high, start + chunk_size - 1)))
+    return chunks
+
+
+class WhoIsSweep:
+    """Device discovery through many small, paced Who-Is requests instead of one big one.
+
+    A single Who-Is for every instance on a large network makes every device
+    answer at once, and routers drop I-Am replies. The sweep instead sends a
+    Who-Is per chunk of device instances per network, starting `rate` of
+    them a second, and asks again for chunks that nobody answered. Devices
+    whose address is already known are asked directly with a unicast Who-Is.
+    With no ranges, networks or targets configured it is one Who-Is for all
+    instances per network, as before.
+    """
+
+    def __init__(
+        self,
+        ranges: Optional[Sequence[Tuple[int, int]]] = None,
+        networks: Optional[Sequence[int]] = None,
+        targets: Optional[Sequence[str]] = None,
+        chunk_size: Optional[int] = None,
+        rate: float = DEFAULT_WHOIS_RATE,
+        retries: int = DEFAULT_WHOIS_RETRIES,
+        timeout: float = DEFAULT_WHOIS_TIMEOUT,
+    ):
+        self.ranges = list(ranges or [])
+        self.networks = list(networks or [])
+        self.targets = list(targets or [])
+        self.chunk_size = chunk_size
+        self.rate = rate
+        self.retries = retries
+        self.timeout = timeout
+
+    @classmethod
+    def from_attributes(cls, attrs: Mapping[str, Any]) -> "WhoIsSweep":
+        chunk_size = attrs.get("whois_chunk_size")
+        if chunk_size is not None and int(chunk_size) < 0:
+            raise ValueError("whois_chunk_size must be a positive number of instances")
+        return cls(
+            ranges=parse_ranges(attrs.get("instance_ranges")),
+            networks=[int(network) for network in attrs.get("networks", [])],
+            targets=[str(target) for target in attrs.get("targets", [])],
+            chunk_size=int(chunk_size) if chunk_size else None,
+            rate=float(attrs.get("whois_rate", DEFAULT_WHOIS_RATE)),
+            retries=int(attrs.get("whois_retries", DEFAULT_WHOIS_RETRIES)),
+            timeout=float(attrs.get("whois_timeout", DEFAULT_WHOIS_TIMEOUT)),
+        )
+
+    @property
+    def broadcasts(self) -> bool:
+        """Whether the sweep sends any broadcast Who-Is, as opposed to only asking known targets."""
+        return bool(self.ranges or self.networks or not self.targets)
+
+    def requests(self, networks: Iterable[int]) -> List[WhoIs]:
+        """Every Who-Is the sweep sends, directed ones first, for the configured networks or else `networks`.
+
+        With no network known at all, the ranges are asked with a local
+        broadcast, as BAC0 does.
+        """
+        requests: List[WhoIs] = []
+        for target in self.targets:
+            address = Address(target)
+            requests.append((address, address.addrNet, None, None))
+        if not self.broadcasts:
+            return requests
+        chunks: List[Tuple[Optional[int], Optional[int]]] = list(
+            chunk_ranges(self.ranges or [(0, MAX_DEVICE_INSTANCE)], self.chunk_size)
+        )
+        if not self.ranges and not self.chunk_size:
+            chunks = [(None, None)]
+        destinations: List[Tuple[Address, Optional[int]]] = [
+            (Address(f"{network}:*"), network) for network in self.networks or networks
+        ]
+        for destination, network in destinations or [(LocalBroadcast(), None)]:
+            requests.extend((destination, network, low, high) for low, high in chunks)
+        return requests
+
+    async def run(self, app, networks: Iterable[int], logger: Logger) -> Dict[int, Found]:
+        """Send the sweep's Who-Is requests through `app`, returning what was found by device instance."""
+        found: Dict[int, Found] = {}
+        pending = self.requests(networks)
+        interval = 1 / self.rate if self.rate > 0 else 0.0
+
+        for attempt in range(self.retries + 1):
+            if not pending:
+                break
+            silent: List[WhoIs] = []
+
+            async def send(index: int, request: WhoIs):
+                await asyncio.sleep(index * interval)
+                destination, network, low, high = request
+                try:
+                    i_ams = await app.who_is(low, high, destination, timeout=self.timeout)
+                except Exception as err:
+                    logger.warning(f"Who-Is to {destination} failed: {err}")
+                    i_ams = []
+                if not i_ams:
+                    silent.append(request)
+                for i_am in i_ams:
+                    found[i_am.iAmDeviceIdentifier[1]] = (i_am, network)
+
+            await asyncio.gather(*[send(index, request) for index, request in enumerate(pending)])
+            if silent and attempt < self.retries:
+                logger.debug(f"Asking again for {len(silent)} Who-Is requests nobody answered")
+            pending = silent
+        return found
@@ -8,11 +8,10 @@ from viam.resource.base import ResourceBase
 from viam.resource.easy_resource import EasyResource
 from viam.resource.types import Model, ModelFamily
 from viam.utils import ValueTypes, struct_to_dict
-from bacpypes3.basetypes import PropertyIdentifier
-from bacpypes3.pdu import Address
-from bacpypes3.primitivedata import ObjectIdentifier
-
-from controller import BacnetController
+from controller import BacnetController, binding_controller, validate_binding
+from health import DeviceUnavailable
+from plan import DevicePlan
+from utils import parse_max_age
 
 
 class BacnetSwitch(Switch, EasyResource):
@@ -53,6 +52,7 @@ class BacnetSwitch(Switch, EasyResource):
         Returns:
             Sequence[str]: A list of implicit dependencies
         """
+        validate_binding(struct_to_dict(config.attributes))
         return [], []
 
     def reconfigure(
@@ -65,6 +65,7 @@ class BacnetSwitch(Switch, EasyResource):
             dependencies (Mapping[ResourceName, ResourceBase]): Any dependencies (both implicit and explicit)
         """
         attrs = struct_to_dict(config.attributes)
+        self._unwatch()
         self.address = str(attrs.get("address", "0:0x00"))
 
         self.networkId, self.deviceID = self.address.split(":")
@@ -75,9 +76,37 @@ class BacnetSwitch(Switch, EasyResource):
         self.propName = str(attrs.get("propName", "N/A"))
         self.propAddress = str(attrs.get("propAddress", None))
         self.propType = str(attrs.get("propType", None))
-        self.bacnet = BacnetController()
+        self.plan = DevicePlan(
+            self.address,
+            [{"address": self.propAddress, "type": self.propType, "name": self.propName}],
+        )
+        self.use_cov = bool(attrs.get("cov", False))
+        self.cache_max_age = parse_max_age(attrs.get("cache_max_age"))
+        self.poll_interval = float(attrs.get("poll_interval", 0))
+        self.bacnet = binding_controller(attrs)
+        self.binding = self.bacnet.binding
+        self.bacnet.start()
+        if self.use_cov:
+            self.bacnet.cov.watch(self.address, [self._object_key()])
+        if self.poll_interval:
+            self.bacnet.pollers.watch(
+                self.address, [self._object_key()], self.poll_interval
+            )
         return
 
+    def _object_key(self) -> Tuple[str, str]:
+        return self.plan.keys[0]
+
+    def _unwatch(self):
+        if not getattr(self, "bacnet", None):
+            return
+        if getattr(self, "use_cov", False):
+            self.bacnet.cov.unwatch(self.address, [self._object_key()])
+        if getattr(self, "poll_interval", None):
+            self.bacnet.pollers.unwatch(
+                self.address, [self._object_key()], self.poll_interval
+            )
+
     async def get_position(
         self,
         *,
@@ -85,7 +114,14 @@ class BacnetSwitch(Switch, EasyResource):
         timeout: Optional[float] = None,
         **kwargs,
     ) -> int:
-        present_value = await self.get_present_value_for_object()
+        fresh = bool((extra or {}).get("fresh", False))
+        present_value = await self.get_present_value_for_object(fresh)
+        if present_value is None:
+            if self.bacnet is not None and not self.bacnet.health.available(self.address):
+                raise DeviceUnavailable(self.address)
+            raise RuntimeError(
+                f"Unable to get the position of {self.propName}: no present value from {self.address}"
+            )
         if self.propType == "binary-value":
             return int(present_value)
         if self.propType == "analog-value":
@@ -120,33 +156,21 @@ class BacnetSwitch(Switch, EasyResource):
             return 2
         return 0
 
-    async def get_present_value_for_object(self):
+    async def get_present_value_for_object(self, fresh: bool = False):
         if self.bacnet is None:
             return None
 
-        try:
-            value = await self.bacnet.client.read(
-                f"{self.address} {self.propType} {self.propAddress} presentValue"
-            )
-            return value
-        except Exception as readErr:
+        value = await self.bacnet.read_value(
+            self.address,
+            self._object_key(),
+            max_age=None if fresh else self.cache_max_age,
+        )
+        if value is None:
             self.logger.error(f"Unable to get present value for {self.propName}")
-            self.logger.error(readErr)
-            return None
+        return value
 
     async def update(self, value: int) -> bool:
-        object_identifier = ObjectIdentifier((self.propType, self.propAddress))
-        property_identifier = PropertyIdentifier("presentValue")
-        device_address = Address(self.address)
-        bacnet_app = self.bacnet.client.this_application.app
-
-        await bacnet_app.write_property(
-            address=device_address,
-            objid=object_identifier,
-            prop=property_identifier,
-            value=value,
-            priority=16,
-        )
+        await self.bacnet.write_property(self.address, self._object_key(), value)
         return True
 
     async def do_command(
@@ -162,5 +186,6 @@ class BacnetSwitch(Switch, EasyResource):
         return result
 
     async def close(self):
+        self._unwatch()
         if self.bacnet:
             del self.bacnet
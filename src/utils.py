@@ -1,5 +1,6 @@
 import socket
 import random
+from typing import Any, Dict
 
 
 def get_available_port(start_range=47809, end_range=65535):
@@ -30,3 +31,27 @@ def get_available_port(start_range=47809, end_range=65535):
             continue
 
     raise RuntimeError("No available ports found in the specified range")
+
+
+def parse_by_type(value: Any) -> Dict[str, float]:
+    """
+    Normalize an attribute given either for every object type or per object type.
+
+    Args:
+        value: Either a number for every object type, or a mapping of object
+            type (e.g. "binary-value") to a number, where "*" applies to any
+            type not listed
+
+    Returns:
+        A mapping of object type to number
+    """
+    if value is None:
+        return {}
+    if isinstance(value, (int, float)):
+        return {"*": float(value)}
+    return {str(obj_type): float(number) for obj_type, number in dict(value).items()}
+
+
+def parse_max_age(value: Any) -> Dict[str, float]:
+    """Normalize a `cache_max_age` attribute into seconds per object type."""
+    return parse_by_type(value)
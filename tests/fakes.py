@@ -0,0 +1,68 @@
+import asyncio
+from itertools import count
+from types import SimpleNamespace
+
+from bacpypes3.vendor import get_vendor_info
+
+from controller import BacnetController
+
+ADDRESS = "1:0x01"
+
+_bindings = count()
+
+
+class FakeApp:
+    """Enough of a bacpypes3 application for the controller, with objects held in a dict."""
+
+    def __init__(self, values=None):
+        self.values = dict(values or {})
+        self.requests = []
+        # While set, requests go unanswered, like a device that is offline
+        self.silent = False
+        # Raised by WritePropertyMultiple requests, e.g. a reject from a device without them
+        self.wpm_error = None
+        self.device_info_cache = self
+
+    async def get_vendor_info(self, device_address=None):
+        return get_vendor_info(0)
+
+    async def get_device_info(self, device_address):
+        return SimpleNamespace(max_apdu_length_accepted=1476, segmentation_supported=None)
+
+    async def read_property(self, address, objid, prop):
+        self.requests.append(("readProperty", objid))
+        if self.silent:
+            await asyncio.Event().wait()
+        return self.values[(objid[0].attr, str(objid[1]))]
+
+    async def write_property(self, address, objid, prop, value, priority=None):
+        self.requests.append(("writeProperty", objid))
+        self.values[(objid[0].attr, str(objid[1]))] = value
+
+    async def request(self, apdu):
+        """WritePropertyMultiple: raises `wpm_error` if set, else writes every value."""
+        self.requests.append(("writePropertyMultiple", len(apdu.listOfWriteAccessSpecs)))
+        if self.wpm_error is not None:
+            raise self.wpm_error
+        for spec in apdu.listOfWriteAccessSpecs:
+            objid = spec.objectIdentifier
+            value = spec.listOfProperties[0].value
+            self.values[(objid[0].attr, str(objid[1]))] = value
+
+
+def make_controller(app: FakeApp) -> BacnetController:
+    """A controller on a binding of its own whose stack is `app`.
+
+    Must be called from the running event loop.
+
+    FakeApp only answers single reads, so the controller reads ADDRESS that way.
+    """
+    controller = BacnetController(f"test-{next(_bindings)}")
+    controller.configure({})
+    controller.client = SimpleNamespace(this_application=SimpleNamespace(app=app))
+    # Resources call start(); with the client in place there is nothing to start
+    started = asyncio.get_running_loop().create_future()
+    started.set_result(None)
+    controller._start_task = started
+    controller._rpm_unsupported.add(ADDRESS)
+    return controller
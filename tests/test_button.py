@@ -0,0 +1,67 @@
+from button import DiscoveryButton, _normalize
+
+SENSOR = "hipsterbrown:lutron-bacnet:lutron-sensor"
+
+
+def sensor(name: str, **attributes) -> dict:
+    return {
+        "name": name,
+        "api": "rdk:component:sensor",
+        "model": SENSOR,
+        "attributes": {"address": "1:0x01", **attributes},
+    }
+
+
+def diff(existing, discovered):
+    button = object.__new__(DiscoveryButton)
+    return button._diff_components(existing, discovered)
+
+
+def test_unchanged_components_keep_their_entries():
+    existing = [sensor("Area-1"), sensor("Area-2")]
+    merged, result = diff(existing, [sensor("Area-1"), sensor("Area-2")])
+    assert merged[0] is existing[0] and merged[1] is existing[1]
+    assert result["unchanged"] == 2
+    assert not (result["added"] or result["removed"] or result["changed"])
+
+
+def test_changed_components_are_replaced_in_place():
+    existing = [sensor("Area-1"), sensor("Area-2")]
+    replacement = sensor("Area-1", vendor="Lutron")
+    merged, result = diff(existing, [replacement, sensor("Area-2")])
+    assert merged == [replacement, existing[1]]
+    assert result["changed"] == ["Area-1"]
+
+
+def test_added_and_removed_components():
+    merged, result = diff(
+        [sensor("Area-1"), sensor("Area-2")], [sensor("Area-2"), sensor("Area-3")]
+    )
+    assert [component["name"] for component in merged] == ["Area-2", "Area-3"]
+    assert result["added"] == ["Area-3"]
+    assert result["removed"] == ["Area-1"]
+
+
+def test_other_models_are_kept():
+    camera = {"name": "cam", "api": "rdk:component:camera", "model": "viam:camera:webcam"}
+    merged, result = diff([camera, sensor("Area-1")], [])
+    assert merged == [camera]
+    assert result["removed"] == ["Area-1"]
+
+
+def test_ints_and_floats_compare_equal():
+    existing = [sensor("Area-1", poll_interval=5.0, objects=[{"address": 2.0}])]
+    merged, result = diff(existing, [sensor("Area-1", poll_interval=5, objects=[{"address": 2}])])
+    assert merged[0] is existing[0]
+    assert result["unchanged"] == 1
+    assert _normalize({"a": [1.0, 1.5, True, None]}) == {"a": [1, 1.5, True, None]}
+
+
+def test_duplicate_names_are_dropped_but_not_removed():
+    first = sensor("Area-1")
+    existing = [first, sensor("Area-1", vendor="old"), sensor("Gone"), sensor("Gone")]
+    merged, result = diff(existing, [sensor("Area-1")])
+    assert merged == [first]
+    assert result["duplicates"] == ["Area-1", "Gone"]
+    assert result["removed"] == ["Gone"]
+    assert result["unchanged"] == 1
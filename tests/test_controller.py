@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+from bacpypes3.apdu import RejectPDU, WritePropertyMultipleError
+from bacpypes3.basetypes import BinaryPV, ErrorType, ObjectPropertyReference, PropertyIdentifier
+from bacpypes3.primitivedata import ObjectIdentifier, Real, Unsigned
+from bacpypes3.vendor import get_vendor_info
+
+from controller import coerce_value
+from fakes import ADDRESS, FakeApp, make_controller
+
+LEVEL = ("analog-value", "1")
+SWITCH = ("binary-value", "2")
+
+
+def test_write_drops_cov_value():
+    async def scenario():
+        app = FakeApp({("analogValue", "1"): 22.0})
+        controller = make_controller(app)
+        controller.cov.values[(ADDRESS, LEVEL)] = 22.0
+        assert await controller.read_value(ADDRESS, LEVEL) == 22.0
+
+        await controller.write_property(ADDRESS, LEVEL, 77)
+        assert controller.cov.get(ADDRESS, LEVEL) is None
+        assert await controller.read_value(ADDRESS, LEVEL) == 77.0
+
+    asyncio.run(scenario())
+
+
+def test_coerce_value():
+    vendor_info = get_vendor_info(0)
+    prop = PropertyIdentifier("presentValue")
+    binary = coerce_value(vendor_info, ObjectIdentifier("binary-value,1"), prop, 1.0)
+    assert binary == BinaryPV("active")
+    analog = coerce_value(vendor_info, ObjectIdentifier("analog-value,1"), prop, 21)
+    assert isinstance(analog, Real) and analog == 21.0
+    multistate = coerce_value(vendor_info, ObjectIdentifier("multi-state-value,1"), prop, 2.0)
+    assert isinstance(multistate, Unsigned) and multistate == 2
+    with pytest.raises(ValueError, match="invalid value 'abc' for Real"):
+        coerce_value(vendor_info, ObjectIdentifier("analog-value,1"), prop, "abc")
+    with pytest.raises(ValueError, match="invalid value 1.5 for BinaryPV"):
+        coerce_value(vendor_info, ObjectIdentifier("binary-value,1"), prop, 1.5)
+
+
+@pytest.mark.parametrize("priority", [0, 17, "high", None])
+def test_write_many_rejects_invalid_priority(priority):
+    async def scenario():
+        app = FakeApp()
+        controller = make_controller(app)
+        results = await controller.write_many([
+            (ADDRESS, LEVEL, 1.0, priority),
+            (ADDRESS, LEVEL, None, 16),
+        ])
+        assert results == [
+            {"success": False, "error": f"invalid priority {priority!r}"},
+            {"success": False, "error": "no value"},
+        ]
+        assert app.requests == []
+
+    asyncio.run(scenario())
+
+
+def test_write_many_falls_back_to_single_writes_when_wpm_rejected():
+    async def scenario():
+        app = FakeApp()
+        app.wpm_error = RejectPDU(reason="unrecognizedService")
+        controller = make_controller(app)
+        writes = [(ADDRESS, LEVEL, 5.0, 16), (ADDRESS, SWITCH, 1.0, 8)]
+        results = await controller.write_many(writes)
+        assert results == [{"success": True}, {"success": True}]
+        assert ADDRESS in controller._wpm_unsupported
+        assert app.values == {("analogValue", "1"): 5.0, ("binaryValue", "2"): BinaryPV("active")}
+
+        # Once rejected, later writes go singly without trying WritePropertyMultiple again
+        del app.requests[:]
+        assert await controller.write_many(writes) == [{"success": True}, {"success": True}]
+        assert [request for request, _detail in app.requests] == ["writeProperty"] * 2
+
+    asyncio.run(scenario())
+
+
+def test_write_many_retries_writes_after_wpm_failure():
+    async def scenario():
+        app = FakeApp()
+        app.wpm_error = WritePropertyMultipleError(
+            errorType=ErrorType(errorClass="property", errorCode="writeAccessDenied"),
+            firstFailedWriteAttempt=ObjectPropertyReference(
+                objectIdentifier=ObjectIdentifier("binary-value,2"),
+                propertyIdentifier="presentValue",
+            ),
+        )
+        controller = make_controller(app)
+        results = await controller.write_many([
+            (ADDRESS, LEVEL, 5.0, 16),
+            (ADDRESS, SWITCH, 1.0, 16),
+            (ADDRESS, ("analog-value", "3"), 7.0, 16),
+        ])
+        assert results == [
+            {"success": True},
+            {"success": False, "error": "write-access-denied"},
+            {"success": True},
+        ]
+        # Only the write after the failed one is sent again
+        assert app.requests == [
+            ("writePropertyMultiple", 3),
+            ("writeProperty", ObjectIdentifier("analog-value,3")),
+        ]
+        assert ADDRESS not in controller._wpm_unsupported
+
+    asyncio.run(scenario())
@@ -0,0 +1,68 @@
+import asyncio
+
+from viam.proto.app.robot import ComponentConfig
+from viam.utils import dict_to_struct
+
+from discovery import DiscoverDevices
+from fakes import FakeApp, make_controller
+from scheduler import DEFAULT_MAX_OUTSTANDING, DEFAULT_MAX_PER_DEVICE, DEFAULT_MAX_PER_NETWORK
+
+
+def config(binding: str, tmp_path, **attributes) -> ComponentConfig:
+    return ComponentConfig(
+        name="discovery",
+        attributes=dict_to_struct({
+            "binding": binding,
+            "discovery_cache_file": str(tmp_path / "cache.json"),
+            **attributes,
+        }),
+    )
+
+
+def test_removed_transaction_limits_go_back_to_defaults(tmp_path):
+    async def scenario():
+        controller = make_controller(FakeApp())
+        service = DiscoverDevices.new(
+            config(
+                controller.binding,
+                tmp_path,
+                max_outstanding_transactions=4,
+                max_transactions_per_device=1,
+                max_transactions_per_network=2,
+            ),
+            {},
+        )
+        scheduler = controller.scheduler
+        assert (scheduler.max_outstanding, scheduler.max_per_device, scheduler.max_per_network) == (
+            4,
+            1,
+            2,
+        )
+
+        service.reconfigure(config(controller.binding, tmp_path), {})
+        assert (scheduler.max_outstanding, scheduler.max_per_device, scheduler.max_per_network) == (
+            DEFAULT_MAX_OUTSTANDING,
+            DEFAULT_MAX_PER_DEVICE,
+            DEFAULT_MAX_PER_NETWORK,
+        )
+        await service.close()
+
+    asyncio.run(scenario())
+
+
+def test_removed_trace_file_stops_recording(tmp_path):
+    async def scenario():
+        controller = make_controller(FakeApp())
+        trace_file = str(tmp_path / "trace.json.gz")
+        service = DiscoverDevices.new(
+            config(controller.binding, tmp_path, trace_file=trace_file), {}
+        )
+        recorder = controller.recorder
+        assert recorder is not None and recorder.path == trace_file
+
+        service.reconfigure(config(controller.binding, tmp_path), {})
+        assert controller.recorder is None
+        assert not recorder.recording
+        await service.close()
+
+    asyncio.run(scenario())
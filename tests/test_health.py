@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+
+import health
+from fakes import ADDRESS, FakeApp, make_controller
+from health import (
+    CLOSED,
+    HALF_OPEN,
+    MAX_REQUEST_TIMEOUT,
+    MIN_REQUEST_TIMEOUT,
+    OPEN,
+    PROBE_BACKOFF_MIN,
+    CircuitBreakers,
+    DeviceUnavailable,
+)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A monotonic clock the test moves forward by hand."""
+    now = [1000.0]
+    monkeypatch.setattr(health, "monotonic", lambda: now[0])
+    return now
+
+
+def trip(breakers: CircuitBreakers) -> None:
+    for _attempt in range(breakers.failure_threshold):
+        breakers.failed(ADDRESS)
+
+
+def test_opens_after_consecutive_timeouts(clock):
+    breakers = CircuitBreakers(failure_threshold=3)
+    breakers.failed(ADDRESS)
+    breakers.failed(ADDRESS)
+    assert breakers.allow(ADDRESS)
+    breakers.failed(ADDRESS)
+    assert breakers.devices[ADDRESS].state == OPEN
+    assert not breakers.allow(ADDRESS)
+    assert not breakers.available(ADDRESS)
+
+
+def test_an_answer_resets_the_failure_count(clock):
+    breakers = CircuitBreakers(failure_threshold=3)
+    breakers.failed(ADDRESS)
+    breakers.failed(ADDRESS)
+    breakers.succeeded(ADDRESS, 0.1)
+    breakers.failed(ADDRESS)
+    breakers.failed(ADDRESS)
+    assert breakers.devices[ADDRESS].state == CLOSED
+
+
+def test_single_probe_once_backoff_passes(clock):
+    breakers = CircuitBreakers()
+    trip(breakers)
+    clock[0] += PROBE_BACKOFF_MIN
+    assert breakers.available(ADDRESS)
+    assert breakers.allow(ADDRESS)
+    assert breakers.probing(ADDRESS)
+    assert breakers.devices[ADDRESS].state == HALF_OPEN
+    assert not breakers.allow(ADDRESS)
+    assert not breakers.available(ADDRESS)
+
+    breakers.succeeded(ADDRESS, 0.1)
+    assert breakers.devices[ADDRESS].state == CLOSED
+    assert breakers.allow(ADDRESS)
+
+
+def test_failed_probe_doubles_the_backoff(clock):
+    breakers = CircuitBreakers()
+    trip(breakers)
+    clock[0] += PROBE_BACKOFF_MIN
+    assert breakers.allow(ADDRESS)
+    breakers.failed(ADDRESS)
+    assert breakers.devices[ADDRESS].state == OPEN
+    clock[0] += PROBE_BACKOFF_MIN
+    assert not breakers.allow(ADDRESS)
+    clock[0] += PROBE_BACKOFF_MIN
+    assert breakers.allow(ADDRESS)
+
+
+def test_abandoned_probe_lets_another_request_probe(clock):
+    breakers = CircuitBreakers()
+    trip(breakers)
+    clock[0] += PROBE_BACKOFF_MIN
+    assert breakers.allow(ADDRESS)
+    breakers.abandoned(ADDRESS)
+    assert breakers.allow(ADDRESS)
+
+
+def test_timeout_follows_round_trip_times_within_limits():
+    breakers = CircuitBreakers()
+    assert breakers.timeout(ADDRESS) == MAX_REQUEST_TIMEOUT
+    breakers.succeeded(ADDRESS, 0.01)
+    assert breakers.timeout(ADDRESS) == MIN_REQUEST_TIMEOUT
+    for _reply in range(20):
+        breakers.succeeded("slow", 30.0)
+    assert breakers.timeout("slow") == MAX_REQUEST_TIMEOUT
+    breakers.succeeded("middling", 1.0)
+    assert breakers.timeout("middling") == pytest.approx(1.0 + 4 * 0.5)
+
+
+def test_controller_fails_fast_once_the_circuit_opens():
+    async def scenario():
+        app = FakeApp({("analogValue", "1"): 1.0})
+        app.silent = True
+        controller = make_controller(app)
+        controller.health.timeout = lambda address: 0.01
+        for _attempt in range(controller.health.failure_threshold):
+            with pytest.raises(asyncio.TimeoutError):
+                await controller.read_property(ADDRESS, "analog-value", "1")
+        sent = len(app.requests)
+        with pytest.raises(DeviceUnavailable):
+            await controller.read_property(ADDRESS, "analog-value", "1")
+        assert len(app.requests) == sent
+
+    asyncio.run(scenario())
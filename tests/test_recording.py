@@ -0,0 +1,160 @@
+from recording import (
+    BROADCAST_PEER,
+    RECEIVED,
+    SENT,
+    TraceRecorder,
+    apdu_type,
+    invoke_id_offset,
+    is_broadcast,
+    is_response,
+    npdu_stations,
+    read_trace,
+    request_key,
+    with_invoke_id,
+)
+from replay import pair_exchanges
+
+DEVICE = "10.0.0.5"
+ROUTER = "10.0.0.1"
+# DNET 5, one byte MAC 0x07: the station behind ROUTER
+STATION = bytes([0x00, 0x05, 0x01, 0x07])
+
+
+def bvll(function: int, npdu: bytes) -> bytes:
+    return bytes([0x81, function]) + (len(npdu) + 4).to_bytes(2, "big") + npdu
+
+
+def read_request(invoke_id: int, instance: int = 1) -> bytes:
+    """A ReadProperty of an analog value's present value, to the local network."""
+    return bvll(0x0A, bytes([
+        0x01, 0x04, 0x00, 0x05, invoke_id, 0x0C, 0x0C, 0x00, 0x80, 0x00, instance, 0x19, 0x55
+    ]))
+
+
+def read_ack(invoke_id: int) -> bytes:
+    return bvll(0x0A, bytes([
+        0x01, 0x00, 0x30, invoke_id, 0x0C, 0x0C, 0x00, 0x80, 0x00, 0x01, 0x19, 0x55
+    ]))
+
+
+def routed_request(invoke_id: int) -> bytes:
+    """A ReadProperty to STATION, with its hop count."""
+    return bvll(0x0A, bytes([0x01, 0x24]) + STATION + bytes([0xFF, 0x00, 0x05, invoke_id, 0x0C]))
+
+
+def routed_ack(invoke_id: int, source: bytes = STATION) -> bytes:
+    return bvll(0x0A, bytes([0x01, 0x08]) + source + bytes([0x30, invoke_id, 0x0C]))
+
+
+WHO_IS = bvll(0x0B, bytes([0x01, 0x20, 0xFF, 0xFF, 0x00, 0xFF, 0x10, 0x08]))
+I_AM = bvll(0x0A, bytes([0x01, 0x00, 0x10, 0x00, 0xC4, 0x02, 0x00, 0x00, 0x05]))
+# A network layer Who-Is-Router-To-Network, which has no APDU
+WHO_IS_ROUTER = bvll(0x0B, bytes([0x01, 0x80, 0x00]))
+
+
+def test_local_request_and_response():
+    request = read_request(7)
+    assert apdu_type(request) == 0
+    assert request[invoke_id_offset(request)] == 7
+    assert npdu_stations(request) == (b"", b"")
+    assert not is_response(request)
+    assert not is_broadcast(request)
+
+    ack = read_ack(7)
+    assert apdu_type(ack) == 3
+    assert ack[invoke_id_offset(ack)] == 7
+    assert is_response(ack)
+
+
+def test_routed_packets_skip_npdu_addresses():
+    request = routed_request(9)
+    assert npdu_stations(request) == (STATION, b"")
+    assert request[invoke_id_offset(request)] == 9
+
+    ack = routed_ack(9)
+    assert npdu_stations(ack) == (b"", STATION)
+    assert ack[invoke_id_offset(ack)] == 9
+
+
+def test_packets_without_invoke_ids():
+    assert apdu_type(WHO_IS) == 1
+    assert invoke_id_offset(WHO_IS) is None
+    assert is_broadcast(WHO_IS)
+    assert apdu_type(WHO_IS_ROUTER) is None
+    assert invoke_id_offset(WHO_IS_ROUTER) is None
+    # BVLL results and truncated packets carry no NPDU
+    assert apdu_type(bytes([0x81, 0x00, 0x00, 0x06, 0x00, 0x00])) is None
+    assert apdu_type(b"\x81") is None
+    assert with_invoke_id(WHO_IS, 3) == WHO_IS
+
+
+def test_request_key_ignores_invoke_id():
+    assert request_key(read_request(1)) == request_key(read_request(200))
+    assert request_key(read_request(1)) != request_key(read_request(1, instance=2))
+    assert with_invoke_id(read_request(1), 200) == read_request(200)
+
+
+def test_trace_round_trip(tmp_path):
+    path = str(tmp_path / "trace.json.gz")
+    recorder = TraceRecorder(path, "test")
+    recorder.packet(SENT, "10.0.0.255", WHO_IS)
+    recorder.packet(RECEIVED, DEVICE, I_AM)
+    recorder.close()
+    recorder.packet(RECEIVED, DEVICE, I_AM)
+    assert recorder.status()["packets"] == 2
+    assert not recorder.recording
+
+    header, packets = read_trace(path)
+    assert header["binding"] == "test"
+    assert [(direction, peer, data) for _at, direction, peer, data in packets] == [
+        (SENT, BROADCAST_PEER, WHO_IS),
+        (RECEIVED, DEVICE, I_AM),
+    ]
+
+
+def timeline(exchanges, peer, request):
+    """The responses paired with each time `request` was sent, as (delay, peer, data)."""
+    return [
+        [(round(delay, 6), source, data) for delay, source, data in responses]
+        for responses in exchanges[(peer, request_key(request))]
+    ]
+
+
+def test_pair_exchanges_by_invoke_id():
+    exchanges = pair_exchanges([
+        (0.0, SENT, DEVICE, read_request(1)),
+        (0.1, SENT, DEVICE, read_request(2, instance=2)),
+        (0.3, RECEIVED, DEVICE, read_ack(2)),
+        (0.5, RECEIVED, DEVICE, read_ack(1)),
+        (1.0, SENT, DEVICE, read_request(3)),
+    ])
+    assert timeline(exchanges, DEVICE, read_request(1)) == [[(0.5, DEVICE, read_ack(1))], []]
+    assert timeline(exchanges, DEVICE, read_request(2, instance=2)) == [
+        [(0.2, DEVICE, read_ack(2))]
+    ]
+
+
+def test_pair_exchanges_by_station_behind_router():
+    # The same invoke ID to two stations behind one router: each answer goes to its own request
+    other = bytes([0x00, 0x05, 0x01, 0x08])
+    other_request = bvll(0x0A, bytes([0x01, 0x24]) + other + bytes([0xFF, 0x00, 0x05, 4, 0x0D]))
+    exchanges = pair_exchanges([
+        (0.0, SENT, ROUTER, routed_request(4)),
+        (0.0, SENT, ROUTER, other_request),
+        (0.2, RECEIVED, ROUTER, routed_ack(4, other)),
+        (0.4, RECEIVED, ROUTER, routed_ack(4)),
+    ])
+    assert timeline(exchanges, ROUTER, routed_request(4)) == [[(0.4, ROUTER, routed_ack(4))]]
+    assert timeline(exchanges, ROUTER, other_request) == [[(0.2, ROUTER, routed_ack(4, other))]]
+
+
+def test_pair_exchanges_attaches_unsolicited_packets_to_last_broadcast():
+    exchanges = pair_exchanges([
+        (0.0, RECEIVED, DEVICE, I_AM),
+        (1.0, SENT, BROADCAST_PEER, WHO_IS),
+        (1.1, SENT, DEVICE, read_request(1)),
+        (1.2, RECEIVED, DEVICE, I_AM),
+        (1.3, RECEIVED, DEVICE, read_ack(1)),
+    ])
+    assert timeline(exchanges, BROADCAST_PEER, WHO_IS) == [[(0.2, DEVICE, I_AM)]]
+    assert timeline(exchanges, DEVICE, read_request(1)) == [[(0.2, DEVICE, read_ack(1))]]
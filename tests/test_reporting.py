@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+from viam.errors import NoCaptureToStoreError
+from viam.proto.app.robot import ComponentConfig
+from viam.utils import dict_to_struct
+
+from fakes import ADDRESS, FakeApp, make_controller
+from reporting import ChangeReporter
+from sensor import BacnetSensor
+
+LEVEL = ("analog-value", "1")
+DAYLIGHT = ("analog-value", "2")
+OUTPUT = ("analog-output", "1")
+STATE = ("binary-value", "1")
+CAPTURE = {"fromDataManagement": True}
+
+
+def test_first_report_and_heartbeat_send_everything():
+    reporter = ChangeReporter(heartbeat=60)
+    values = {LEVEL: 10.0, STATE: 1}
+    assert reporter.report(values, now=0) == {LEVEL, STATE}
+    assert reporter.report(values, now=30) == set()
+    assert reporter.report(values, now=60) == {LEVEL, STATE}
+
+
+def test_no_heartbeat_when_disabled():
+    reporter = ChangeReporter(heartbeat=0)
+    reporter.report({LEVEL: 10.0}, now=0)
+    assert reporter.report({LEVEL: 10.0}, now=10_000) == set()
+
+
+def test_deadband_per_object_adds_up_drift():
+    reporter = ChangeReporter({LEVEL: 5.0})
+    reporter.report({LEVEL: 10.0, DAYLIGHT: 10.0}, now=0)
+    assert reporter.report({LEVEL: 13.0, DAYLIGHT: 10.5}, now=1) == {DAYLIGHT}
+    # Measured from the last reported value, so slow drift is reported once it adds up
+    assert reporter.report({LEVEL: 15.0, DAYLIGHT: 10.5}, now=2) == {LEVEL}
+
+
+def test_report_without_remembering_leaves_state_alone():
+    reporter = ChangeReporter({LEVEL: 5.0}, heartbeat=60)
+    assert reporter.report({LEVEL: 10.0}, now=0, remember=False) == {LEVEL}
+    assert reporter.report({LEVEL: 10.0}, now=1) == {LEVEL}
+    assert reporter.report({LEVEL: 20.0}, now=2, remember=False) == {LEVEL}
+    assert reporter.report({LEVEL: 20.0}, now=3) == {LEVEL}
+    assert reporter.report({LEVEL: 20.0}, now=61, remember=False) == {LEVEL}
+    assert reporter.report({LEVEL: 20.0}, now=62) == {LEVEL}
+
+
+def make_sensor(app: FakeApp, **attributes) -> BacnetSensor:
+    controller = make_controller(app)
+    objects = [
+        {"type": key[0], "address": key[1], "name": f"{key[0]} {key[1]}"}
+        for key in (LEVEL, DAYLIGHT, OUTPUT, STATE)
+    ]
+    config = ComponentConfig(
+        name="sensor",
+        attributes=dict_to_struct({
+            "address": ADDRESS,
+            "binding": controller.binding,
+            "objects": objects,
+            "report_changes": True,
+            **attributes,
+        }),
+    )
+    return BacnetSensor.new(config, {})
+
+
+def device(level=10.0, daylight=10.0, output=10.0, state=0):
+    return {
+        ("analogValue", "1"): level,
+        ("analogValue", "2"): daylight,
+        ("analogOutput", "1"): output,
+        ("binaryValue", "1"): state,
+    }
+
+
+def test_sensor_deadbands_by_type():
+    async def scenario():
+        app = FakeApp(device())
+        sensor = make_sensor(app, deadband={"analog-value": 5, "analog-output": 1})
+        assert sensor.reporter.deadbands == {LEVEL: 5.0, DAYLIGHT: 5.0, OUTPUT: 1.0}
+        assert len(await sensor.get_readings(extra=CAPTURE)) == 4
+
+        app.values = device(level=12.0, output=12.0, state=1)
+        assert set(await sensor.get_readings(extra=CAPTURE)) == {
+            "analog-output 1",
+            "binary-value 1",
+        }
+        await sensor.close()
+
+    asyncio.run(scenario())
+
+
+def test_interactive_changes_only_leaves_capture_state_alone():
+    async def scenario():
+        app = FakeApp(device())
+        sensor = make_sensor(app, deadband=5)
+        await sensor.get_readings(extra=CAPTURE)
+
+        app.values = device(level=50.0)
+        interactive = {"changes_only": True}
+        assert list(await sensor.get_readings(extra=interactive)) == ["analog-value 1"]
+        assert list(await sensor.get_readings(extra=interactive)) == ["analog-value 1"]
+        # Capture still sees the change the interactive calls saw
+        assert list(await sensor.get_readings(extra=CAPTURE)) == ["analog-value 1"]
+        with pytest.raises(NoCaptureToStoreError):
+            await sensor.get_readings(extra=CAPTURE)
+        assert len(await sensor.get_readings()) == 4
+        await sensor.close()
+
+    asyncio.run(scenario())
+
+
+def test_heartbeat_recaptures_unchanged_values():
+    async def scenario():
+        sensor = make_sensor(FakeApp(device()), heartbeat_interval=0.05)
+        assert len(await sensor.get_readings(extra=CAPTURE)) == 4
+        with pytest.raises(NoCaptureToStoreError):
+            await sensor.get_readings(extra=CAPTURE)
+        await asyncio.sleep(0.06)
+        assert len(await sensor.get_readings(extra=CAPTURE)) == 4
+        await sensor.close()
+
+    asyncio.run(scenario())
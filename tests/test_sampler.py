@@ -0,0 +1,60 @@
+import math
+
+from sampler import SampleRing, downsample
+
+
+def test_ring_keeps_the_newest_samples_in_order():
+    ring = SampleRing(4)
+    for second in range(6):
+        ring.append(float(second), second * 10)
+    assert len(ring) == 4
+    times, values = ring.window(0, 100)
+    assert list(times) == [2.0, 3.0, 4.0, 5.0]
+    assert list(values) == [20.0, 30.0, 40.0, 50.0]
+
+
+def test_window_includes_both_edges():
+    ring = SampleRing(10)
+    for second in range(10):
+        ring.append(float(second), second)
+    times, _values = ring.window(3.0, 6.0)
+    assert list(times) == [3.0, 4.0, 5.0, 6.0]
+    times, _values = ring.window(3.5, 3.9)
+    assert list(times) == []
+
+
+def test_window_across_the_wraparound():
+    ring = SampleRing(5)
+    for second in range(8):
+        ring.append(float(second), second)
+    times, values = ring.window(4.0, 6.0)
+    assert list(times) == [4.0, 5.0, 6.0]
+    assert list(values) == [4.0, 5.0, 6.0]
+
+
+def test_values_that_are_not_numbers_are_gaps():
+    ring = SampleRing(3)
+    ring.append(1.0, "active")
+    ring.append(2.0, None)
+    ring.append(3.0, 1)
+    _times, values = ring.window(0, 10)
+    assert math.isnan(values[0]) and math.isnan(values[1])
+    assert values[2] == 1.0
+
+
+def test_downsample_mean_skips_gaps():
+    times = [0.0, 1.0, 2.0, 10.0, 11.0]
+    values = [1.0, math.nan, 3.0, 5.0, 7.0]
+    assert downsample(times, values, 10) == ([2.0, 11.0], [2.0, 6.0])
+
+
+def test_downsample_last():
+    times = [0.0, 1.0, 2.0, 10.0, 11.0]
+    values = [1.0, 2.0, 3.0, 5.0, 7.0]
+    assert downsample(times, values, 10, mean=False) == ([2.0, 11.0], [3.0, 7.0])
+
+
+def test_downsample_bucket_of_only_gaps():
+    bucket_times, bucket_values = downsample([0.0, 1.0], [math.nan, math.nan], 10)
+    assert bucket_times == [1.0]
+    assert math.isnan(bucket_values[0])
@@ -0,0 +1,78 @@
+import asyncio
+from contextlib import AsyncExitStack
+
+from scheduler import TrafficClass, TransactionScheduler
+
+
+async def hold(
+    scheduler: TransactionScheduler,
+    stack: AsyncExitStack,
+    address: str,
+    traffic_class: TrafficClass,
+) -> bool:
+    """Try to take a slot, returning whether it was granted without waiting."""
+    try:
+        await asyncio.wait_for(
+            stack.enter_async_context(scheduler.slot(address, traffic_class)), 0.01
+        )
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+
+def test_discovery_leaves_network_room_for_writes():
+    async def scenario():
+        scheduler = TransactionScheduler()
+        async with AsyncExitStack() as stack:
+            granted = [
+                await hold(scheduler, stack, f"10.0.0.{host}", TrafficClass.DISCOVERY)
+                for host in range(1, 17)
+            ]
+            assert sum(granted) < scheduler.max_per_network
+            assert await hold(scheduler, stack, "10.0.0.100", TrafficClass.WRITE)
+
+    asyncio.run(scenario())
+
+
+def test_background_classes_share_of_network_cap():
+    async def scenario():
+        scheduler = TransactionScheduler(max_per_network=8)
+        async with AsyncExitStack() as stack:
+            polls = [
+                await hold(scheduler, stack, f"1:{mac}", TrafficClass.POLL)
+                for mac in range(1, 9)
+            ]
+            discoveries = [
+                await hold(scheduler, stack, f"2:{mac}", TrafficClass.DISCOVERY)
+                for mac in range(1, 9)
+            ]
+            assert sum(polls) == 6
+            assert sum(discoveries) == 4
+
+    asyncio.run(scenario())
+
+
+def test_write_goes_past_full_network():
+    async def scenario():
+        scheduler = TransactionScheduler()
+        async with AsyncExitStack() as stack:
+            reads = [
+                await hold(scheduler, stack, f"1:{mac}", TrafficClass.INTERACTIVE)
+                for mac in range(1, 9)
+            ]
+            assert all(reads)
+            assert not await hold(scheduler, stack, "1:9", TrafficClass.INTERACTIVE)
+            assert await hold(scheduler, stack, "1:10", TrafficClass.WRITE)
+
+    asyncio.run(scenario())
+
+
+def test_small_network_cap_still_admits_background_traffic():
+    async def scenario():
+        scheduler = TransactionScheduler(max_per_network=1)
+        async with AsyncExitStack() as stack:
+            assert await hold(scheduler, stack, "1:1", TrafficClass.DISCOVERY)
+            assert not await hold(scheduler, stack, "1:2", TrafficClass.DISCOVERY)
+            assert await hold(scheduler, stack, "1:3", TrafficClass.WRITE)
+
+    asyncio.run(scenario())
@@ -0,0 +1,82 @@
+import asyncio
+import logging
+from types import SimpleNamespace
+
+import pytest
+from bacpypes3.pdu import Address, LocalBroadcast
+
+from sweep import MAX_DEVICE_INSTANCE, WhoIsSweep, chunk_ranges, parse_ranges
+
+
+def test_parse_ranges_forms():
+    assert parse_ranges(None) == []
+    assert parse_ranges([[1, 10], "20-30", "40", 50.0]) == [(1, 10), (20, 30), (40, 40), (50, 50)]
+
+
+def test_parse_ranges_merges_overlapping_and_adjacent():
+    assert parse_ranges([[20, 30], [1, 10], [5, 15], [16, 18], [25, 26]]) == [(1, 18), (20, 30)]
+
+
+@pytest.mark.parametrize("entry", [[10, 1], "10-1"])
+def test_parse_ranges_rejects_reversed(entry):
+    with pytest.raises(ValueError, match="reversed"):
+        parse_ranges([entry])
+
+
+@pytest.mark.parametrize("entry", [[-1, 10], [0, MAX_DEVICE_INSTANCE + 1]])
+def test_parse_ranges_rejects_out_of_range(entry):
+    with pytest.raises(ValueError, match="outside"):
+        parse_ranges([entry])
+
+
+def test_chunk_ranges():
+    assert chunk_ranges([(0, 9), (20, 24)], 4) == [(0, 3), (4, 7), (8, 9), (20, 23), (24, 24)]
+    assert chunk_ranges([(0, 9)], None) == [(0, 9)]
+
+
+def test_from_attributes_rejects_negative_chunks():
+    with pytest.raises(ValueError):
+        WhoIsSweep.from_attributes({"whois_chunk_size": -5})
+
+
+def test_requests_targets_first_then_chunks_per_network():
+    sweep = WhoIsSweep(ranges=[(0, 9)], networks=[1, 2], targets=["3:0x05"], chunk_size=5)
+    requests = sweep.requests([])
+    assert requests[0] == (Address("3:0x05"), 3, None, None)
+    assert requests[1:] == [
+        (Address("1:*"), 1, 0, 4),
+        (Address("1:*"), 1, 5, 9),
+        (Address("2:*"), 2, 0, 4),
+        (Address("2:*"), 2, 5, 9),
+    ]
+
+
+def test_requests_default_to_one_local_broadcast():
+    [(destination, network, low, high)] = WhoIsSweep().requests([])
+    assert isinstance(destination, LocalBroadcast)
+    assert (network, low, high) == (None, None, None)
+
+
+def test_only_targets_sends_no_broadcast():
+    sweep = WhoIsSweep(targets=["10.0.0.5"])
+    assert [request[0] for request in sweep.requests([1])] == [Address("10.0.0.5")]
+
+
+def test_run_asks_again_for_silent_chunks():
+    asked = []
+
+    class App:
+        async def who_is(self, low, high, destination, timeout=None):
+            asked.append((low, high))
+            if low == 0 or len(asked) > 2:
+                return [SimpleNamespace(iAmDeviceIdentifier=("device", low + 1))]
+            return []
+
+    async def scenario():
+        sweep = WhoIsSweep(ranges=[(0, 9)], networks=[1], chunk_size=5, rate=0, retries=1)
+        return await sweep.run(App(), [], logging.getLogger("test"))
+
+    found = asyncio.run(scenario())
+    assert asked == [(0, 4), (5, 9), (5, 9)]
+    assert sorted(found) == [1, 6]
+    assert found[6][1] == 1